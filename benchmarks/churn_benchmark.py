@@ -0,0 +1,102 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import random
+import time
+
+from prometheus.collectors import Counter, Summary
+from prometheus.formats import TextFormat, ProtobufFormat, marshall_parallel
+from prometheus.registry import Registry
+
+FORMATS = {
+    'text': TextFormat,
+    'protobuf': ProtobufFormat,
+}
+
+CHURNS = (0.01, 0.1, 1)
+
+
+def create_registry(series, summaries):
+    """ Creates a registry with the series split in 10 collectors, returns
+        the registry and the bound children of all the series
+    """
+
+    registry = Registry()
+    const_labels = {'app': "benchmark", 'env': "production"}
+    children = []
+
+    for i in range(10):
+        cls = Summary if summaries else Counter
+        c = cls("benchmark_{0}".format(i), "Churn benchmark.", const_labels)
+        for j in range(series // 10):
+            labels = {'handler': "/handler/{0}".format(j),
+                      'method': "GET", 'status': str(200 + j % 5)}
+            child = c.labels(labels)
+            child.add(j)
+            children.append(child)
+        registry.register(c)
+
+    return registry, children
+
+
+def marshall(registry, fmt, children, churn, snapshot=False, executor=None,
+             partitions=None):
+    """ Updates the churn (ratio) of the series and marshalls the registry
+        (or a snapshot of it, in partitions in the processes of the executor
+        if any), returns the time of the marshall
+    """
+
+    for child in random.sample(children, int(len(children) * churn)):
+        child.add(1)
+
+    start = time.perf_counter()
+    if executor is not None:
+        marshall_parallel(fmt, registry, executor, partitions)
+    else:
+        fmt.marshall(registry.snapshot() if snapshot else registry)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the marshalling of a registry when only a "
+                    "part of the series change between marshalls")
+    parser.add_argument('-s', '--series', type=int, default=50000)
+    parser.add_argument('-n', '--number', type=int, default=5,
+                        help="marshalls per churn")
+    parser.add_argument('-f', '--format', default='text',
+                        choices=sorted(FORMATS.keys()))
+    parser.add_argument('--summaries', action='store_true',
+                        help="summaries instead of counters")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="marshall a snapshot of the registry")
+    parser.add_argument('-p', '--processes', type=int, default=0,
+                        help="marshall in a pool of processes")
+    args = parser.parse_args()
+
+    random.seed(42)
+    registry, children = create_registry(args.series, args.summaries)
+    fmt = FORMATS[args.format]()
+    executor = None
+    if args.processes:
+        executor = ProcessPoolExecutor(args.processes)
+
+    # The first marshall renders all the series
+    first = marshall(registry, fmt, children, 0, args.snapshot, executor,
+                     args.processes)
+    print("{0} series ({1}): first marshall {2:.3f}s".format(
+        args.series, args.format, first))
+
+    for churn in CHURNS:
+        result = min(marshall(registry, fmt, children, churn, args.snapshot,
+                              executor, args.processes)
+                     for i in range(args.number))
+        print("{0:>4.0%} churn: {1:.3f}s".format(churn, result))
+
+    if executor is not None:
+        executor.shutdown()
@@ -0,0 +1,76 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+import threading
+import time
+
+from prometheus.collectors import (Counter, Gauge, Summary, ShardedCounter,
+                                   ShardedGauge)
+
+COLLECTOR_TYPES = {
+    'counter': (Counter, lambda c, labels: c.inc(labels)),
+    'gauge': (Gauge, lambda c, labels: c.inc(labels)),
+    'summary': (Summary, lambda c, labels: c.add(labels, 42)),
+    'sharded_counter': (ShardedCounter, lambda c, labels: c.inc(labels)),
+    'sharded_gauge': (ShardedGauge, lambda c, labels: c.inc(labels)),
+}
+
+
+def hammer(collectors, operation, iterations, labels, start_event):
+    """Updates all the collectors in a round robin fashion"""
+
+    start_event.wait()
+    for i in range(iterations):
+        operation(collectors[i % len(collectors)], labels)
+
+
+def run(threads, collectors, iterations, collector_type):
+    """Runs N threads hammering M collectors, returns the elapsed time"""
+
+    cls, operation = COLLECTOR_TYPES[collector_type]
+    metrics = [cls("contention_{0}".format(i), "Contention benchmark.")
+               for i in range(collectors)]
+
+    # Each thread starts at a different collector so they don't walk the
+    # collectors in lockstep
+    start_event = threading.Event()
+    workers = []
+    for i in range(threads):
+        shifted = metrics[i % collectors:] + metrics[:i % collectors]
+        labels = {'thread': str(i)}
+        t = threading.Thread(target=hammer,
+                             args=(shifted, operation, iterations, labels,
+                                   start_event))
+        workers.append(t)
+        t.start()
+
+    start = time.perf_counter()
+    start_event.set()
+    for t in workers:
+        t.join()
+
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark collector updates from concurrent threads")
+    parser.add_argument('-t', '--threads', type=int, default=8)
+    parser.add_argument('-m', '--collectors', type=int, default=8)
+    parser.add_argument('-i', '--iterations', type=int, default=20000,
+                        help="updates per thread")
+    parser.add_argument('-c', '--collector-type', default='counter',
+                        choices=sorted(COLLECTOR_TYPES.keys()))
+    args = parser.parse_args()
+
+    elapsed = run(args.threads, args.collectors, args.iterations,
+                  args.collector_type)
+    total = args.threads * args.iterations
+
+    print("{0} threads x {1} {2}s: {3} updates in {4:.3f}s ({5:.0f} ops/s)".format(
+        args.threads, args.collectors, args.collector_type, total, elapsed,
+        total / elapsed))
@@ -0,0 +1,57 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+import random
+import time
+
+import quantile
+
+from prometheus.collectors import Summary
+from prometheus.estimator import BufferedEstimator
+
+ESTIMATORS = (
+    ("quantile", quantile.Estimator),
+    ("buffered", BufferedEstimator),
+)
+
+
+def observe(cls, data):
+    e = cls(*Summary.DEFAULT_INVARIANTS)
+    start = time.perf_counter()
+    for v in data:
+        e.observe(v)
+    quantiles = [e.query(q) for q, _ in Summary.DEFAULT_INVARIANTS]
+    return time.perf_counter() - start, quantiles
+
+
+def observe_many(cls, data):
+    e = cls(*Summary.DEFAULT_INVARIANTS)
+    start = time.perf_counter()
+    e.observe_many(data)
+    quantiles = [e.query(q) for q, _ in Summary.DEFAULT_INVARIANTS]
+    return time.perf_counter() - start, quantiles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the summary quantile estimators")
+    parser.add_argument('-n', '--observations', type=int, default=1000000,
+                        help="observations per labels set")
+    args = parser.parse_args()
+
+    data = [random.expovariate(10) for i in range(args.observations)]
+
+    runs = [(name, "observe", observe, cls) for name, cls in ESTIMATORS]
+    runs.append(("buffered", "observe_many", observe_many, BufferedEstimator))
+
+    print("{0:>10} {1:>13} {2:>12} {3}".format(
+        "estimator", "method", "us/op", "quantiles"))
+    for name, method, fn, cls in runs:
+        elapsed, quantiles = fn(cls, data)
+        print("{0:>10} {1:>13} {2:>12.3f} {3}".format(
+            name, method, elapsed / len(data) * 1e6,
+            " ".join("{0:.4f}".format(q) for q in quantiles)))
@@ -0,0 +1,149 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+import functools
+from http.server import HTTPServer
+import threading
+import time
+
+import requests
+
+from prometheus.collectors import Counter
+from prometheus.exporter import PrometheusMetricHandler, start_http_server
+from prometheus.registry import Registry
+
+HOST = "127.0.0.1"
+
+
+class QuietHandler(PrometheusMetricHandler):
+    """Doesn't log the requests"""
+    def log_message(self, format, *args):
+        pass
+
+
+def single_server(registry, port, workers):
+    """The plain single threaded HTTPServer of the examples"""
+
+    server = HTTPServer(('', port), functools.partial(QuietHandler, registry))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def pool_server(registry, port, workers):
+    return start_http_server(registry, port, workers=workers,
+                             handler_class=QuietHandler)
+
+
+SERVERS = {
+    'single': single_server,
+    'pool': pool_server,
+}
+
+
+def create_registry(series):
+    """Creates a registry with the series split in 10 counters"""
+
+    registry = Registry()
+    for i in range(10):
+        c = Counter("benchmark_{0}".format(i), "Exporter benchmark.")
+        for j in range(series // 10):
+            c.set({'handler': "/handler/{0}".format(j)}, j)
+        registry.register(c)
+
+    return registry
+
+
+def scrape(url, scrapes, keep_alive, latencies, start_event):
+    """Scrapes the url, keeping the connection if keep_alive"""
+
+    headers = {} if keep_alive else {'connection': 'close'}
+    start_event.wait()
+    with requests.Session() as session:
+        for i in range(scrapes):
+            start = time.perf_counter()
+            r = session.get(url, headers=headers)
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+
+def slow_scraper(port, stop_event):
+    """A client that sends its request byte by byte"""
+
+    import socket
+    with socket.create_connection((HOST, port)) as conn:
+        for i in b"GET /metrics HTTP/1.1\r\n":
+            if stop_event.wait(0.5):
+                return
+            conn.sendall(bytes((i, )))
+
+
+def run(server_type, scrapers, scrapes, series, workers, keep_alive, slow,
+        port):
+    """ Runs the scrapers against a server, returns the elapsed time and
+        the latencies
+    """
+
+    registry = create_registry(series)
+    server = SERVERS[server_type](registry, port, workers)
+    url = "http://{0}:{1}{2}".format(HOST, port,
+                                     PrometheusMetricHandler.METRICS_PATH)
+
+    stop_event = threading.Event()
+    if slow:
+        threading.Thread(target=slow_scraper, args=(port, stop_event),
+                         daemon=True).start()
+        time.sleep(0.1)
+
+    start_event = threading.Event()
+    latencies = []
+    threads = [threading.Thread(target=scrape,
+                                args=(url, scrapes, keep_alive, latencies,
+                                      start_event))
+               for i in range(scrapers)]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    start_event.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    server.shutdown()
+    server.server_close()
+
+    return elapsed, sorted(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test of the exporter with concurrent scrapers")
+    parser.add_argument('-s', '--server', default='pool',
+                        choices=sorted(SERVERS.keys()))
+    parser.add_argument('-c', '--scrapers', type=int, default=8)
+    parser.add_argument('-n', '--scrapes', type=int, default=50,
+                        help="scrapes per scraper")
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help="workers of the pool server")
+    parser.add_argument('--no-keep-alive', action='store_true')
+    parser.add_argument('--slow', action='store_true',
+                        help="add a scraper that sends its request slowly")
+    parser.add_argument('-p', '--port', type=int, default=61424)
+    args = parser.parse_args()
+
+    elapsed, latencies = run(args.server, args.scrapers, args.scrapes,
+                             args.series, args.workers,
+                             not args.no_keep_alive, args.slow, args.port)
+    total = len(latencies)
+
+    print("{0} server, {1} scrapers: {2} scrapes in {3:.3f}s "
+          "({4:.0f} scrapes/s), p50 {5:.1f}ms, p99 {6:.1f}ms".format(
+              args.server, args.scrapers, total, elapsed, total / elapsed,
+              latencies[total // 2] * 1000,
+              latencies[int(total * 0.99)] * 1000))
@@ -0,0 +1,66 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+import time
+
+from prometheus.collectors import Counter, Summary
+from prometheus.formats import TextFormat, ProtobufFormat
+from prometheus.registry import Registry
+
+FORMATS = {
+    'text': TextFormat,
+    'protobuf': ProtobufFormat,
+}
+
+
+def create_registry(series, summaries):
+    """Creates a registry with the series split in 10 counters"""
+
+    registry = Registry()
+    const_labels = {'app': "benchmark", 'env': "production"}
+
+    for i in range(10):
+        cls = Summary if summaries else Counter
+        c = cls("benchmark_{0}".format(i), "Format benchmark.", const_labels)
+        for j in range(series // 10):
+            labels = {'handler': "/handler/{0}".format(j),
+                      'method': "GET", 'status': str(200 + j % 5)}
+            c.add(labels, j)
+        registry.register(c)
+
+    return registry
+
+
+def marshall(registry, fmt):
+    start = time.perf_counter()
+    fmt.marshall(registry)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the marshalling of a registry")
+    parser.add_argument('-s', '--series', type=int, default=50000)
+    parser.add_argument('-n', '--number', type=int, default=5,
+                        help="marshalls after the first one")
+    parser.add_argument('-f', '--format', default='text',
+                        choices=sorted(FORMATS.keys()))
+    parser.add_argument('--summaries', action='store_true',
+                        help="summaries instead of counters")
+    parser.add_argument('--unordered', action='store_true',
+                        help="don't sort the collectors and the lines")
+    args = parser.parse_args()
+
+    registry = create_registry(args.series, args.summaries)
+    fmt = FORMATS[args.format](ordered=not args.unordered)
+
+    # The first marshall fills the caches of the collectors
+    first = marshall(registry, fmt)
+    rest = min(marshall(registry, fmt) for i in range(args.number))
+
+    print("{0} series ({1}): first marshall {2:.3f}s, next ones {3:.3f}s".format(
+        args.series, args.format, first, rest))
@@ -0,0 +1,108 @@
+# Set the python path
+import inspect
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+
+import argparse
+import collections
+import json
+import re
+import timeit
+
+from prometheus.metricdict import MetricDict
+
+
+# The previous MetricDict implementation (JSON string keys), kept here to
+# compare against
+regex = re.compile("\{.*:.*,?\}")
+decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
+
+
+class JSONMetricDict(collections.MutableMapping):
+
+    EMPTY_KEY = "__EMPTY__"
+
+    def __init__(self, *args, **kwargs):
+        self.store = dict()
+        self.update(dict(*args, **kwargs))
+
+    def __getitem__(self, key):
+        return self.store[self.__keytransform__(key)]
+
+    def __setitem__(self, key, value):
+        self.store[self.__keytransform__(key)] = value
+
+    def __delitem__(self, key):
+        del self.store[self.__keytransform__(key)]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __keytransform__(self, key):
+        if not key or key == JSONMetricDict.EMPTY_KEY:
+            return JSONMetricDict.EMPTY_KEY
+
+        if type(key) == str and regex.match(key):
+            return key
+
+        if type(key) is not dict:
+            raise TypeError("Only accepts dicts as keys")
+
+        return json.dumps(key, sort_keys=True)
+
+
+def json_scrape(metrics):
+    return [(decoder.decode(k), metrics[k]) for k in list(metrics)]
+
+
+def tuple_scrape(metrics):
+    return [(collections.OrderedDict(k), metrics[k]) for k in list(metrics)]
+
+
+def bench(cls, scrape, label_count, series, number):
+    labels = [{"label_{0}".format(j): "value_{0}_{1}".format(i, j)
+               for j in range(label_count)} for i in range(series)]
+
+    metrics = cls()
+    for l in labels:
+        metrics[l] = 0
+
+    def write():
+        for l in labels:
+            metrics[l] = 1
+
+    def read():
+        for l in labels:
+            metrics[l]
+
+    return (min(timeit.repeat(write, number=number, repeat=3)),
+            min(timeit.repeat(read, number=number, repeat=3)),
+            min(timeit.repeat(lambda: scrape(metrics), number=number,
+                              repeat=3)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark MetricDict key representations")
+    parser.add_argument('-s', '--series', type=int, default=1000)
+    parser.add_argument('-n', '--number', type=int, default=20)
+    args = parser.parse_args()
+
+    implementations = (
+        ("json", JSONMetricDict, json_scrape),
+        ("tuple", MetricDict, tuple_scrape),
+    )
+
+    ops = args.series * args.number
+    print("{0:>6} {1:>6} {2:>12} {3:>12} {4:>12}".format(
+        "labels", "keys", "write us/op", "read us/op", "scrape us/op"))
+    for label_count in (1, 5, 10):
+        for name, cls, scrape in implementations:
+            w, r, s = bench(cls, scrape, label_count, args.series, args.number)
+            print("{0:>6} {1:>6} {2:>12.3f} {3:>12.3f} {4:>12.3f}".format(
+                label_count, name, w / ops * 1e6, r / ops * 1e6,
+                s / ops * 1e6))
@@ -5,14 +5,12 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
 
 import math
-import threading
-from http.server import HTTPServer
 import socket
 import time
 
 from prometheus.collectors import Gauge
 from prometheus.registry import Registry
-from prometheus.exporter import PrometheusMetricHandler
+from prometheus.exporter import start_http_server
 
 PORT_NUMBER = 4444
 
@@ -48,19 +46,12 @@ if __name__ == "__main__":
     # Create the registry
     registry = Registry()
 
-    # Create the thread that gathers the data while we serve it
-    thread = threading.Thread(target=gather_data, args=(registry, ))
-    thread.start()
+    # Serve the data (expose it to prometheus) from a daemon thread
+    server = start_http_server(registry, PORT_NUMBER)
 
-    # Set a server to export (expose to prometheus) the data (in a thread)
+    # Gather the data while we serve it
     try:
-        # We make this to set the registry in the handler
-        def handler(*args, **kwargs):
-            PrometheusMetricHandler(registry, *args, **kwargs)
-
-        server = HTTPServer(('', PORT_NUMBER), handler)
-        server.serve_forever()
-
+        gather_data(registry)
     except KeyboardInterrupt:
-        server.socket.close()
-        thread.join()
+        server.shutdown()
+        server.server_close()
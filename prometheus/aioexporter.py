@@ -0,0 +1,162 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler
+
+from prometheus.exporter import compress
+from prometheus.negotiator import Negotiator
+
+
+class AsyncExporter(object):
+    """ Serves a registry from an asyncio event loop (asyncio.start_server)
+        without threads. The response is marshalled a collector at a time
+        (marshall_iter), yielding to the loop between them, so a big scrape
+        doesn't stall the other tasks of the loop
+    """
+
+    METRICS_PATH = "/metrics"
+
+    # Sort the collectors and the lines of the response, set it to False if
+    # the order doesn't matter to save the sorting
+    ORDERED = True
+
+    # zlib level of the compressed responses
+    COMPRESSION_LEVEL = 6
+
+    # Seconds of an idle keep-alive connection (or a stalled client) before
+    # it's closed
+    timeout = 30
+
+    def __init__(self, registry, loop=None):
+        self.registry = registry
+        self.loop = loop
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        """ Serves the requests of a connection (the client_connected_cb of
+            asyncio.start_server), the connection is kept alive between
+            them
+        """
+
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = yield from asyncio.wait_for(
+                        self._read_request(reader), self.timeout,
+                        loop=self.loop)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+
+                keep_alive = yield from self._respond(writer, *request)
+        except (ConnectionError, ValueError):
+            # Gone clients, too long or malformed requests
+            pass
+        finally:
+            writer.close()
+
+    @asyncio.coroutine
+    def _read_request(self, reader):
+        """ Returns the method, path, version and headers (a dict) of the
+            next request, None if the client closed the connection
+        """
+
+        line = yield from reader.readline()
+        if not line.strip():
+            return None
+
+        method, path, version = line.decode("latin-1").split()
+
+        headers = {}
+        while True:
+            line = yield from reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        return method, path, version, headers
+
+    def _write_head(self, writer, status, headers):
+        lines = ["HTTP/1.1 {0} {1}".format(
+            status, BaseHTTPRequestHandler.responses[status][0])]
+        lines.extend("{0}: {1}".format(k, v) for k, v in headers)
+        lines.append("\r\n")
+
+        writer.write("\r\n".join(lines).encode("latin-1"))
+
+    @asyncio.coroutine
+    def _respond(self, writer, method, path, version, headers):
+        """ Writes the response of a request, returns if the connection is
+            kept alive
+        """
+
+        connection = headers.get('connection', "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+
+        if method != "GET" or path != self.METRICS_PATH:
+            status = 404 if method == "GET" else 501
+            self._write_head(writer, status, [("Content-Length", 0)])
+            yield from writer.drain()
+            return keep_alive
+
+        # select formatter (without timestamp)
+        formatter_class, encoding = Negotiator.negotiate_response(headers)
+        formatter = formatter_class(False, ordered=self.ORDERED)
+
+        # The collectors are marshalled as the chunks are consumed, each one
+        # from a snapshot taken in its own step (summaries query their
+        # estimators for it)
+        chunks = formatter.marshall_iter(self.registry.lazy_snapshot())
+        if encoding is not None:
+            chunks = compress(chunks, encoding, self.COMPRESSION_LEVEL)
+
+        # HTTP/1.0 clients don't understand chunks, the end of the response
+        # is the end of the connection
+        chunked = version != "HTTP/1.0"
+        keep_alive = keep_alive and chunked
+
+        response_headers = list(formatter.get_headers().items())
+        if encoding is not None:
+            response_headers.append(("Content-Encoding", encoding))
+        response_headers.append(("Vary", "Accept-Encoding"))
+        if chunked:
+            response_headers.append(("Transfer-Encoding", "chunked"))
+        if not keep_alive:
+            response_headers.append(("Connection", "close"))
+        self._write_head(writer, 200, response_headers)
+
+        for chunk in chunks:
+            if chunk:
+                if chunked:
+                    chunk = b"".join((
+                        "{0:x}\r\n".format(len(chunk)).encode("ascii"),
+                        chunk, b"\r\n"))
+                writer.write(chunk)
+
+            # Let the other tasks run before the next collector
+            yield from writer.drain()
+            yield from asyncio.sleep(0, loop=self.loop)
+
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        yield from writer.drain()
+
+        return keep_alive
+
+
+@asyncio.coroutine
+def start_async_server(registry, port, host=None, loop=None,
+                       exporter_class=AsyncExporter):
+    """ Starts serving the registry in the loop, returns the asyncio
+        Server (call close and wait_closed to stop it)
+    """
+
+    exporter = exporter_class(registry, loop=loop)
+    server = yield from asyncio.start_server(exporter.handle, host, port,
+                                             loop=loop)
+
+    return server
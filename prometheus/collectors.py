@@ -1,59 +1,212 @@
+import bisect
 import collections
-import json
-from multiprocessing import Lock
-
-import quantile
+import itertools
+import threading
+from threading import Lock
 
+from prometheus.estimator import BufferedEstimator
 from prometheus.metricdict import MetricDict
+from prometheus import utils
 
 
-# Used so only one thread can access the values at the same time
-mutex = Lock()
-
-# Used to return the value ordered (not necessary byt for consistency useful)
-decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
-
 RESTRICTED_LABELS_NAMES = ('job',)
 RESTRICTED_LABELS_PREFIXES = ('__',)
 
+# The collectors take a new generation from here on every update, the counter
+# is atomic and the generations are never repeated so a collector with the
+# same generation has the same values
+_next_generation = itertools.count(1).__next__
+
+
+class CollectorChild(object):
+    """ CollectorChild is bound to one labels set of a collector, updates
+        made through it skip the labels validation and the key creation
+    """
+
+    def __init__(self, collector, key):
+        self.collector = collector
+        self.key = key
+
+        # Shortcuts to the (already synchronized) collector internals
+        self._mutex = collector.mutex
+        self._store = collector.values.store
+        self._versions = collector.versions
+
+    def get(self):
+        """ Gets the value of the bound labels"""
+
+        return self.collector.get(self.key)
+
+
+class ValueChild(CollectorChild):
+    """ Child of the collectors of a single value per labels set (untyped,
+        counters and gauges), the summaries and histograms don't set values
+    """
+
+    def set(self, value):
+        """ Sets the value of the bound labels"""
+
+        with self._mutex:
+            self._store[self.key] = value
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
+    def _add(self, value):
+        with self._mutex:
+            self._store[self.key] = self._store.get(self.key, 0) + value
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
 
 class Collector(object):
     """Collector is the base class for all the collectors/metrics"""
 
     REPR_STR = "untyped"
+    CHILD_CLASS = ValueChild
 
-    def __init__(self, name, help_text, const_labels=None):
+    def __init__(self, name, help_text, const_labels=None, labelnames=None):
         self.name = name
         self.help_text = help_text
         self.const_labels = const_labels
 
         if const_labels:
             self._label_names_correct(const_labels)
-            self.const_labels = const_labels
+
+        # Declared label names are validated once, after that only the
+        # names of the labels are checked
+        self.labelnames = None
+        if labelnames is not None:
+            labelnames = tuple(labelnames)
+            self._label_names_correct({k: None for k in labelnames})
+            if len(set(labelnames)) != len(labelnames):
+                raise ValueError("Labels not correct")
+            self.labelnames = labelnames
+            self._labelnames_set = frozenset(labelnames)
 
         # This is a map that contains all the metrics
         # This variable should be syncronized
         self.values = MetricDict()
 
+        # Version of each series (by key), the generation of its last update
+        self.versions = {}
+
+        # Each collector has its own lock so updates on different metrics
+        # don't block each other
+        self.mutex = Lock()
+
+        # Cached children bound to a labels set (by key)
+        self.children = {}
+
+        # Generation, versions and values of the last snapshot, the values of
+        # the series that didn't change are used again
+        self.snapshot_values = (None, {}, {})
+
+    @property
+    def const_labels(self):
+        return self._const_labels
+
+    @const_labels.setter
+    def const_labels(self, const_labels):
+        self._const_labels = const_labels
+
+        # Rendered name and labels of each series and lines of the series in
+        # order (by the formats), they include the const labels so they are
+        # rendered again
+        self.text_prefixes = {}
+        self.text_index = ([], frozenset(), None)
+
+        # Encoded label pairs of each series (protobuf format)
+        self.protobuf_labels = {}
+
+        # Last rendered lines (with their index and the versions of the
+        # series) and encoded metric of each series (with its version), used
+        # again while the series don't change
+        self.text_lines = (None, {}, [])
+        self.protobuf_metrics = {}
+
+        # The rendered metrics change too
+        self.generation = _next_generation()
+
     def set_value(self, labels, value):
         """ Sets a value in the container"""
 
-        if labels:
-            self._label_names_correct(labels)
+        self._check_labels(labels)
 
-        with mutex:
-            self.values[labels] = value
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
+            self.values[key] = value
+            self.generation = self.versions[key] = _next_generation()
 
     def get_value(self, labels):
         """ Gets a value in the container, exception if isn't present"""
 
-        with mutex:
+        with self.mutex:
             return self.values[labels]
 
+    def add_value(self, labels, value):
+        """ Adds a value to the one in the container (starting from 0)
+            atomically
+        """
+
+        self._check_labels(labels)
+
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
+            self.values.add(key, value)
+            self.generation = self.versions[key] = _next_generation()
+
     def get(self, labels):
         """Handy alias"""
         return self.get_value(labels)
 
+    def labels(self, *values):
+        """ Returns the (cached) child bound to the labels, use it on hot
+            paths where the same labels are updated again and again. If the
+            collector declares its label names the label values can be passed
+            in the same order instead of a dict
+        """
+
+        if len(values) == 1 and (values[0] is None or
+                                 isinstance(values[0], dict)):
+            labels = values[0]
+            checked = False
+        elif self.labelnames is not None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("Wrong number of label values")
+            labels = dict(zip(self.labelnames, values))
+            checked = True
+        elif not values:
+            labels = None
+            checked = True
+        else:
+            raise TypeError("Label values need declared label names")
+
+        key = self.values.__keytransform__(labels)
+
+        try:
+            return self.children[key]
+        except KeyError:
+            if not checked:
+                self._check_labels(labels)
+
+            with self.mutex:
+                return self.children.setdefault(key,
+                                                self.CHILD_CLASS(self, key))
+
+    def _check_labels(self, labels):
+        """ Raise exception (ValueError) if labels not correct, with
+            declared label names only the names need to be checked
+        """
+
+        if self.labelnames is None:
+            if labels:
+                self._label_names_correct(labels)
+        elif not labels:
+            if self.labelnames:
+                raise ValueError("Labels not correct")
+        elif labels.keys() != self._labelnames_set:
+            raise ValueError("Labels not correct")
+
     def _label_names_correct(self, labels):
         """Raise exception (ValueError) if labels not correct"""
 
@@ -68,25 +221,187 @@ class Collector(object):
 
         return True
 
+    def get_items(self, keys=None):
+        """ Returns a list populated by tuples of 2 elements, first one is
+            the key of the labels (a tuple of label pairs, it identifies the
+            series) and the second element is the value of the metric itself.
+            Only the series of the keys if they are passed
+        """
+        if keys is None:
+            with self.mutex:
+                keys = list(self.values.store)
+
+        return [(k, self.get(k)) for k in keys]
+
+    def get_versions(self):
+        """ Returns a dict with the version of each series (by key), it
+            changes on every update of the series (None if it's unknown).
+            Read the versions before the values, a value can be newer than
+            its version but not older
+        """
+        with self.mutex:
+            versions = self.versions
+            store = self.values.store
+
+            # The versions are of keys of the store, all of them if the length
+            # is the same
+            if len(versions) == len(store):
+                return versions.copy()
+            return {k: versions.get(k) for k in store}
+
     def get_all(self):
         """ Returns a list populated by tuples of 2 elements, first one is
             a dict with all the labels and the second elemnt is the value
             of the metric itself
         """
-        with mutex:
-            items = self.values.items()
 
         result = []
-        for k, v in items:
+        for k, v in self.get_items():
             # Check if is a single value dict (custom empty key)
-            if not k or k == MetricDict.EMPTY_KEY:
+            if not k:
                 key = None
             else:
-                key = decoder.decode(k)
-            result.append((key, self.get(k)))
+                # Return the labels ordered (not necessary but for
+                # consistency useful)
+                key = collections.OrderedDict(k)
+            result.append((key, v))
 
         return result
 
+    def snapshot(self):
+        """ Returns a CollectorSnapshot with the values of all the series
+            read at once, the formats marshall it without locking the
+            collector so the updates don't wait for them
+        """
+
+        generation = self.generation
+        last_generation, last_versions, last_values = self.snapshot_values
+        if generation == last_generation:
+            # Nothing changed since the last snapshot
+            return CollectorSnapshot(self, last_values, last_versions,
+                                     generation)
+
+        versions, values = self._snapshot_values(last_versions, last_values)
+        self.snapshot_values = (generation, versions, values)
+
+        return CollectorSnapshot(self, values, versions, generation)
+
+    def _snapshot_values(self, last_versions, last_values):
+        """ Returns the versions and the values of all the series, only the
+            series updated since the last snapshot are read
+        """
+
+        versions = self.get_versions()
+        values = {k: last_values[k] for k, v in versions.items()
+                  if v is not None and last_versions.get(k) == v}
+        if len(values) != len(versions):
+            values.update(self.get_items(
+                [k for k in versions if k not in values]))
+
+        return versions, values
+
+
+# Collectors with the caches of the formats of the unpickled snapshots (by
+# name, type and const labels), the least recently used first
+_unpickled_collectors = collections.OrderedDict()
+
+
+def evict_unpickled_collectors(size):
+    """ Drops the least recently used collectors of the unpickled snapshots
+        (and their caches) over the size, like the ones deregistered or with
+        other const labels
+    """
+
+    while len(_unpickled_collectors) > size:
+        _unpickled_collectors.popitem(last=False)
+
+
+def _collector_attribute(name):
+    """ Attribute of a snapshot stored in its collector"""
+    return property(lambda self: getattr(self.collector, name),
+                    lambda self, value: setattr(self.collector, name, value))
+
+
+class CollectorSnapshot(object):
+    """ Copy of the values of a collector at one point in time (see
+        Collector.snapshot), the formats marshall it like the collector. The
+        values are read without locks and the caches of the formats are the
+        ones of the collector
+    """
+
+    def __init__(self, collector, values, versions, generation):
+        self.collector = collector
+        self.name = collector.name
+        self.help_text = collector.help_text
+        self.const_labels = collector.const_labels
+        self.REPR_STR = collector.REPR_STR
+        self.values = values
+        self.versions = versions
+        self.generation = generation
+
+    # Caches of the formats
+    text_prefixes = _collector_attribute("text_prefixes")
+    text_index = _collector_attribute("text_index")
+    text_lines = _collector_attribute("text_lines")
+    protobuf_labels = _collector_attribute("protobuf_labels")
+    protobuf_metrics = _collector_attribute("protobuf_metrics")
+
+    def get(self, labels):
+        return self.values[self.collector.values.__keytransform__(labels)]
+
+    def get_items(self, keys=None):
+        if keys is None:
+            return list(self.values.items())
+        return [(k, self.values[k]) for k in keys]
+
+    def get_versions(self):
+        return self.versions
+
+    def __getstate__(self):
+        # Pickled without the collector (and its locks) to marshall it in
+        # other processes
+        state = self.__dict__.copy()
+        del state['collector']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # The caches of the snapshots of the same collector are kept in this
+        # process, the versions of the series are the same in all of them
+        key = (self.name, self.REPR_STR,
+               tuple(sorted((self.const_labels or {}).items())))
+        try:
+            self.collector = _unpickled_collectors[key]
+            _unpickled_collectors.move_to_end(key)
+        except KeyError:
+            self.collector = _unpickled_collectors[key] = Collector(
+                self.name, self.help_text, self.const_labels)
+
+
+class CounterChild(ValueChild):
+    """ Counter bound to one labels set, see Counter.labels"""
+
+    def inc(self):
+        """ Inc increments the counter by 1."""
+        self._add(1)
+
+    def add(self, value):
+        """ Add adds the given value to the counter. It panics if the value
+            is < 0.
+        """
+
+        if value < 0:
+            raise ValueError("Counters can't decrease")
+
+        self._add(value)
+
+    def add_many(self, values):
+        """ Adds all the values (list, array.array or NumPy array) to the
+            counter at once. It panics if any value is < 0.
+        """
+        self._add(Counter._sum_positive(values))
+
 
 class Counter(Collector):
     """ Counter is a Metric that represents a single numerical value that only
@@ -94,6 +409,7 @@ class Counter(Collector):
     """
 
     REPR_STR = "counter"
+    CHILD_CLASS = CounterChild
 
     def set(self, labels, value):
         """ Set is used to set the Counter to an arbitrary value. """
@@ -105,9 +421,30 @@ class Counter(Collector):
 
         return self.get_value(labels)
 
+    def get_items(self, keys=None):
+        # The values are stored as they are, all of them are read under the
+        # lock at once
+        with self.mutex:
+            store = self.values.store
+            if keys is None:
+                return list(store.items())
+            return [(k, store[k]) for k in keys]
+
+    def _snapshot_values(self, last_versions, last_values):
+        # The plain values are copied at once under the lock, cheaper than
+        # checking which ones changed
+        with self.mutex:
+            store = self.values.store
+            versions = self.versions
+            if len(versions) == len(store):
+                return versions.copy(), store.copy()
+
+        versions = self.get_versions()
+        return versions, dict(self.get_items(list(versions)))
+
     def inc(self, labels):
         """ Inc increments the counter by 1."""
-        self.add(labels, 1)
+        self.add_value(labels, 1)
 
     def add(self, labels, value):
         """ Add adds the given value to the counter. It panics if the value
@@ -117,12 +454,51 @@ class Counter(Collector):
         if value < 0:
             raise ValueError("Counters can't decrease")
 
-        try:
-            current = self.get_value(labels)
-        except KeyError:
-            current = 0
+        self.add_value(labels, value)
+
+    def add_many(self, labels, values):
+        """ Adds all the values (list, array.array or NumPy array) to the
+            counter at once. It panics if any value is < 0.
+        """
+        self.add_value(labels, self._sum_positive(values))
+
+    @staticmethod
+    def _sum_positive(values):
+        values = utils.to_numbers(values)
+        if any(v < 0 for v in values):
+            raise ValueError("Counters can't decrease")
+
+        return sum(values)
+
+
+class GaugeChild(ValueChild):
+    """ Gauge bound to one labels set, see Gauge.labels"""
+
+    def inc(self):
+        """ Inc increments the Gauge by 1."""
+        self._add(1)
 
-        self.set_value(labels, current + value)
+    def dec(self):
+        """ Dec decrements the Gauge by 1."""
+        self._add(-1)
+
+    def add(self, value):
+        """ Add adds the given value to the Gauge. (The value can be
+            negative, resulting in a decrease of the Gauge.)
+        """
+        self._add(value)
+
+    def add_many(self, values):
+        """ Adds all the values (list, array.array or NumPy array) to the
+            Gauge at once.
+        """
+        self._add(sum(utils.to_numbers(values)))
+
+    def sub(self, value):
+        """ Sub subtracts the given value from the Gauge. (The value can be
+            negative, resulting in an increase of the Gauge.)
+        """
+        self._add(-value)
 
 
 class Gauge(Collector):
@@ -131,6 +507,7 @@ class Gauge(Collector):
     """
 
     REPR_STR = "gauge"
+    CHILD_CLASS = GaugeChild
 
     def set(self, labels, value):
         """ Set sets the Gauge to an arbitrary value."""
@@ -142,25 +519,29 @@ class Gauge(Collector):
 
         return self.get_value(labels)
 
+    get_items = Counter.get_items
+    _snapshot_values = Counter._snapshot_values
+
     def inc(self, labels):
         """ Inc increments the Gauge by 1."""
-        self.add(labels, 1)
+        self.add_value(labels, 1)
 
     def dec(self, labels):
         """ Dec decrements the Gauge by 1."""
-        self.add(labels, -1)
+        self.add_value(labels, -1)
 
     def add(self, labels, value):
         """ Add adds the given value to the Gauge. (The value can be
             negative, resulting in a decrease of the Gauge.)
         """
 
-        try:
-            current = self.get_value(labels)
-        except KeyError:
-            current = 0
+        self.add_value(labels, value)
 
-        self.set_value(labels, current + value)
+    def add_many(self, labels, values):
+        """ Adds all the values (list, array.array or NumPy array) to the
+            Gauge at once.
+        """
+        self.add_value(labels, sum(utils.to_numbers(values)))
 
     def sub(self, labels, value):
         """ Sub subtracts the given value from the Gauge. (The value can be
@@ -169,6 +550,45 @@ class Gauge(Collector):
         self.add(labels, -value)
 
 
+class SummaryChild(CollectorChild):
+    """ Summary bound to one labels set, see Summary.labels"""
+
+    def add(self, value):
+        """Add adds a single observation to the summary."""
+
+        if not utils.is_number(value):
+            raise TypeError("Summary only works with digits (int, float)")
+
+        with self._mutex:
+            e = self._store.get(self.key)
+            if e is None:
+                e = self.collector._create_estimator()
+                self._store[self.key] = e
+            e.observe(float(value))
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
+    def add_many(self, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the summary taking the lock once.
+        """
+
+        values = Summary._to_numbers(values)
+
+        with self._mutex:
+            e = self._store.get(self.key)
+            if e is None:
+                e = self.collector._create_estimator()
+                self._store[self.key] = e
+            e.observe_many([float(v) for v in values])
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
+    # Handy aliases
+    observe = add
+    observe_many = add_many
+
+
 class Summary(Collector):
     """ A Summary captures individual observations from an event or sample
         stream and summarizes them in a manner similar to traditional summary
@@ -177,6 +597,7 @@ class Summary(Collector):
     """
 
     REPR_STR = "summary"
+    CHILD_CLASS = SummaryChild
     DEFAULT_INVARIANTS = [(0.50, 0.05), (0.90, 0.01), (0.99, 0.001)]
     SUM_KEY = "sum"
     COUNT_KEY = "count"
@@ -187,45 +608,431 @@ class Summary(Collector):
             return self.values[labels]
 
     def set_value(self, labels, value):
-        if labels:
-            self._label_names_correct(labels)
+        self._check_labels(labels)
 
-        self.values[labels] = value
+        key = self.values.__keytransform__(labels)
+        self.values[key] = value
+        self.generation = self.versions[key] = _next_generation()
 
     def add(self, labels, value):
         """Add adds a single observation to the summary."""
 
-        if type(value) not in (float, int):
+        if not utils.is_number(value):
             raise TypeError("Summary only works with digits (int, float)")
 
+        self._check_labels(labels)
+
         # We have already a lock for data but not for the estimator
-        with mutex:
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
             try:
-                e = self.get_value(labels)
+                e = self.values[key]
             except KeyError:
                 # Initialize quantile estimator
-                e = quantile.Estimator(*self.__class__.DEFAULT_INVARIANTS)
-                self.set_value(labels, e)
+                e = self._create_estimator()
+                self.values[key] = e
             e.observe(float(value))
+            self.generation = self.versions[key] = _next_generation()
+
+    def add_many(self, labels, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the summary taking the lock once.
+        """
+
+        values = self._to_numbers(values)
+        self._check_labels(labels)
+
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
+            try:
+                e = self.values[key]
+            except KeyError:
+                e = self._create_estimator()
+                self.values[key] = e
+            e.observe_many([float(v) for v in values])
+            self.generation = self.versions[key] = _next_generation()
+
+    @staticmethod
+    def _to_numbers(values):
+        try:
+            return utils.to_numbers(values)
+        except TypeError:
+            raise TypeError("Summary only works with digits (int, float)")
+
+    def _create_estimator(self):
+        return BufferedEstimator(*self.__class__.DEFAULT_INVARIANTS)
 
     def get(self, labels):
         """ Get gets the data in the form of 0.5, 0.9 and 0.99 percentiles. Also
             you get sum and count, all in a dict
         """
 
+        # We have already a lock for data but not for the estimator
+        with self.mutex:
+            e = self._copy_estimator(self.get_value(labels))
+        return self._summarize(e)
+
+    def get_items(self, keys=None):
+        # The estimators of all the series are copied under the lock at once
+        # and queried without it, so the updates don't wait for the queries
+        with self.mutex:
+            store = self.values.store
+            if keys is None:
+                keys = list(store)
+            estimators = [(k, self._copy_estimator(store[k])) for k in keys]
+
+        return [(k, self._summarize(e)) for k, e in estimators]
+
+    def _copy_estimator(self, e):
+        """ Returns a copy of the estimator of a series to query it without
+            the lock (call it with the lock)
+        """
+        return e.copy()
+
+    def _summarize(self, e):
+        """ Returns the dict with the quantiles, sum and count of a series
+            from its estimator (a copy, see _copy_estimator)
+        """
+
         return_data = {}
 
-        # We have already a lock for data but not for the estimator
-        with mutex:
-            e = self.get_value(labels)
+        # Set invariants data (default to 0.50, 0.90 and 0.99)
+        for i in e._invariants:
+            q = i._quantile
+            return_data[q] = e.query(q)
+
+        # Set sum and count
+        return_data[self.__class__.SUM_KEY] = e._sum
+        return_data[self.__class__.COUNT_KEY] = e._observations
+
+        return return_data
+
+
+class HistogramChild(CollectorChild):
+    """ Histogram bound to one labels set, see Histogram.labels"""
+
+    def add(self, value):
+        """Add adds a single observation to the histogram."""
 
-            # Set invariants data (default to 0.50, 0.90 and 0.99)
-            for i in e._invariants:
-                q = i._quantile
-                return_data[q] = e.query(q)
+        if not utils.is_number(value):
+            raise TypeError("Histogram only works with digits (int, float)")
+
+        index = bisect.bisect_left(self.collector.upper_bounds, value)
+
+        with self._mutex:
+            counts = self._store.get(self.key)
+            if counts is None:
+                counts = self.collector._create_counts()
+                self._store[self.key] = counts
+            counts[index] += 1
+            counts[-1] += value
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
+    def add_many(self, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the histogram taking the lock once.
+        """
 
-            # Set sum and count
-            return_data[self.__class__.SUM_KEY] = e._sum
-            return_data[self.__class__.COUNT_KEY] = e._observations
+        values = Histogram._to_numbers(values)
+        upper_bounds = self.collector.upper_bounds
+
+        with self._mutex:
+            counts = self._store.get(self.key)
+            if counts is None:
+                counts = self.collector._create_counts()
+                self._store[self.key] = counts
+            Histogram._observe(counts, upper_bounds, values)
+            self.collector.generation = self._versions[self.key] = \
+                _next_generation()
+
+    # Handy aliases
+    observe = add
+    observe_many = add_many
+
+
+class Histogram(Collector):
+    """ A Histogram counts individual observations from an event or sample
+        stream in configurable buckets. Similar to a summary, it also provides
+        a sum of observations and an observation count. Unlike the summary
+        quantiles, the buckets can be aggregated across instances.
+    """
+
+    REPR_STR = "histogram"
+    CHILD_CLASS = HistogramChild
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5,
+                       5.0, 7.5, 10.0, float("inf"))
+    BUCKET_LABEL = "le"
+    SUM_KEY = "sum"
+    COUNT_KEY = "count"
+
+    def __init__(self, name, help_text, const_labels=None, labelnames=None,
+                 buckets=None):
+        super().__init__(name, help_text, const_labels, labelnames)
+
+        if buckets is None:
+            buckets = self.__class__.DEFAULT_BUCKETS
+
+        # The upper bounds are sorted so the bucket of an observation is
+        # found with bisect, the last one is always +Inf
+        upper_bounds = [float(b) for b in buckets]
+        if upper_bounds != sorted(set(upper_bounds)):
+            raise ValueError("Buckets not in sorted order")
+
+        if not upper_bounds or upper_bounds[-1] != float("inf"):
+            upper_bounds.append(float("inf"))
+
+        self.upper_bounds = tuple(upper_bounds)
+
+    def _label_names_correct(self, labels):
+        """ Raise exception (ValueError) if labels not correct, the bucket
+            label is reserved
+        """
+
+        if self.__class__.BUCKET_LABEL in labels:
+            raise ValueError("Labels not correct")
+
+        return super()._label_names_correct(labels)
+
+    def add(self, labels, value):
+        """Add adds a single observation to the histogram."""
+
+        if not utils.is_number(value):
+            raise TypeError("Histogram only works with digits (int, float)")
+
+        self._check_labels(labels)
+        index = bisect.bisect_left(self.upper_bounds, value)
+
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
+            try:
+                counts = self.values[key]
+            except KeyError:
+                counts = self._create_counts()
+                self.values[key] = counts
+            counts[index] += 1
+            counts[-1] += value
+            self.generation = self.versions[key] = _next_generation()
+
+    def add_many(self, labels, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the histogram taking the lock once.
+        """
+
+        values = self._to_numbers(values)
+        self._check_labels(labels)
+
+        with self.mutex:
+            key = self.values.__keytransform__(labels)
+            try:
+                counts = self.values[key]
+            except KeyError:
+                counts = self._create_counts()
+                self.values[key] = counts
+            self._observe(counts, self.upper_bounds, values)
+            self.generation = self.versions[key] = _next_generation()
+
+    @staticmethod
+    def _observe(counts, upper_bounds, values):
+        for v in values:
+            counts[bisect.bisect_left(upper_bounds, v)] += 1
+        counts[-1] += sum(values)
+
+    @staticmethod
+    def _to_numbers(values):
+        try:
+            return utils.to_numbers(values)
+        except TypeError:
+            raise TypeError("Histogram only works with digits (int, float)")
+
+    def _create_counts(self):
+        """ The counts are a flat list with the (not cumulative) count of each
+            bucket followed by the sum of the observations
+        """
+        return [0] * len(self.upper_bounds) + [0.0]
+
+    def get(self, labels):
+        """ Get gets the cumulative count of each bucket (by upper bound),
+            sum and count, all in a dict
+        """
+
+        with self.mutex:
+            counts = list(self.values[labels])
+
+        return self._cumulate(counts)
+
+    def get_items(self, keys=None):
+        # The counts of all the series are copied under the lock at once
+        with self.mutex:
+            store = self.values.store
+            if keys is None:
+                keys = list(store)
+            counts = [(k, list(store[k])) for k in keys]
+
+        return [(k, self._cumulate(c)) for k, c in counts]
+
+    def _cumulate(self, counts):
+        """ Returns the dict with the cumulative count of each bucket, sum
+            and count of a series from its counts
+        """
+
+        return_data = {}
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds, counts):
+            cumulative += count
+            return_data[upper_bound] = cumulative
+
+        return_data[self.__class__.SUM_KEY] = counts[-1]
+        return_data[self.__class__.COUNT_KEY] = cumulative
 
         return return_data
+
+
+class DelegatedChildMixin(object):
+    """ Child that delegates the updates to its collector (_set_key and
+        _add_key), used by collectors that don't update their values store
+        directly, like the sharded ones
+    """
+
+    def set(self, value):
+        self.collector._set_key(self.key, value)
+
+    def _add(self, value):
+        self.collector._add_key(self.key, value)
+
+
+class ShardedMixin(object):
+    """ Keeps a shard of the values per thread, each thread updates its own
+        shard without locking and the shards are merged when the values are
+        read (scrapes). Setting a value takes the lock and discards the
+        values of the labels added until then in all the shards.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Pairs of thread and shard, the shard maps keys to the epoch of the
+        # value and the value itself
+        self._shards = []
+        self._local = threading.local()
+
+        # Epochs are bumped on each set, older values in the shards are stale
+        self._epochs = {}
+
+    def set_value(self, labels, value):
+        """ Sets a value in the container"""
+
+        self._check_labels(labels)
+        self._set_key(self.values.__keytransform__(labels), value)
+
+    def get_value(self, labels):
+        """ Gets a value in the container, exception if isn't present"""
+
+        return self._merge()[self.values.__keytransform__(labels)]
+
+    def add_value(self, labels, value):
+        """ Adds a value to the one in the shard of the current thread"""
+
+        self._check_labels(labels)
+        self._add_key(self.values.__keytransform__(labels), value)
+
+    def get_items(self, keys=None):
+        values = self._merge()
+        if keys is None:
+            return list(values.items())
+        return [(k, values[k]) for k in keys]
+
+    def _snapshot_values(self, last_versions, last_values):
+        versions = self.get_versions()
+        values = self._merge()
+
+        # Without the series added after the versions were read
+        if len(values) != len(versions):
+            values = {k: values[k] for k in versions}
+
+        return versions, values
+
+    def _set_key(self, key, value):
+        with self.mutex:
+            self.values.store[key] = value
+            self._epochs[key] = self._epochs.get(key, 0) + 1
+            self.generation = self.versions[key] = _next_generation()
+
+    def _add_key(self, key, value):
+        # The base value has all the keys so the collector knows about all
+        # the labels (added only the first time)
+        if key not in self.values.store:
+            with self.mutex:
+                self.values.store.setdefault(key, 0)
+
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self.mutex:
+                self._shards.append((threading.current_thread(), shard))
+
+        # Only this thread writes in its shard, no lock needed
+        epoch = self._epochs.get(key, 0)
+        entry = shard.get(key)
+        if entry is None or entry[0] != epoch:
+            shard[key] = [epoch, value]
+        else:
+            entry[1] += value
+        self.generation = self.versions[key] = _next_generation()
+
+    def _merge(self):
+        """ Returns a dict with the values of all the shards added to the
+            base values
+        """
+
+        with self.mutex:
+            # Threads that finished will not write again, move their shard
+            # to the base values
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge_shard(self.values.store, self._epochs, shard)
+            self._shards = alive
+
+            result = self.values.store.copy()
+            epochs = self._epochs.copy()
+            shards = [shard.copy() for thread, shard in alive]
+
+        for shard in shards:
+            self._merge_shard(result, epochs, shard)
+
+        return result
+
+    @staticmethod
+    def _merge_shard(values, epochs, shard):
+        for key, (epoch, value) in shard.items():
+            if epoch == epochs.get(key, 0):
+                values[key] = values.get(key, 0) + value
+
+
+class ShardedCounterChild(DelegatedChildMixin, CounterChild):
+    """ Sharded counter bound to one labels set"""
+
+
+class ShardedCounter(ShardedMixin, Counter):
+    """ Counter that doesn't lock on increments, see ShardedMixin. Use it on
+        counters incremented from many threads at the same time
+    """
+
+    CHILD_CLASS = ShardedCounterChild
+
+
+class ShardedGaugeChild(DelegatedChildMixin, GaugeChild):
+    """ Sharded gauge bound to one labels set"""
+
+
+class ShardedGauge(ShardedMixin, Gauge):
+    """ Gauge that doesn't lock on increments and decrements, see
+        ShardedMixin. Use it on gauges updated from many threads at the same
+        time
+    """
+
+    CHILD_CLASS = ShardedGaugeChild
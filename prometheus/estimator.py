@@ -0,0 +1,192 @@
+import math
+
+import quantile
+
+
+class BufferedEstimator(quantile.Estimator):
+    """ Estimator with the same algorithm and invariants of
+        quantile.Estimator but faster. The observations are appended to a flat
+        buffer that is sorted and merged in the samples in a single pass only
+        when it's full or the estimator is queried, the samples are kept in a
+        list instead of a linked list and queries without new observations
+        don't compress the samples again.
+
+        The samples are lists of value, rank and delta.
+    """
+
+    BUFFER_SIZE = 512
+
+    def __init__(self, *invariants):
+        super().__init__(*invariants)
+        self._samples = []
+
+    def observe(self, value):
+        """Samples an observation's value."""
+
+        self._buffer.append(value)
+        if len(self._buffer) >= self.BUFFER_SIZE:
+            self._flush()
+
+        self._observations += 1
+        self._sum += value
+
+    def observe_many(self, values):
+        """Samples multiple observation values (a list of numbers)."""
+
+        start = 0
+        while start < len(values):
+            end = start + self.BUFFER_SIZE - len(self._buffer)
+            chunk = values[start:end]
+            start = end
+
+            self._buffer.extend(chunk)
+            # Like observe, the value that fills the buffer is counted after
+            # the flush
+            if len(self._buffer) >= self.BUFFER_SIZE:
+                self._observations += len(chunk) - 1
+                self._flush()
+                self._observations += 1
+            else:
+                self._observations += len(chunk)
+
+            self._sum += sum(chunk)
+
+    def copy(self):
+        """ Returns an estimator with the same observations that doesn't
+            share anything with this one, the queries of the copy flush its
+            own buffer
+        """
+
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(self.__dict__)
+        result._buffer = list(self._buffer)
+        result._samples = [list(i) for i in self._samples]
+
+        return result
+
+    def query(self, rank):
+        """Retrieves the value estimate for the requested quantile rank."""
+
+        self._flush()
+
+        samples = self._samples
+        if not samples:
+            return 0
+
+        n = self._observations
+        mid_rank = math.floor(rank * n)
+        max_rank = mid_rank + math.floor(self._invariant(mid_rank, n) / 2)
+
+        rank = 0.0
+        for i in range(len(samples) - 1):
+            rank += samples[i][1]
+            successor = samples[i + 1]
+            if rank + successor[1] + successor[2] > max_rank:
+                return samples[i][0]
+
+        return samples[-1][0]
+
+    def _flush(self):
+        """Commits all pending values into the samples (if any)."""
+
+        if not self._buffer:
+            return
+
+        self._buffer.sort()
+        self._replace_batch()
+        self._buffer = []
+        self._compress()
+
+    def _invariant_fn(self):
+        """ Returns the invariant function for the current observations,
+            with the constants precomputed
+        """
+
+        n = self._observations
+        invariants = [(math.floor(i._quantile * n), i._coefficient_i,
+                       i._coefficient_ii) for i in self._invariants]
+        floor = math.floor
+
+        def invariant(rank):
+            minimum = n + 1
+            for quantile_rank, coefficient_i, coefficient_ii in invariants:
+                if rank <= quantile_rank:
+                    delta = coefficient_i * (n - rank)
+                else:
+                    delta = coefficient_ii * rank
+                if delta < minimum:
+                    minimum = delta
+            return floor(minimum)
+
+        return invariant
+
+    def _replace_batch(self):
+        """ Merges the sorted buffer in the samples. The old samples are
+            walked once: the ones already passed are in the result and the
+            ones inserted after the current sample are in a stack.
+        """
+
+        invariant = self._invariant_fn()
+        buffer = self._buffer
+        old = self._samples
+
+        if not old:
+            old = [[buffer[0], 1, 0]]
+            buffer = buffer[1:]
+
+        result = [old[0]]
+        next_old = 1
+        inserted = []
+        rank = 0.0
+
+        for b in buffer:
+            # New head
+            if b < result[0][0]:
+                result.insert(0, [b, 1, 0])
+
+            current = result[-1]
+            while current[0] < b and (inserted or next_old < len(old)):
+                rank += current[1]
+                if inserted:
+                    current = inserted.pop()
+                else:
+                    current = old[next_old]
+                    next_old += 1
+                result.append(current)
+
+            # The last one has a successor before the insertion
+            if not inserted and next_old == len(old):
+                inserted.append([b, 1, 0])
+
+            inserted.append([b, 1, invariant(rank) - 1])
+
+        inserted.reverse()
+        result.extend(inserted)
+        result.extend(old[next_old:])
+        self._samples = result
+
+    def _compress(self):
+        """Prunes the cataloged observations."""
+
+        invariant = self._invariant_fn()
+        samples = self._samples
+        result = []
+        rank = 0.0
+        i = 0
+        last = len(samples) - 1
+
+        while i <= last:
+            current = samples[i]
+            if i < last:
+                successor = samples[i + 1]
+                if current[1] + successor[1] + successor[2] <= invariant(rank):
+                    current[0] = successor[0]
+                    current[1] += successor[1]
+                    current[2] = successor[2]
+                    i += 1
+
+            result.append(current)
+            rank += current[1]
+            i += 1
+
+        self._samples = result
@@ -1,22 +1,196 @@
-from http.server import BaseHTTPRequestHandler
+import functools
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Empty, Queue
+import selectors
+import socket
+from threading import Lock, Thread
+import time
+import zlib
 
 
 from prometheus.negotiator import Negotiator
 
+# zlib window bits of the compressed responses (by content encoding)
+COMPRESSION_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def compress(chunks, encoding, level=6):
+    """ Compresses the chunks incrementally with the content encoding (gzip
+        or deflate), yielding the compressed data as it's ready. It yields
+        once per chunk (empty if zlib didn't output anything yet), so the
+        consumers can do something else between the chunks
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                  COMPRESSION_WBITS[encoding])
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+
+    yield compressor.flush()
+
+
+class ResponseCache(object):
+    """ Stores the responses (by format and content encoding) so the
+        requests of several Prometheus servers share one marshall and
+        compression. A response is used again if it's younger than max_age
+        (in seconds) or the registry didn't change since it was created. A
+        cache is for the responses of one registry
+    """
+
+    def __init__(self, max_age=1):
+        self.max_age = max_age
+        self.mutex = Lock()
+        self.responses = {}
+
+        # A lock per key, the requests wait only for the creation of their
+        # own response
+        self.locks = {}
+
+    def _valid_response(self, key, generation):
+        """ Returns the stored response if it's still valid for the
+            generation of the registry, None if not (call with the mutex)
+        """
+
+        try:
+            created, response_generation, response = self.responses[key]
+        except KeyError:
+            return None
+
+        if time.monotonic() - created < self.max_age or (
+                generation is not None and generation == response_generation):
+            return response
+        return None
+
+    def get(self, key, generation, create):
+        """ Returns the response stored with the key if it's still valid for
+            the generation of the registry, if not it's created (calling
+            create) and stored. The requests of a response being created wait
+            for it, the requests of other keys don't
+        """
+
+        with self.mutex:
+            response = self._valid_response(key, generation)
+            if response is not None:
+                return response
+            lock = self.locks.setdefault(key, Lock())
+
+        with lock:
+            # Maybe created by the request we were waiting for
+            with self.mutex:
+                response = self._valid_response(key, generation)
+            if response is not None:
+                return response
+
+            now = time.monotonic()
+            response = create()
+            with self.mutex:
+                self.responses[key] = (now, generation, response)
+
+            return response
+
 
 class PrometheusMetricHandler(BaseHTTPRequestHandler):
 
     METRICS_PATH = "/metrics"
 
-    def __init__(self, registry, *args, **kwargs):
+    # Sort the collectors and the lines of the response, set it to False if
+    # the order doesn't matter to save the sorting
+    ORDERED = True
+
+    # zlib level of the compressed responses
+    COMPRESSION_LEVEL = 6
+
+    # Needed by the chunked responses and the keep-alive connections
+    protocol_version = "HTTP/1.1"
+
+    # Seconds of an idle keep-alive connection (or a stalled client) before
+    # it's closed
+    timeout = 30
+
+    def __init__(self, registry, *args, cache=None, **kwargs):
+        """ cache is a ResponseCache to share the responses between the
+            requests
+        """
         self.registry = registry
+        self.cache = cache
+
+        # The connection is kept alive but its next request isn't here yet,
+        # the server waits for it without holding a worker
+        self.idle = False
 
         super().__init__(*args, **kwargs)
 
+    def handle(self):
+        """ Handles the requests of the connection that are already sent, if
+            the connection is kept alive the next ones are handled by new
+            handlers when they arrive (with a PrometheusHTTPServer, the other
+            servers keep the handler until the connection is closed)
+        """
+
+        if not isinstance(self.server, PrometheusHTTPServer):
+            super().handle()
+            return
+
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self._request_ready():
+                self.idle = True
+                return
+            self.handle_one_request()
+
+    def _request_ready(self):
+        """ Returns if the next request (or a part of it) was received,
+            without waiting for it
+        """
+
+        # Maybe it's already read in the buffer of rfile
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _marshall_iter(self, formatter):
+        """ Marshalls a snapshot of the registry taken when the first chunk
+            is requested, the collectors are locked only to copy their values
+        """
+        yield from formatter.marshall_iter(self.registry.snapshot())
+
     def do_GET(self):
         if self.path == self.METRICS_PATH:
             # select formatter (without timestamp)
-            formatter = Negotiator.negotiate(self.headers)(False)
+            formatter_class, encoding = Negotiator.negotiate_response(
+                self.headers)
+            formatter = formatter_class(False, ordered=self.ORDERED)
+
+            # Get the juice! (without building the whole response)
+            chunks = self._marshall_iter(formatter)
+            if encoding is not None:
+                chunks = compress(chunks, encoding, self.COMPRESSION_LEVEL)
+
+            content_length = None
+            if self.cache is not None:
+                # The generation is taken before the marshall, updates during
+                # it make the response stale
+                generation = self.registry.generation()
+                key = (type(formatter), self.ORDERED, encoding)
+                response = self.cache.get(key, generation,
+                                          lambda: b"".join(chunks))
+                chunks = [response]
+                content_length = len(response)
+
+            # HTTP/1.0 clients don't understand chunks, the end of the
+            # response is the end of the connection
+            chunked = content_length is None and \
+                self.request_version != "HTTP/1.0"
+            if content_length is None and not chunked:
+                self.close_connection = True
 
             # Response OK
             self.send_response(200)
@@ -24,14 +198,161 @@ class PrometheusMetricHandler(BaseHTTPRequestHandler):
             # Add headers (type, encoding... and stuff)
             for k, v in formatter.get_headers().items():
                 self.send_header(k, v)
+            if encoding is not None:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Vary", "Accept-Encoding")
+            if content_length is not None:
+                self.send_header("Content-Length", content_length)
+            elif chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            if self.close_connection:
+                self.send_header("Connection", "close")
             self.end_headers()
 
-            # Get the juice and serve!
-            response = formatter.marshall(self.registry)
+            # Serve!
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if chunked:
+                    chunk = b"".join((
+                        "{0:x}\r\n".format(len(chunk)).encode("ascii"),
+                        chunk, b"\r\n"))
+                self.wfile.write(chunk)
 
-            # Maybe is protobuf bytes
-            if isinstance(response, str):
-                response = response.encode("utf8")
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_error(404)
 
-            self.wfile.write(response)
-            return
+
+class PrometheusHTTPServer(HTTPServer):
+    """ HTTP server that handles the requests in a bounded pool of worker
+        threads (daemon threads), a slow scraper doesn't block the others.
+        The connections over the number of workers wait for a free one. The
+        kept-alive connections wait for their next request in a selector,
+        without holding a worker
+    """
+
+    def __init__(self, server_address, handler_class, workers=8):
+        super().__init__(server_address, handler_class)
+
+        self.workers = workers
+        self.connections = Queue()
+        for i in range(workers):
+            Thread(target=self._work, daemon=True).start()
+
+        # Idle connections to wait for (the selector is only used by its
+        # thread, it's woken up to take them)
+        self.idle_connections = Queue()
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self.selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        Thread(target=self._wait_idle, daemon=True).start()
+
+    def _work(self):
+        while True:
+            request, client_address = self.connections.get()
+            if request is None:
+                return
+            self.process_request_thread(request, client_address)
+
+    def _wait_idle(self):
+        """ Waits for the next requests of the idle connections and queues
+            them for the workers, closes the ones idle for longer than their
+            timeout
+        """
+
+        deadlines = {}
+        while True:
+            # Without a deadline (handlers without timeout) it waits for the
+            # connections
+            timeout = None
+            deadline = min((d for a, d in deadlines.values()),
+                           default=float("inf"))
+            if deadline != float("inf"):
+                timeout = max(0, deadline - time.monotonic())
+
+            for key, events in self.selector.select(timeout):
+                if key.fileobj is self._wakeup_reader:
+                    self._wakeup_reader.recv(4096)
+                    continue
+                self.selector.unregister(key.fileobj)
+                client_address, deadline = deadlines.pop(key.fileobj)
+                self.connections.put((key.fileobj, client_address))
+
+            while True:
+                try:
+                    request, client_address, timeout = \
+                        self.idle_connections.get_nowait()
+                except Empty:
+                    break
+                if request is None:
+                    for i in deadlines:
+                        self.shutdown_request(i)
+                    self.selector.close()
+                    self._wakeup_reader.close()
+                    self._wakeup_writer.close()
+                    return
+                self.selector.register(request, selectors.EVENT_READ)
+                deadline = time.monotonic() + (
+                    timeout if timeout is not None else float("inf"))
+                deadlines[request] = (client_address, deadline)
+
+            now = time.monotonic()
+            for request in [k for k, v in deadlines.items() if v[1] <= now]:
+                self.selector.unregister(request)
+                del deadlines[request]
+                self.shutdown_request(request)
+
+    def _wait_request(self, request, client_address, timeout):
+        self.idle_connections.put((request, client_address, timeout))
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            # The server is closed
+            if request is not None:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self.connections.put((request, client_address))
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def process_request_thread(self, request, client_address):
+        """ Same as socketserver.ThreadingMixIn but in a worker, the idle
+            connections are kept to wait for their next request
+        """
+        try:
+            handler = self.finish_request(request, client_address)
+            if getattr(handler, 'idle', False):
+                self._wait_request(request, client_address, handler.timeout)
+                return
+        except Exception:
+            self.handle_error(request, client_address)
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+
+        # Stop the workers after the waiting connections, and close the idle
+        # connections
+        for i in range(self.workers):
+            self.connections.put((None, None))
+        self._wait_request(None, None, None)
+
+
+def start_http_server(registry, port, addr="", workers=8, cache=None,
+                      handler_class=PrometheusMetricHandler):
+    """ Starts a PrometheusHTTPServer serving the registry in a daemon
+        thread, returns the server (call shutdown and server_close to stop
+        it). cache is a ResponseCache shared by the requests
+    """
+
+    handler = functools.partial(handler_class, registry, cache=cache)
+    server = PrometheusHTTPServer((addr, port), handler, workers=workers)
+
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
@@ -1,11 +1,12 @@
 from abc import ABCMeta, abstractmethod
-import collections
-
-from google.protobuf.internal import encoder
+import itertools
+import os
 
 from prometheus import collectors
 from prometheus import utils
+from prometheus import wire
 from prometheus.pb2 import metrics_pb2
+from prometheus.registry import RegistrySnapshot
 
 
 class PrometheusFormat(object):
@@ -41,11 +42,31 @@ class PrometheusFormat(object):
         """
         pass
 
+    @abstractmethod
+    def _format_histogram(self, histogram, name):
+        """ Returns a representation of a histogram value in the implemented
+            format. Receives a tuple with the labels (a dict) as first element
+            and the value as a second element
+        """
+        pass
+
     @abstractmethod
     def marshall(self, registry):
         """ Marshalls a registry and returns the storage/transfer format """
         pass
 
+    def marshall_iter(self, registry):
+        """ Marshalls a registry and yields the storage/transfer format in
+            chunks of bytes, by default only one with the full marshall
+        """
+        response = self.marshall(registry)
+
+        # Maybe is protobuf bytes
+        if isinstance(response, str):
+            response = response.encode("utf8")
+
+        yield response
+
 
 class TextFormat(PrometheusFormat):
     # Header information
@@ -67,9 +88,14 @@ class TextFormat(PrometheusFormat):
         'count': "{name}_count{labels} {value} {timestamp}",
     }
 
-    def __init__(self, timestamp=False):
-        """timestamp is a boolean, if you want timestamp in each metric"""
+    def __init__(self, timestamp=False, ordered=True):
+        """ timestamp is a boolean, if you want timestamp in each metric.
+            ordered is a boolean, if you want the collectors and the lines
+            sorted, disable it to save the sorting when the order doesn't
+            matter
+        """
         self.timestamp = timestamp
+        self.ordered = ordered
 
     def get_headers(self):
         headers = {
@@ -80,66 +106,125 @@ class TextFormat(PrometheusFormat):
 
         return headers
 
-    def _format_line(self, name, labels, value, const_labels=None):
-        labels_str = ""
-        ts = ""
+    def _format_prefix(self, name, labels, const_labels=None):
+        """ Returns the name and the labels of a line"""
+
         # Unify the const_labels and labels
         # Consta labels have lower priority than labels
         labels = utils.unify_labels(labels, const_labels, True)
 
         # Create the label string
-        if labels:
-            labels_str = [TextFormat.LABEL_FMT.format(key=k, value=v)
-                          for k, v in labels.items()]
-            labels_str = TextFormat.LABEL_SEPARATOR_FMT.join(labels_str)
-            labels_str = "{{{labels}}}".format(labels=labels_str)
+        if not labels:
+            return name
+
+        labels_str = [TextFormat.LABEL_FMT.format(key=k, value=v)
+                      for k, v in labels.items()]
+        labels_str = TextFormat.LABEL_SEPARATOR_FMT.join(labels_str)
+        return "{name}{{{labels}}}".format(name=name, labels=labels_str)
 
-        if self.timestamp:
-            ts = utils.get_timestamp()
+    def _format_value(self, prefix, value, timestamp=None):
+        """ Returns a line from the (cached) prefix, only the value and the
+            timestamp are formatted on each marshall
+        """
+
+        if timestamp is not None:
+            return "{0} {1} {2}".format(prefix, value, timestamp)
+        return "{0} {1}".format(prefix, value)
 
-        result = TextFormat.COUNTER_FMT.format(name=name, labels=labels_str,
-                                               value=value, timestamp=ts)
+    def _format_counter(self, counter, name, const_labels, prefixes):
+        """ Returns the lines of a series, tuples with the key of the value
+            (None for single values) and the prefix of the line
+        """
 
-        return result.strip()
+        key = counter[0]
+        try:
+            prefix = prefixes[key]
+        except KeyError:
+            prefix = prefixes.setdefault(
+                key, self._format_prefix(name, dict(key), const_labels))
 
-    def _format_counter(self, counter, name, const_labels):
-        return self._format_line(name, counter[0], counter[1], const_labels)
+        return [(None, prefix)]
 
-    def _format_gauge(self, gauge, name, const_labels):
-        return self._format_line(name, gauge[0], gauge[1], const_labels)
+    def _format_gauge(self, gauge, name, const_labels, prefixes):
+        return self._format_counter(gauge, name, const_labels, prefixes)
 
-    def _format_summary(self, summary, name, const_labels):
+    def _format_summary(self, summary, name, const_labels, prefixes):
+        key, values = summary
         results = []
 
-        for k, v in summary[1].items():
-            # Stat from a fresh dict for the labels (new or with preset data)
-            if summary[0]:
-                labels = summary[0].copy()
-            else:
-                labels = {}
+        for k in values:
+            try:
+                prefix = prefixes[(k, key)]
+            except KeyError:
+                labels = dict(key)
+
+                # Quantiles need labels and not special name (like sum and
+                # count)
+                if type(k) is not float:
+                    name_str = "{0}_{1}".format(name, k)
+                else:
+                    labels['quantile'] = k
+                    name_str = name
+                prefix = prefixes.setdefault(
+                    (k, key), self._format_prefix(name_str, labels,
+                                                  const_labels))
+
+            results.append((k, prefix))
 
-            # Quantiles need labels and not special name (like sum and count)
-            if type(k) is not float:
-                name_str = "{0}_{1}".format(name, k)
-            else:
-                labels['quantile'] = k
-                name_str = name
-            results.append(self._format_line(name_str, labels, v,
-                                             const_labels))
+        return results
+
+    def _format_histogram(self, histogram, name, const_labels, prefixes):
+        key, values = histogram
+        results = []
+
+        # The buckets by upper bound (+Inf is the last one), the sum and the
+        # count
+        keys = sorted(k for k in values if type(k) is float)
+        keys.extend(k for k in (collectors.Histogram.SUM_KEY,
+                                collectors.Histogram.COUNT_KEY)
+                    if k in values)
+
+        for k in keys:
+            try:
+                prefix = prefixes[(k, key)]
+            except KeyError:
+                labels = dict(key)
+
+                # Buckets need the upper bound label and the bucket suffix
+                if type(k) is not float:
+                    name_str = "{0}_{1}".format(name, k)
+                else:
+                    labels[collectors.Histogram.BUCKET_LABEL] = \
+                        self._format_bound(k)
+                    name_str = "{0}_bucket".format(name)
+                prefix = prefixes.setdefault(
+                    (k, key), self._format_prefix(name_str, labels,
+                                                  const_labels))
+
+            results.append((k, prefix))
 
         return results
 
+    @staticmethod
+    def _format_bound(upper_bound):
+        if upper_bound == float("inf"):
+            return "+Inf"
+        return repr(upper_bound)
+
     def marshall_lines(self, collector):
         """ Marshalls a collector and returns the storage/transfer format in
             a tuple, this tuple has reprensentation format per element.
         """
 
-        if isinstance(collector, collectors.Counter):
+        # By the type of the collector, the snapshots have the same
+        if collector.REPR_STR == collectors.Counter.REPR_STR:
             exec_method = self._format_counter
-        elif isinstance(collector, collectors.Gauge):
+        elif collector.REPR_STR == collectors.Gauge.REPR_STR:
             exec_method = self._format_gauge
-        elif isinstance(collector, collectors.Summary):
+        elif collector.REPR_STR == collectors.Summary.REPR_STR:
             exec_method = self._format_summary
+        elif collector.REPR_STR == collectors.Histogram.REPR_STR:
+            exec_method = self._format_histogram
         else:
             raise TypeError("Not a valid object format")
 
@@ -153,36 +238,121 @@ class TextFormat(PrometheusFormat):
         # Prepare start headers
         lines = [help_header, type_header]
 
-        for i in collector.get_all():
-            r = exec_method(i, collector.name, collector.const_labels)
+        # All the lines of the collector have the timestamp of the read
+        timestamp = utils.get_timestamp() if self.timestamp else None
+
+        # The lines of the series that didn't change since they were
+        # rendered are used again, only the changed series are read and
+        # rendered (all of them with timestamps). The last lines are cached
+        # in the collector in the order of their index
+        versions = collector.get_versions()
+        rendered_index, rendered_versions, rendered_lines = \
+            collector.text_lines
+
+        index = self._lines_index(collector, versions)
+        if index is None:
+            # New series, the index is built from all of them
+            items = collector.get_items(list(versions))
+            index = self._build_lines_index(collector, items, exec_method)
+        elif timestamp is None and index is rendered_index:
+            items = collector.get_items(
+                [k for k, v in versions.items()
+                 if v is None or rendered_versions.get(k) != v])
+        else:
+            items = collector.get_items(list(versions))
+        values = dict(items)
+
+        new_lines = []
+        for i, (key, value_key, prefix) in enumerate(index):
+            if key not in values:
+                new_lines.append(rendered_lines[i])
+                continue
 
-            # Check if it returns one or multiple lines
-            if not isinstance(r, str) and isinstance(r, collections.Iterable):
-                lines.extend(r)
-            else:
-                lines.append(r)
+            value = values[key]
+            if value_key is not None:
+                value = value[value_key]
+            new_lines.append(self._format_value(prefix, value, timestamp))
+
+        if timestamp is None:
+            collector.text_lines = (index, versions, new_lines)
 
+        lines.extend(new_lines)
         return lines
 
+    def _lines_index(self, collector, keys):
+        """ Returns the lines of the collector as tuples with the key of the
+            series, the key of the value and the prefix of the line, cached
+            in the collector. None if the series changed
+        """
+
+        index, index_keys, ordered = collector.text_index
+        if ordered == self.ordered and len(index_keys) == len(keys) and \
+                index_keys.issuperset(keys):
+            return index
+
+        return None
+
+    def _build_lines_index(self, collector, items, exec_method):
+        """ Builds and caches the index of the lines (see _lines_index). If
+            the format is ordered they are sorted by prefix (the same order
+            as sorting the lines), but the lines of each histogram series go
+            together in the order of its buckets. The index is only built
+            (and sorted) again when the series change
+        """
+
+        # The name and labels of each series are rendered once and cached in
+        # the collector
+        prefixes = collector.text_prefixes
+
+        series = []
+        for i in items:
+            series.append([(i[0], value_key, prefix)
+                           for value_key, prefix in exec_method(
+                               i, collector.name, collector.const_labels,
+                               prefixes)])
+
+        if not self.ordered:
+            index = list(itertools.chain.from_iterable(series))
+        elif collector.REPR_STR == collectors.Histogram.REPR_STR:
+            # By the labels of the series, their first lines are the buckets
+            # of the same upper bound
+            series.sort(key=lambda s: s[0][2])
+            index = list(itertools.chain.from_iterable(series))
+        else:
+            index = sorted(itertools.chain.from_iterable(series),
+                           key=lambda l: l[2])
+
+        collector.text_index = (index, frozenset(k for k, v in items),
+                                self.ordered)
+
+        return index
+
     def marshall_collector(self, collector):
-        # need sort?
-        result = sorted(self.marshall_lines(collector))
-        return self.__class__.LINE_SEPARATOR_FMT.join(result)
+        return self.__class__.LINE_SEPARATOR_FMT.join(
+            self.marshall_lines(collector))
+
+    def _marshall_blocks(self, registry):
+        """ Yields the block of each collector (ended with a line separator)
+            ordered by name if the format is ordered
+        """
+
+        # The blocks start with the name so this is the same order as sorting
+        # the blocks
+        for i in registry.get_all(ordered=self.ordered):
+            yield self.marshall_collector(i) + self.__class__.LINE_SEPARATOR_FMT
 
     def marshall(self, registry):
         """Marshalls a full registry (various collectors)"""
 
-        blocks = []
-        for i in registry.get_all():
-            blocks.append(self.marshall_collector(i))
+        return "".join(self._marshall_blocks(registry))
 
-        # Sort? used in tests
-        blocks = sorted(blocks)
-
-        # Needs EOF
-        blocks.append("")
+    def marshall_iter(self, registry):
+        """ Marshalls a full registry yielding the encoded block of each
+            collector, only one block is in memory at a time
+        """
 
-        return self.__class__.LINE_SEPARATOR_FMT.join(blocks)
+        for block in self._marshall_blocks(registry):
+            yield block.encode("utf8")
 
 
 class ProtobufFormat(PrometheusFormat):
@@ -193,9 +363,12 @@ class ProtobufFormat(PrometheusFormat):
     VERSION = '0.0.4'
     LINE_SEPARATOR_FMT = "\n"
 
-    def __init__(self, timestamp=False):
-        """timestamp is a boolean, if you want timestamp in each metric"""
+    def __init__(self, timestamp=False, ordered=True):
+        """ timestamp is a boolean, if you want timestamp in each metric.
+            ordered is a boolean, if you want the collectors sorted by name
+        """
         self.timestamp = timestamp
+        self.ordered = ordered
 
     def get_headers(self):
         headers = {
@@ -208,78 +381,89 @@ class ProtobufFormat(PrometheusFormat):
 
         return headers
 
-    def _create_pb2_labels(self, labels):
-        result = []
-        for k, v in labels.items():
-            l = metrics_pb2.LabelPair(name=k, value=str(v))
-            result.append(l)
-        return result
-
-    def _format_counter(self, counter, name, const_labels):
-        labels = utils.unify_labels(counter[0], const_labels, ordered=True)
+    def _series_labels(self, collector, key):
+        """ Returns the encoded label pairs of a series, the labels and the
+            const labels sorted by name. They are encoded once and cached in
+            the collector, label sets almost never change
+        """
 
-        # With a counter and labelpairs we do a Metric
-        pb2_labels = self._create_pb2_labels(labels)
-        counter = metrics_pb2.Counter(value=counter[1])
+        labels_cache = collector.protobuf_labels
+        try:
+            return labels_cache[key]
+        except KeyError:
+            labels = utils.unify_labels(dict(key), collector.const_labels,
+                                        ordered=True)
+            return labels_cache.setdefault(key, wire.encode_labels(labels))
+
+    def _format_counter(self, counter, labels):
+        """ Returns the Metric of a counter value with the encoded label
+            pairs of the series
+        """
 
-        metric = metrics_pb2.Metric(label=pb2_labels, counter=counter)
-        if self.timestamp:
-            metric.timestamp_ms = utils.get_timestamp()
+        # The label pairs are parsed from the cached encoding instead of
+        # creating them from the labels
+        metric = metrics_pb2.Metric.FromString(labels)
+        metric.counter.value = counter
 
         return metric
 
-    def _format_gauge(self, gauge, name, const_labels):
-        labels = utils.unify_labels(gauge[0], const_labels, ordered=True)
-
-        pb2_labels = self._create_pb2_labels(labels)
-        gauge = metrics_pb2.Gauge(value=gauge[1])
+    def _format_gauge(self, gauge, labels):
+        metric = metrics_pb2.Metric.FromString(labels)
+        metric.gauge.value = gauge
 
-        metric = metrics_pb2.Metric(label=pb2_labels, gauge=gauge)
-        if self.timestamp:
-            metric.timestamp_ms = utils.get_timestamp()
         return metric
 
-    def _format_summary(self, summary, name, const_labels):
-        labels = utils.unify_labels(summary[0], const_labels, ordered=True)
-
-        pb2_labels = self._create_pb2_labels(labels)
+    def _format_summary(self, summary, labels):
+        metric = metrics_pb2.Metric.FromString(labels)
+        metric.summary.sample_count = summary['count']
+        metric.summary.sample_sum = summary['sum']
 
         # Create the quantiles
-        quantiles = []
-
-        for k, v in summary[1].items():
+        for k, v in summary.items():
             if not isinstance(k, str):
-                q = metrics_pb2.Quantile(quantile=k, value=v)
-                quantiles.append(q)
+                metric.summary.quantile.add(quantile=k, value=v)
+
+        return metric
 
-        summary = metrics_pb2.Summary(sample_count=summary[1]['count'],
-                                      sample_sum=summary[1]['sum'],
-                                      quantile=quantiles)
+    def _format_histogram(self, histogram, labels):
+        metric = metrics_pb2.Metric.FromString(labels)
+        metric.histogram.sample_count = histogram['count']
+        metric.histogram.sample_sum = histogram['sum']
 
-        metric = metrics_pb2.Metric(label=pb2_labels, summary=summary)
-        if self.timestamp:
-            metric.timestamp_ms = utils.get_timestamp()
+        # Create the buckets, the +Inf one is implicit (the sample count)
+        for k, v in sorted((k, v) for k, v in histogram.items()
+                           if not isinstance(k, str)):
+            if k != float("inf"):
+                metric.histogram.bucket.add(cumulative_count=v, upper_bound=k)
 
         return metric
 
     def marshall_collector(self, collector):
 
-        if isinstance(collector, collectors.Counter):
+        if collector.REPR_STR == collectors.Counter.REPR_STR:
             metric_type = metrics_pb2.COUNTER
             exec_method = self._format_counter
-        elif isinstance(collector, collectors.Gauge):
+        elif collector.REPR_STR == collectors.Gauge.REPR_STR:
             metric_type = metrics_pb2.GAUGE
             exec_method = self._format_gauge
-        elif isinstance(collector, collectors.Summary):
+        elif collector.REPR_STR == collectors.Summary.REPR_STR:
             metric_type = metrics_pb2.SUMMARY
             exec_method = self._format_summary
+        elif collector.REPR_STR == collectors.Histogram.REPR_STR:
+            metric_type = metrics_pb2.HISTOGRAM
+            exec_method = self._format_histogram
         else:
             raise TypeError("Not a valid object format")
 
         metrics = []
 
-        for i in collector.get_all():
-            r = exec_method(i, collector.name, collector.const_labels)
+        # All the metrics of the collector have the timestamp of the read
+        timestamp = utils.get_timestamp() if self.timestamp else None
+
+        for key, value in collector.get_items():
+            r = exec_method(value, self._series_labels(collector, key))
+            if timestamp is not None:
+                r.timestamp_ms = timestamp
             metrics.append(r)
 
         pb2_collector = metrics_pb2.MetricFamily(name=collector.name,
@@ -288,20 +472,122 @@ class ProtobufFormat(PrometheusFormat):
                                                  metric=metrics)
         return pb2_collector
 
-    def marshall(self, registry):
-        """Returns bytes"""
-        result = b""
+    def _encode_counter(self, counter):
+        return wire.METRIC_COUNTER, wire.encode_value(counter)
+
+    def _encode_gauge(self, gauge):
+        return wire.METRIC_GAUGE, wire.encode_value(gauge)
+
+    def _encode_summary(self, summary):
+        quantiles = [(k, v) for k, v in summary.items()
+                     if not isinstance(k, str)]
+
+        return wire.METRIC_SUMMARY, wire.encode_summary(
+            summary['count'], summary['sum'], quantiles)
+
+    def _encode_histogram(self, histogram):
+        # The +Inf bucket is implicit (the sample count)
+        buckets = sorted((k, v) for k, v in histogram.items()
+                         if not isinstance(k, str) and k != float("inf"))
+
+        return wire.METRIC_HISTOGRAM, wire.encode_histogram(
+            histogram['count'], histogram['sum'], buckets)
+
+    @staticmethod
+    def _split_changed(cache, versions, timestamp=None):
+        """ Returns the cached metrics of the series that didn't change (by
+            key) and the keys of the changed ones. The cache maps the keys to
+            the version and the encoded metric of the series, the metrics
+            with a timestamp are never used again
+        """
+
+        rendered = {}
+        changed = []
+        if timestamp is not None:
+            return rendered, list(versions)
+
+        for key, version in versions.items():
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version and \
+                    version is not None:
+                rendered[key] = entry[1]
+            else:
+                changed.append(key)
+
+        return rendered, changed
+
+    def serialize_collector(self, collector):
+        """ Returns the serialized MetricFamily of a collector, the same bytes
+            as marshall_collector(collector).SerializeToString() but encoded
+            directly without the metrics_pb2 objects
+        """
 
-        for i in registry.get_all():
+        if collector.REPR_STR == collectors.Counter.REPR_STR:
+            metric_type = metrics_pb2.COUNTER
+            exec_method = self._encode_counter
+        elif collector.REPR_STR == collectors.Gauge.REPR_STR:
+            metric_type = metrics_pb2.GAUGE
+            exec_method = self._encode_gauge
+        elif collector.REPR_STR == collectors.Summary.REPR_STR:
+            metric_type = metrics_pb2.SUMMARY
+            exec_method = self._encode_summary
+        elif collector.REPR_STR == collectors.Histogram.REPR_STR:
+            metric_type = metrics_pb2.HISTOGRAM
+            exec_method = self._encode_histogram
+        else:
+            raise TypeError("Not a valid object format")
+
+        timestamp = utils.get_timestamp() if self.timestamp else None
+
+        # The metrics of the series that didn't change since they were
+        # encoded are used again, only the changed series are read and
+        # encoded (all of them with timestamps)
+        versions = collector.get_versions()
+        encoded, changed = self._split_changed(collector.protobuf_metrics,
+                                               versions, timestamp)
+
+        for key, value in collector.get_items(changed):
+            field, message = exec_method(value)
+            encoded[key] = wire.encode_metric(
+                self._series_labels(collector, key), field, message,
+                timestamp)
+            if timestamp is None and versions[key] is not None:
+                collector.protobuf_metrics[key] = (versions[key],
+                                                   encoded[key])
+
+        # In the order of the series
+        metrics = [encoded[k] for k in versions]
+
+        return wire.encode_metric_family(collector.name, collector.help_text,
+                                         metric_type, metrics)
+
+    def _marshall_messages(self, registry):
+        """ Yields the size prefix and the serialized message of each
+            collector
+        """
+
+        for i in registry.get_all(ordered=self.ordered):
             # Each message needs to be prefixed with a varint with the size of
             # the message (MetrycType)
             # https://github.com/matttproud/golang_protobuf_extensions/blob/master/ext/encode.go
             # http://zombietetris.de/blog/building-your-own-writedelimitedto-for-python-protobuf/
-            body = self.marshall_collector(i).SerializeToString()
-            msg = encoder._VarintBytes(len(body)) + body
-            result += msg
+            body = self.serialize_collector(i)
+            yield wire.varint(len(body)), body
+
+    def marshall(self, registry):
+        """Returns bytes"""
+
+        # Joined once, concatenating each message to the result is quadratic
+        return b"".join(itertools.chain.from_iterable(
+            self._marshall_messages(registry)))
 
-        return result
+    def marshall_iter(self, registry):
+        """ Marshalls a full registry yielding the delimited message of each
+            collector, only one message is in memory at a time
+        """
+
+        for size, body in self._marshall_messages(registry):
+            yield size + body
 
 
 class ProtobufTextFormat(ProtobufFormat):
@@ -309,10 +595,66 @@ class ProtobufTextFormat(ProtobufFormat):
 
     ENCODING = 'test'
 
-    def marshall(self, registry):
-        blocks = []
+    def _marshall_blocks(self, registry):
+        """ Yields the text of each collector, the ones after the first
+            start with a line separator
+        """
 
-        for i in registry.get_all():
-            blocks.append(str(self.marshall_collector(i)))
+        separator = ""
+        for i in registry.get_all(ordered=self.ordered):
+            yield separator + str(self.marshall_collector(i))
+            separator = self.__class__.LINE_SEPARATOR_FMT
 
-        return self.__class__.LINE_SEPARATOR_FMT.join(blocks)
+    def marshall(self, registry):
+        return "".join(self._marshall_blocks(registry))
+
+    def marshall_iter(self, registry):
+        for block in self._marshall_blocks(registry):
+            yield block.encode("utf8")
+
+
+def _marshall_partition(formatter, snapshots, collectors_number):
+    """ Marshalls a partition of collector snapshots (in a worker process),
+        the process keeps the caches of the collectors of one registry at
+        most (collectors_number)
+    """
+
+    result = b"".join(formatter.marshall_iter(RegistrySnapshot(snapshots)))
+    collectors.evict_unpickled_collectors(collectors_number)
+
+    return result
+
+
+def marshall_parallel(formatter, registry, executor, partitions=None):
+    """ Marshalls a snapshot of the registry in the processes of the
+        executor (a concurrent.futures.ProcessPoolExecutor), for very big
+        registries. The collectors are split in partitions (one per CPU by
+        default) of consecutive collectors with about the same number of
+        series, the result is the same bytes as marshall_iter joined. Only
+        TextFormat and ProtobufFormat (delimited). The processes keep the
+        caches of the collectors they marshalled (see
+        CollectorSnapshot.__setstate__), so only the changed series are
+        rendered again when they get the same collectors
+    """
+
+    if isinstance(formatter, ProtobufTextFormat) or \
+            not isinstance(formatter, (TextFormat, ProtobufFormat)):
+        raise TypeError("Not a valid format for a parallel marshall")
+
+    snapshots = registry.snapshot().get_all(ordered=formatter.ordered)
+    partitions = partitions or os.cpu_count() or 1
+
+    # Each partition gets the collectors until it has its part of the series
+    series = sum(len(i.values) for i in snapshots)
+    parts = [[] for i in range(partitions)]
+    position = 0
+    for i in snapshots:
+        parts[min(position * partitions // max(series, 1),
+                  partitions - 1)].append(i)
+        position += len(i.values)
+
+    # In the order of the partitions
+    futures = [executor.submit(_marshall_partition, formatter, i,
+                               len(snapshots))
+               for i in parts if i]
+    return b"".join(i.result() for i in futures)
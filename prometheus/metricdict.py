@@ -1,23 +1,21 @@
 import collections
-import json
-import re
-
-
-# Sometimes python will access by string for example iterating objects, and
-# it has this notation
-regex = re.compile("\{.*:.*,?\}")
 
 
 # http://stackoverflow.com/questions/3387691/python-how-to-perfectly-override-a-dict
 class MetricDict(collections.MutableMapping):
     """ MetricDict stores the data based on the labels so we need to generate
-        custom hash keys based on the labels
+        custom hash keys based on the labels. The keys are interned tuples of
+        (name, value) pairs sorted by name, the values are kept as text
     """
 
-    EMPTY_KEY = "__EMPTY__"
+    EMPTY_KEY = ()
 
     def __init__(self, *args, **kwargs):
         self.store = dict()
+
+        # Maps the labels items (as they come) to their interned key, so the
+        # labels are only sorted the first time
+        self.keys_cache = dict()
         self.update(dict(*args, **kwargs))
 
     def __getitem__(self, key):
@@ -35,18 +33,45 @@ class MetricDict(collections.MutableMapping):
     def __len__(self):
         return len(self.store)
 
+    def add(self, key, value):
+        """ Adds the value to the stored one (0 if isn't present)
+            transforming the key only once
+        """
+        key = self.__keytransform__(key)
+        self.store[key] = self.store.get(key, 0) + value
+
     def __keytransform__(self, key):
 
         # Sometimes we need empty keys
-        if not key or key == MetricDict.EMPTY_KEY:
+        if not key:
             return MetricDict.EMPTY_KEY
 
-        # Python accesses by string key so we allow if is str and
-        # 'our custom' format
-        if type(key) == str and regex.match(key):
+        # Python accesses by the transformed key for example iterating
+        # objects, so we allow them
+        if type(key) is tuple:
             return key
 
         if type(key) is not dict:
             raise TypeError("Only accepts dicts as keys")
 
-        return json.dumps(key, sort_keys=True)
+        items = tuple(key.items())
+        try:
+            return self.keys_cache[items]
+        except KeyError:
+            pass
+
+        # 1, 1.0 and True are the same dict key but different label values,
+        # the values are compared by their text (only the str items are
+        # cached so they don't match the other types)
+        if not all(type(v) is str for k, v in items):
+            items = tuple((k, str(v)) for k, v in items)
+            try:
+                return self.keys_cache[items]
+            except KeyError:
+                pass
+
+        # Intern the key so all the label orders share the same one
+        sorted_items = tuple(sorted(items))
+        result = self.keys_cache.setdefault(sorted_items, sorted_items)
+        self.keys_cache[items] = result
+        return result
@@ -0,0 +1,468 @@
+""" Multiprocess mode, for pre-fork servers where each worker process has its
+    own collectors. Each process writes its values in memory mapped files
+    in a shared directory (set with the PROMETHEUS_MULTIPROC_DIR environment
+    variable) and MultiProcessRegistry merges all the files when the metrics
+    are collected.
+"""
+
+import collections
+import glob
+import json
+import mmap
+import os
+import struct
+from threading import Lock
+
+from prometheus import collectors
+from prometheus import utils
+from prometheus.registry import Registry
+
+DIRECTORY_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Gauges merge modes
+GAUGE_ALL = "all"  # One value per process (pid label)
+GAUGE_SUM = "sum"
+GAUGE_MAX = "max"
+GAUGE_MIN = "min"
+GAUGE_MODES = (GAUGE_ALL, GAUGE_SUM, GAUGE_MAX, GAUGE_MIN)
+
+PID_LABEL = "pid"
+
+# Used so only one thread opens the files of the process
+files_mutex = Lock()
+files = {}
+
+
+class MmapedDict(object):
+    """ A dict of doubles backed by a memory mapped file, only one process
+        writes on it but any process can read it.
+
+        The file starts with the used bytes (4 bytes integer and 4 bytes of
+        padding), then each entry has the key length (4 bytes integer), the
+        utf-8 key padded so the value is 8 bytes aligned and the value
+        (8 bytes double).
+    """
+
+    INITIAL_SIZE = 1024 * 1024
+
+    def __init__(self, filename, read_only=False):
+        self.filename = filename
+        self.read_only = read_only
+        self.mutex = Lock()
+
+        # The offset of each value
+        self.positions = {}
+
+        if read_only:
+            self._f = open(filename, 'rb')
+            self.capacity = os.fstat(self._f.fileno()).st_size
+            self._m = mmap.mmap(self._f.fileno(), self.capacity,
+                                access=mmap.ACCESS_READ)
+        else:
+            self._f = open(filename, 'a+b')
+            self.capacity = os.fstat(self._f.fileno()).st_size
+            if self.capacity == 0:
+                self._f.truncate(self.__class__.INITIAL_SIZE)
+                self.capacity = self.__class__.INITIAL_SIZE
+            self._m = mmap.mmap(self._f.fileno(), self.capacity)
+
+        self.used = struct.unpack_from('i', self._m, 0)[0]
+
+        # The writer could have grown the file meanwhile
+        if self.used > self.capacity:
+            self._m.close()
+            self.capacity = os.fstat(self._f.fileno()).st_size
+            self._m = mmap.mmap(self._f.fileno(), self.capacity,
+                                access=mmap.ACCESS_READ)
+
+        if self.used == 0:
+            self.used = 8
+            if not read_only:
+                struct.pack_into('i', self._m, 0, self.used)
+        else:
+            for key, value, pos in self._read_all():
+                self.positions[key] = pos
+
+    def _read_all(self):
+        pos = 8
+        while pos < self.used:
+            length = struct.unpack_from('i', self._m, pos)[0]
+            pos += 4
+            key = self._m[pos:pos + length].decode('utf-8')
+            # Skip the padding
+            pos += length + (8 - (length + 4) % 8) % 8
+            value = struct.unpack_from('d', self._m, pos)[0]
+            yield key, value, pos
+            pos += 8
+
+    def _init_value(self, key):
+        encoded = key.encode('utf-8')
+        padding = b' ' * ((8 - (len(encoded) + 4) % 8) % 8)
+        entry = struct.pack('i', len(encoded)) + encoded + padding +\
+            struct.pack('d', 0.0)
+
+        while self.used + len(entry) > self.capacity:
+            self.capacity *= 2
+            self._f.truncate(self.capacity)
+            self._m.close()
+            self._m = mmap.mmap(self._f.fileno(), self.capacity)
+
+        # Write the entry before making it visible with the used bytes
+        self._m[self.used:self.used + len(entry)] = entry
+        self.used += len(entry)
+        struct.pack_into('i', self._m, 0, self.used)
+        self.positions[key] = self.used - 8
+
+    def items(self):
+        """ Returns a list of tuples with the key and the value"""
+
+        return [(k, v) for k, v, pos in self._read_all()]
+
+    def read_value(self, key):
+        with self.mutex:
+            if key not in self.positions:
+                return 0.0
+            return struct.unpack_from('d', self._m, self.positions[key])[0]
+
+    def write_value(self, key, value):
+        with self.mutex:
+            if key not in self.positions:
+                self._init_value(key)
+            struct.pack_into('d', self._m, self.positions[key], value)
+
+    def close(self):
+        if self._f:
+            self._m.close()
+            self._f.close()
+            self._f = None
+
+
+def get_directory():
+    """ Returns the directory of the files, exception if isn't set"""
+
+    try:
+        return os.environ[DIRECTORY_ENV]
+    except KeyError:
+        raise ValueError("Multiprocess directory not set in {0}".format(
+            DIRECTORY_ENV))
+
+
+def get_file(prefix):
+    """ Returns the file of this process with the prefix in the directory,
+        the files are opened again in the forked processes
+    """
+
+    key = (get_directory(), prefix, os.getpid())
+
+    try:
+        return files[key]
+    except KeyError:
+        with files_mutex:
+            if key not in files:
+                filename = os.path.join(key[0],
+                                        "{0}_{1}.db".format(prefix, key[2]))
+                files[key] = MmapedDict(filename)
+            return files[key]
+
+
+def mark_process_dead(pid, path=None):
+    """ Removes the gauges of a finished process (counters and summaries
+        are kept), call it when a worker exits
+    """
+
+    path = path or get_directory()
+    for f in glob.glob(os.path.join(path, "gauge_*_{0}.db".format(pid))):
+        os.remove(f)
+
+
+class MultiProcessMixin(object):
+    """ Writes the values of the collector in the file of the process, the
+        store of the collector keeps the values of this process
+    """
+
+    FILE_PREFIX = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Keys in the file of the stored keys (by suffix)
+        self._file_keys = {}
+
+        # Process of the values in the store
+        self._pid = os.getpid()
+
+    def _check_process(self):
+        """ Forgets the values inherited from the parent in a forked process
+            (call it with the mutex), they are already in the file of the
+            parent and the process starts its own values
+        """
+
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self.values.store.clear()
+            self.versions.clear()
+
+    def _file_key(self, key, suffix=""):
+        try:
+            return self._file_keys[(key, suffix)]
+        except KeyError:
+            labels = utils.unify_labels(dict(key), self.const_labels)
+            file_key = json.dumps([self.name, self.help_text, suffix, labels],
+                                  sort_keys=True)
+            return self._file_keys.setdefault((key, suffix), file_key)
+
+    def set_value(self, labels, value):
+        """ Sets a value in the container"""
+
+        self._check_labels(labels)
+        self._set_key(self.values.__keytransform__(labels), value)
+
+    def add_value(self, labels, value):
+        """ Adds a value to the one in the container (starting from 0)
+            atomically
+        """
+
+        self._check_labels(labels)
+        self._add_key(self.values.__keytransform__(labels), value)
+
+    def _set_key(self, key, value):
+        f = get_file(self.FILE_PREFIX)
+        with self.mutex:
+            self._check_process()
+            self.values.store[key] = value
+            f.write_value(self._file_key(key), value)
+            self.generation = self.versions[key] = \
+                collectors._next_generation()
+
+    def _add_key(self, key, value):
+        f = get_file(self.FILE_PREFIX)
+        with self.mutex:
+            self._check_process()
+            value = self.values.store.get(key, 0) + value
+            self.values.store[key] = value
+            f.write_value(self._file_key(key), value)
+            self.generation = self.versions[key] = \
+                collectors._next_generation()
+
+
+class MultiProcessCounterChild(collectors.DelegatedChildMixin,
+                               collectors.CounterChild):
+    """ Multiprocess counter bound to one labels set"""
+
+
+class MultiProcessCounter(MultiProcessMixin, collectors.Counter):
+    """ Counter that adds the values of all the processes"""
+
+    CHILD_CLASS = MultiProcessCounterChild
+    FILE_PREFIX = "counter"
+
+
+class MultiProcessGaugeChild(collectors.DelegatedChildMixin,
+                             collectors.GaugeChild):
+    """ Multiprocess gauge bound to one labels set"""
+
+
+class MultiProcessGauge(MultiProcessMixin, collectors.Gauge):
+    """ Gauge that merges the values of all the processes with the selected
+        mode: all (a value per process with the pid label), sum, max or min
+    """
+
+    CHILD_CLASS = MultiProcessGaugeChild
+
+    def __init__(self, name, help_text, const_labels=None, labelnames=None,
+                 multiprocess_mode=GAUGE_ALL):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError("Not a valid multiprocess mode")
+
+        super().__init__(name, help_text, const_labels, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self.FILE_PREFIX = "gauge_{0}".format(multiprocess_mode)
+
+
+class MultiProcessSummaryChild(collectors.SummaryChild):
+    """ Multiprocess summary bound to one labels set"""
+
+    def add(self, value):
+        """Add adds a single observation to the summary."""
+
+        if not utils.is_number(value):
+            raise TypeError("Summary only works with digits (int, float)")
+
+        self.collector._observe_key(self.key, (value, ))
+
+    def add_many(self, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the summary at once.
+        """
+        values = collectors.Summary._to_numbers(values)
+        self.collector._observe_key(self.key, values)
+
+    # Handy aliases
+    observe = add
+    observe_many = add_many
+
+
+class MultiProcessSummary(MultiProcessMixin, collectors.Summary):
+    """ Summary that adds the sum and count of all the processes, the
+        quantiles of different processes can't be merged so they are not
+        estimated
+    """
+
+    CHILD_CLASS = MultiProcessSummaryChild
+    FILE_PREFIX = "summary"
+
+    def add(self, labels, value):
+        """Add adds a single observation to the summary."""
+
+        if not utils.is_number(value):
+            raise TypeError("Summary only works with digits (int, float)")
+
+        self._check_labels(labels)
+        self._observe_key(self.values.__keytransform__(labels), (value, ))
+
+    def add_many(self, labels, values):
+        """ Adds multiple observations (list, array.array or NumPy array)
+            to the summary at once.
+        """
+
+        values = self._to_numbers(values)
+        self._check_labels(labels)
+        self._observe_key(self.values.__keytransform__(labels), values)
+
+    def _observe_key(self, key, values):
+        f = get_file(self.FILE_PREFIX)
+        sum_key = self._file_key(key, self.__class__.SUM_KEY)
+        count_key = self._file_key(key, self.__class__.COUNT_KEY)
+
+        with self.mutex:
+            self._check_process()
+            data = self.values.store.get(key)
+            if data is None:
+                data = self.values.store[key] = [0.0, 0]
+            data[0] += sum(values)
+            data[1] += len(values)
+            f.write_value(sum_key, data[0])
+            f.write_value(count_key, data[1])
+            self.generation = self.versions[key] = \
+                collectors._next_generation()
+
+    def _copy_estimator(self, data):
+        return list(data)
+
+    def _summarize(self, data):
+        """ The sum and count of this process in a dict"""
+
+        return {
+            self.__class__.SUM_KEY: data[0],
+            self.__class__.COUNT_KEY: data[1],
+        }
+
+
+class MergedSummary(collectors.Summary):
+    """ Summary with the merged sum and count of all the processes"""
+
+    def _copy_estimator(self, data):
+        # The merged dicts are never updated
+        return data
+
+    def _summarize(self, data):
+        return data
+
+
+class MultiProcessRegistry(Registry):
+    """ Registry with the metrics of all the processes, the files of the
+        directory are merged each time the collectors are requested
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or get_directory()
+
+    def register(self, collector):
+        raise TypeError("Collectors are read from the multiprocess files")
+
+    def generation(self):
+        """ The other processes don't share their generations, so the values
+            can change at any time
+        """
+        return None
+
+    def get(self, name):
+        """ Get a collector"""
+
+        for i in self.get_all():
+            if i.name == name:
+                return i
+        raise KeyError(name)
+
+    def get_all(self, ordered=False):
+        """ Get a list with all the collectors merged, if ordered they are
+            sorted by name
+        """
+
+        # Values by collector name and then by labels key
+        metrics = collections.OrderedDict()
+
+        for filename in sorted(glob.glob(os.path.join(self.path, "*.db"))):
+            parts = os.path.basename(filename)[:-3].split("_")
+            if os.path.getsize(filename) == 0:
+                continue
+
+            f = MmapedDict(filename, read_only=True)
+            try:
+                items = f.items()
+            finally:
+                f.close()
+
+            for file_key, value in items:
+                name, help_text, suffix, labels = json.loads(file_key)
+                metric = metrics.setdefault(name, {
+                    'type': parts[0],
+                    'mode': parts[1] if parts[0] == "gauge" else None,
+                    'help_text': help_text,
+                    'values': {},
+                })
+
+                if metric['mode'] == GAUGE_ALL:
+                    labels[PID_LABEL] = parts[-1]
+
+                key = tuple(sorted(labels.items()))
+                self._merge_value(metric, key, suffix, value)
+
+        metrics = metrics.items()
+        if ordered:
+            metrics = sorted(metrics, key=lambda m: m[0])
+
+        return [self._create_collector(name, metric)
+                for name, metric in metrics]
+
+    def _merge_value(self, metric, key, suffix, value):
+        values = metric['values']
+
+        if metric['type'] == "summary":
+            data = values.setdefault(key, {collectors.Summary.SUM_KEY: 0.0,
+                                           collectors.Summary.COUNT_KEY: 0})
+            if suffix == collectors.Summary.COUNT_KEY:
+                value = int(value)
+            data[suffix] += value
+        elif key not in values:
+            values[key] = value
+        elif metric['mode'] == GAUGE_MAX:
+            values[key] = max(values[key], value)
+        elif metric['mode'] == GAUGE_MIN:
+            values[key] = min(values[key], value)
+        else:
+            values[key] += value
+
+    def _create_collector(self, name, metric):
+        if metric['type'] == "counter":
+            collector = collectors.Counter(name, metric['help_text'])
+        elif metric['type'] == "gauge":
+            collector = collectors.Gauge(name, metric['help_text'])
+        else:
+            collector = MergedSummary(name, metric['help_text'])
+
+        collector.values.store.update(metric['values'])
+
+        return collector
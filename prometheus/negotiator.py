@@ -1,3 +1,5 @@
+import functools
+
 from prometheus.formats import TextFormat, ProtobufFormat, ProtobufTextFormat
 
 
@@ -22,30 +24,127 @@ class Negotiator(object):
                     "encoding=text")
     }
 
+    # Content encodings of the responses in order of preference
+    ENCODINGS = ("gzip", "deflate")
+
+    # Parsed headers kept, the scrapers send the same headers every time
+    CACHE_SIZE = 64
+
+    @staticmethod
+    def _get_header(headers, name):
+        """ Value of a header of a dict (with keys in any case) or of a
+            http.server message, None if it's missing
+        """
+
+        value = headers.get(name)
+        if value is None:
+            for k, v in headers.items():
+                if k.lower() == name:
+                    return v
+        return value
+
+    @staticmethod
+    def _parse(header):
+        """ Splits an Accept like header in its ranges, returns a list of
+            (range, parameters, quality) by order in the header. The range
+            can be anywhere between the parameters ("proto=...;text/plain")
+        """
+
+        result = []
+        for i in header.split(","):
+            value = None
+            params = {}
+            quality = 1.0
+            for p in i.split(";"):
+                p = p.strip()
+                if not p:
+                    continue
+                name, sep, v = p.partition("=")
+                if not sep:
+                    value = p.lower()
+                elif name.strip().lower() == "q":
+                    try:
+                        quality = float(v)
+                    except ValueError:
+                        quality = 0.0
+                else:
+                    params[name.strip().lower()] = v.strip()
+            if value is not None:
+                result.append((value, params, quality))
+
+        return result
+
+    @classmethod
+    def _match_format(cls, media_type, params):
+        """ Format class of an accepted media type, None if it isn't one of
+            the formats
+        """
+
+        if media_type == cls.PROTOBUF['default'][0]:
+            for k in ('default', 'text'):
+                expected = dict(i.split("=") for i in cls.PROTOBUF[k][1:])
+                if all(params.get(n) == v for n, v in expected.items()):
+                    return (ProtobufFormat if k == 'default'
+                            else ProtobufTextFormat)
+        elif media_type == cls.TEXT['default'][0]:
+            # Text 0.0.4 (or without version)
+            return TextFormat
+
+        return None
+
+    @classmethod
+    @functools.lru_cache(maxsize=CACHE_SIZE)
+    def _negotiate_accept(cls, accept):
+        # The first of the formats with the highest quality, the rejected
+        # (q=0) and unknown ranges are skipped
+        best, best_quality = cls.FALLBACK, 0.0
+        for media_type, params, quality in cls._parse(accept):
+            if quality > best_quality:
+                formatter = cls._match_format(media_type, params)
+                if formatter is not None:
+                    best, best_quality = formatter, quality
+
+        return best
+
+    @classmethod
+    @functools.lru_cache(maxsize=CACHE_SIZE)
+    def _negotiate_accept_encoding(cls, accept_encoding):
+        # Encodings with their quality ("gzip;q=0" rejects gzip)
+        accepted = {v: q for v, params, q in cls._parse(accept_encoding)}
+
+        for i in cls.ENCODINGS:
+            if accepted.get(i, accepted.get("*", 0.0)) > 0:
+                return i
+
+        return None
+
+    @classmethod
+    def negotiate_response(cls, headers):
+        """ Process headers dict to return the format class (not the
+            instance) and the content encoding of the response (None if the
+            response isn't compressed) at once
+        """
+
+        accept = cls._get_header(headers, 'accept') or "*/*"
+        accept_encoding = cls._get_header(headers, 'accept-encoding') or ""
+
+        return (cls._negotiate_accept(accept),
+                cls._negotiate_accept_encoding(accept_encoding))
+
+    @classmethod
+    def negotiate_encoding(cls, headers):
+        """ Process headers dict to return the content encoding of the
+            response (None if the response isn't compressed)
+        """
+
+        accept_encoding = cls._get_header(headers, 'accept-encoding') or ""
+        return cls._negotiate_accept_encoding(accept_encoding)
+
     @classmethod
     def negotiate(cls, headers):
         """ Process headers dict to return the format class
             (not the instance)
         """
-        # set lower keys
-        headers = {k.lower(): v for k, v in headers.items()}
 
-        accept = headers.get('accept', "*/*")
-
-        parsed_accept = accept.split(";")
-        parsed_accept = [i.strip() for i in parsed_accept]
-
-        # Protobuffer (only one version)
-        if all([i in parsed_accept for i in cls.PROTOBUF['default']]):
-            return ProtobufFormat
-        elif all([i in parsed_accept for i in cls.PROTOBUF['text']]):
-            return ProtobufTextFormat
-        # Text 0.0.4
-        elif all([i in parsed_accept for i in cls.TEXT['0.0.4']]):
-            return TextFormat
-        # Text (Default)
-        elif all([i in parsed_accept for i in cls.TEXT['default']]):
-            return TextFormat
-        # Default
-        else:
-            return cls.FALLBACK
+        return cls._negotiate_accept(cls._get_header(headers, 'accept') or
+                                     "*/*")
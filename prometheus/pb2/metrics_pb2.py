@@ -37,7 +37,7 @@ from google.protobuf import descriptor_pb2
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='metrics.proto',
   package='io.prometheus.client',
-  serialized_pb=b('\n\rmetrics.proto\x12\x14io.prometheus.client\"(\n\tLabelPair\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x16\n\x05Gauge\x12\r\n\x05value\x18\x01 \x01(\x01\"\x18\n\x07\x43ounter\x12\r\n\x05value\x18\x01 \x01(\x01\"+\n\x08Quantile\x12\x10\n\x08quantile\x18\x01 \x01(\x01\x12\r\n\x05value\x18\x02 \x01(\x01\"e\n\x07Summary\x12\x14\n\x0csample_count\x18\x01 \x01(\x04\x12\x12\n\nsample_sum\x18\x02 \x01(\x01\x12\x30\n\x08quantile\x18\x03 \x03(\x0b\x32\x1e.io.prometheus.client.Quantile\"\x18\n\x07Untyped\x12\r\n\x05value\x18\x01 \x01(\x01\"\x8a\x02\n\x06Metric\x12.\n\x05label\x18\x01 \x03(\x0b\x32\x1f.io.prometheus.client.LabelPair\x12*\n\x05gauge\x18\x02 \x01(\x0b\x32\x1b.io.prometheus.client.Gauge\x12.\n\x07\x63ounter\x18\x03 \x01(\x0b\x32\x1d.io.prometheus.client.Counter\x12.\n\x07summary\x18\x04 \x01(\x0b\x32\x1d.io.prometheus.client.Summary\x12.\n\x07untyped\x18\x05 \x01(\x0b\x32\x1d.io.prometheus.client.Untyped\x12\x14\n\x0ctimestamp_ms\x18\x06 \x01(\x03\"\x88\x01\n\x0cMetricFamily\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04help\x18\x02 \x01(\t\x12.\n\x04type\x18\x03 \x01(\x0e\x32 .io.prometheus.client.MetricType\x12,\n\x06metric\x18\x04 \x03(\x0b\x32\x1c.io.prometheus.client.Metric*>\n\nMetricType\x12\x0b\n\x07\x43OUNTER\x10\x00\x12\t\n\x05GAUGE\x10\x01\x12\x0b\n\x07SUMMARY\x10\x02\x12\x0b\n\x07UNTYPED\x10\x03\x42\x16\n\x14io.prometheus.client'))
+  serialized_pb=b('\n\rmetrics.proto\x12\x14io.prometheus.client\"(\n\tLabelPair\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x16\n\x05Gauge\x12\r\n\x05value\x18\x01 \x01(\x01\"\x18\n\x07\x43ounter\x12\r\n\x05value\x18\x01 \x01(\x01\"+\n\x08Quantile\x12\x10\n\x08quantile\x18\x01 \x01(\x01\x12\r\n\x05value\x18\x02 \x01(\x01\"e\n\x07Summary\x12\x14\n\x0csample_count\x18\x01 \x01(\x04\x12\x12\n\nsample_sum\x18\x02 \x01(\x01\x12\x30\n\x08quantile\x18\x03 \x03(\x0b\x32\x1e.io.prometheus.client.Quantile\"\x18\n\x07Untyped\x12\r\n\x05value\x18\x01 \x01(\x01\"c\n\tHistogram\x12\x14\n\x0csample_count\x18\x01 \x01(\x04\x12\x12\n\nsample_sum\x18\x02 \x01(\x01\x12,\n\x06\x62ucket\x18\x03 \x03(\x0b\x32\x1c.io.prometheus.client.Bucket\"7\n\x06\x42ucket\x12\x18\n\x10\x63umulative_count\x18\x01 \x01(\x04\x12\x13\n\x0bupper_bound\x18\x02 \x01(\x01\"\xbe\x02\n\x06Metric\x12.\n\x05label\x18\x01 \x03(\x0b\x32\x1f.io.prometheus.client.LabelPair\x12*\n\x05gauge\x18\x02 \x01(\x0b\x32\x1b.io.prometheus.client.Gauge\x12.\n\x07\x63ounter\x18\x03 \x01(\x0b\x32\x1d.io.prometheus.client.Counter\x12.\n\x07summary\x18\x04 \x01(\x0b\x32\x1d.io.prometheus.client.Summary\x12.\n\x07untyped\x18\x05 \x01(\x0b\x32\x1d.io.prometheus.client.Untyped\x12\x32\n\thistogram\x18\x07 \x01(\x0b\x32\x1f.io.prometheus.client.Histogram\x12\x14\n\x0ctimestamp_ms\x18\x06 \x01(\x03\"\x88\x01\n\x0cMetricFamily\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04help\x18\x02 \x01(\t\x12.\n\x04type\x18\x03 \x01(\x0e\x32 .io.prometheus.client.MetricType\x12,\n\x06metric\x18\x04 \x03(\x0b\x32\x1c.io.prometheus.client.Metric*M\n\nMetricType\x12\x0b\n\x07\x43OUNTER\x10\x00\x12\t\n\x05GAUGE\x10\x01\x12\x0b\n\x07SUMMARY\x10\x02\x12\x0b\n\x07UNTYPED\x10\x03\x12\r\n\tHISTOGRAM\x10\x04\x42\x16\n\x14io.prometheus.client'))
 
 _METRICTYPE = _descriptor.EnumDescriptor(
   name='MetricType',
@@ -61,11 +61,15 @@ _METRICTYPE = _descriptor.EnumDescriptor(
       name='UNTYPED', index=3, number=3,
       options=None,
       type=None),
+    _descriptor.EnumValueDescriptor(
+      name='HISTOGRAM', index=4, number=4,
+      options=None,
+      type=None),
   ],
   containing_type=None,
   options=None,
-  serialized_start=713,
-  serialized_end=775,
+  serialized_start=923,
+  serialized_end=1000,
 )
 
 MetricType = enum_type_wrapper.EnumTypeWrapper(_METRICTYPE)
@@ -73,6 +77,7 @@ COUNTER = 0
 GAUGE = 1
 SUMMARY = 2
 UNTYPED = 3
+HISTOGRAM = 4
 
 
 
@@ -272,6 +277,83 @@ _UNTYPED = _descriptor.Descriptor(
 )
 
 
+_HISTOGRAM = _descriptor.Descriptor(
+  name='Histogram',
+  full_name='io.prometheus.client.Histogram',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='sample_count', full_name='io.prometheus.client.Histogram.sample_count', index=0,
+      number=1, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='sample_sum', full_name='io.prometheus.client.Histogram.sample_sum', index=1,
+      number=2, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='bucket', full_name='io.prometheus.client.Histogram.bucket', index=2,
+      number=3, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=305,
+  serialized_end=404,
+)
+
+
+_BUCKET = _descriptor.Descriptor(
+  name='Bucket',
+  full_name='io.prometheus.client.Bucket',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='cumulative_count', full_name='io.prometheus.client.Bucket.cumulative_count', index=0,
+      number=1, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='upper_bound', full_name='io.prometheus.client.Bucket.upper_bound', index=1,
+      number=2, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=406,
+  serialized_end=461,
+)
+
+
 _METRIC = _descriptor.Descriptor(
   name='Metric',
   full_name='io.prometheus.client.Metric',
@@ -315,7 +397,14 @@ _METRIC = _descriptor.Descriptor(
       is_extension=False, extension_scope=None,
       options=None),
     _descriptor.FieldDescriptor(
-      name='timestamp_ms', full_name='io.prometheus.client.Metric.timestamp_ms', index=5,
+      name='histogram', full_name='io.prometheus.client.Metric.histogram', index=5,
+      number=7, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='timestamp_ms', full_name='io.prometheus.client.Metric.timestamp_ms', index=6,
       number=6, type=3, cpp_type=2, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
@@ -330,8 +419,8 @@ _METRIC = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=306,
-  serialized_end=572,
+  serialized_start=464,
+  serialized_end=782,
 )
 
 
@@ -379,8 +468,8 @@ _METRICFAMILY = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=575,
-  serialized_end=711,
+  serialized_start=785,
+  serialized_end=921,
 )
 
 _SUMMARY.fields_by_name['quantile'].message_type = _QUANTILE
@@ -388,7 +477,9 @@ _METRIC.fields_by_name['label'].message_type = _LABELPAIR
 _METRIC.fields_by_name['gauge'].message_type = _GAUGE
 _METRIC.fields_by_name['counter'].message_type = _COUNTER
 _METRIC.fields_by_name['summary'].message_type = _SUMMARY
+_HISTOGRAM.fields_by_name['bucket'].message_type = _BUCKET
 _METRIC.fields_by_name['untyped'].message_type = _UNTYPED
+_METRIC.fields_by_name['histogram'].message_type = _HISTOGRAM
 _METRICFAMILY.fields_by_name['type'].enum_type = _METRICTYPE
 _METRICFAMILY.fields_by_name['metric'].message_type = _METRIC
 DESCRIPTOR.message_types_by_name['LabelPair'] = _LABELPAIR
@@ -397,6 +488,8 @@ DESCRIPTOR.message_types_by_name['Counter'] = _COUNTER
 DESCRIPTOR.message_types_by_name['Quantile'] = _QUANTILE
 DESCRIPTOR.message_types_by_name['Summary'] = _SUMMARY
 DESCRIPTOR.message_types_by_name['Untyped'] = _UNTYPED
+DESCRIPTOR.message_types_by_name['Histogram'] = _HISTOGRAM
+DESCRIPTOR.message_types_by_name['Bucket'] = _BUCKET
 DESCRIPTOR.message_types_by_name['Metric'] = _METRIC
 DESCRIPTOR.message_types_by_name['MetricFamily'] = _METRICFAMILY
 
@@ -436,6 +529,18 @@ Untyped = _reflection.GeneratedProtocolMessageType('Untyped', (_message.Message,
       # @@protoc_insertion_point(class_scope:io.prometheus.client.Untyped)
     })
 
+Histogram = _reflection.GeneratedProtocolMessageType('Histogram', (_message.Message,),
+    {
+      'DESCRIPTOR': _HISTOGRAM,
+      # @@protoc_insertion_point(class_scope:io.prometheus.client.Histogram)
+    })
+
+Bucket = _reflection.GeneratedProtocolMessageType('Bucket', (_message.Message,),
+    {
+      'DESCRIPTOR': _BUCKET,
+      # @@protoc_insertion_point(class_scope:io.prometheus.client.Bucket)
+    })
+
 Metric = _reflection.GeneratedProtocolMessageType('Metric', (_message.Message,),
     {
       'DESCRIPTOR': _METRIC,
@@ -12,10 +12,15 @@ class Pusher(object):
     PATH = "/metrics/jobs/{0}"
     INSTANCE_PATH = "/metrics/jobs/{0}/instances/{1}"
 
-    def __init__(self, job_name, addr, instance_name=None):
+    def __init__(self, job_name, addr, instance_name=None, chunked=False):
+        """ chunked is a boolean, if you want to stream the metrics of each
+            collector to the pushgateway as they are marshalled (chunked
+            transfer encoding) instead of sending them in one body
+        """
         self.job_name = job_name
         self.instance_name = instance_name
         self.addr = addr
+        self.chunked = chunked
 
         # push format
         self.formatter = ProtobufFormat()
@@ -28,13 +33,20 @@ class Pusher(object):
         else:
             self.path = urljoin(self.addr, self.__class__.PATH).format(job_name)
 
+    def _payload(self, registry):
+        # The values are copied at once and marshalled without locks
+        snapshot = registry.snapshot()
+        if self.chunked:
+            return self.formatter.marshall_iter(snapshot)
+        return self.formatter.marshall(snapshot)
+
     def add(self, registry):
         """ Add works like replace, but only previously pushed metrics with the
             same name (and the same job and instance) will be replaced.
             (It uses HTTP method 'POST' to push to the Pushgateway.)
         """
         # POST
-        payload = self.formatter.marshall(registry)
+        payload = self._payload(registry)
         r = requests.post(self.path, data=payload, headers=self.headers)
 
     def replace(self, registry):
@@ -45,10 +57,10 @@ class Pusher(object):
             (It uses HTTP method 'PUT' to push to the Pushgateway.)
         """
         # PUT
-        payload = self.formatter.marshall(registry)
+        payload = self._payload(registry)
         r = requests.put(self.path, data=payload, headers=self.headers)
 
     def delete(self, registry):
         # DELETE
-        payload = self.formatter.marshall(registry)
+        payload = self._payload(registry)
         r = requests.delete(self.path, data=payload, headers=self.headers)
@@ -1,3 +1,4 @@
+import collections
 from multiprocessing import Lock
 
 from prometheus.collectors import Collector
@@ -12,6 +13,10 @@ class Registry(object):
     def __init__(self):
         self.collectors = {}
 
+        # Names of the collectors in order, sorted again only when the
+        # collectors change
+        self._ordered_names = None
+
     def register(self, collector):
         """ Registers a collector"""
         if not isinstance(collector, Collector):
@@ -23,11 +28,13 @@ class Registry(object):
 
         with mutex:
             self.collectors[collector.name] = collector
+            self._ordered_names = None
 
     def deregister(self, name):
         """ eregisters a collector based on the name"""
         with mutex:
             del self.collectors[name]
+            self._ordered_names = None
 
     def get(self, name):
         """ Get a collector"""
@@ -35,7 +42,77 @@ class Registry(object):
         with mutex:
             return self.collectors[name]
 
-    def get_all(self):
-        """Get a list with all the collectors"""
+    def get_all(self, ordered=False):
+        """ Get a list with all the collectors, if ordered they are sorted by
+            name
+        """
         with mutex:
-            return [v for k, v in self.collectors.items()]
+            if not ordered:
+                return [v for k, v in self.collectors.items()]
+
+            if self._ordered_names is None:
+                self._ordered_names = sorted(self.collectors)
+            return [self.collectors[k] for k in self._ordered_names]
+
+    def generation(self):
+        """ Returns the generation of the registry, it's the same while the
+            collectors and their values don't change (None if it's unknown)
+        """
+        with mutex:
+            return tuple(c.generation for c in self.collectors.values())
+
+    def snapshot(self):
+        """ Returns a RegistrySnapshot with a snapshot of each collector, the
+            formats marshall it like the registry without locking the
+            collectors (in any thread)
+        """
+        return RegistrySnapshot(c.snapshot() for c in self.get_all())
+
+    def lazy_snapshot(self):
+        """ Returns a LazyRegistrySnapshot, the snapshot of each collector is
+            taken when the formats get to it
+        """
+        return LazyRegistrySnapshot(self)
+
+
+class RegistrySnapshot(object):
+    """ Snapshots of the collectors of a registry at one point in time (see
+        Registry.snapshot)
+    """
+
+    def __init__(self, collectors):
+        self.collectors = collections.OrderedDict(
+            (c.name, c) for c in collectors)
+
+    def get(self, name):
+        """ Get a collector snapshot"""
+        return self.collectors[name]
+
+    def get_all(self, ordered=False):
+        """ Get a list with all the collector snapshots, if ordered they are
+            sorted by name
+        """
+        if not ordered:
+            return list(self.collectors.values())
+        return [self.collectors[k] for k in sorted(self.collectors)]
+
+    def generation(self):
+        """ The generation of the registry when the snapshot was taken"""
+        return tuple(c.generation for c in self.collectors.values())
+
+
+class LazyRegistrySnapshot(object):
+    """ Snapshots of the collectors of a registry taken one by one as they
+        are marshalled (get_all yields them), so the marshall in steps of
+        marshall_iter doesn't read all the collectors in one step
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def get_all(self, ordered=False):
+        """ Yields the snapshot of each collector, if ordered they are
+            sorted by name
+        """
+        for c in self.registry.get_all(ordered=ordered):
+            yield c.snapshot()
@@ -0,0 +1,198 @@
+import asyncio
+import unittest
+import zlib
+
+from prometheus.aioexporter import AsyncExporter, start_async_server
+from prometheus.collectors import Counter
+from prometheus.registry import Registry
+
+TEST_PORT = 61425
+TEST_HOST = "127.0.0.1"
+TEST_METRICS_PATH = AsyncExporter.METRICS_PATH
+
+
+class TestAsyncExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+        self.registry = Registry()
+        self.server = self.loop.run_until_complete(
+            start_async_server(self.registry, TEST_PORT, TEST_HOST,
+                               loop=self.loop))
+
+    def _connect(self):
+        return self.loop.run_until_complete(asyncio.open_connection(
+            TEST_HOST, TEST_PORT, loop=self.loop))
+
+    @asyncio.coroutine
+    def _get_coroutine(self, reader, writer, path, headers, version):
+        request = ["GET {0} {1}".format(path, version)]
+        request.extend("{0}: {1}".format(k, v) for k, v in headers.items())
+        writer.write("\r\n".join(request + ["\r\n"]).encode("latin-1"))
+
+        status = yield from reader.readline()
+        response_headers = {}
+        while True:
+            line = yield from reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding') == "chunked":
+            body = b""
+            while True:
+                size = int((yield from reader.readline()), 16)
+                body += yield from reader.readexactly(size + 2)
+                body = body[:-2]
+                if not size:
+                    break
+        elif 'content-length' in response_headers:
+            body = yield from reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            body = yield from reader.read()
+
+        return int(status.split()[1]), response_headers, body
+
+    def _get(self, connection=None, path=TEST_METRICS_PATH, headers=None,
+             version="HTTP/1.1"):
+        """ Returns the status, headers and body of a request, in a new
+            connection if it's not passed
+        """
+
+        reader, writer = connection or self._connect()
+        try:
+            return self.loop.run_until_complete(self._get_coroutine(
+                reader, writer, path, headers or {}, version))
+        finally:
+            if connection is None:
+                writer.close()
+
+    def test_counter(self):
+        c = Counter("test_counter", "Test Counter.", {'test': "test_counter"})
+        c.set({'data': 1}, 100)
+        c.set({'data': "2"}, 200)
+        self.registry.register(c)
+
+        status, headers, body = self._get(
+            headers={'Accept': "text/plain; version=0.0.4"})
+
+        valid_data = b"""# HELP test_counter Test Counter.
+# TYPE test_counter counter
+test_counter{data="1",test="test_counter"} 100
+test_counter{data="2",test="test_counter"} 200
+"""
+        self.assertEqual(200, status)
+        self.assertEqual("text/plain; version=0.0.4; charset=utf-8",
+                         headers['content-type'])
+        self.assertEqual("chunked", headers['transfer-encoding'])
+        self.assertEqual(valid_data, body)
+
+    def test_keep_alive(self):
+        c = Counter("test_counter", "Test Counter.")
+        self.registry.register(c)
+
+        reader, writer = connection = self._connect()
+        for i in range(3):
+            c.inc(None)
+            status, headers, body = self._get(connection)
+
+            self.assertEqual(200, status)
+            self.assertNotIn('connection', headers)
+            self.assertIn("test_counter {0}".format(i + 1).encode("ascii"),
+                          body)
+        writer.close()
+
+    def test_http_1_0(self):
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        # Without chunks, the end of the connection is the end of the body
+        status, headers, body = self._get(version="HTTP/1.0")
+        self.assertEqual(200, status)
+        self.assertNotIn('transfer-encoding', headers)
+        self.assertEqual("close", headers['connection'])
+        self.assertEqual(b"""# HELP test_counter Test Counter.
+# TYPE test_counter counter
+test_counter 1
+""", body)
+
+    def test_gzip(self):
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        status, headers, body = self._get(
+            headers={'Accept-Encoding': "gzip, deflate"})
+        self.assertEqual("gzip", headers['content-encoding'])
+        self.assertEqual(b"""# HELP test_counter Test Counter.
+# TYPE test_counter counter
+test_counter 1
+""", zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+    def test_not_found(self):
+        status, headers, body = self._get(path="/other")
+        self.assertEqual(404, status)
+        self.assertEqual(b"", body)
+
+    def _check_cooperative(self, headers):
+        collectors = 20
+        ticks = []
+        snapshot_ticks = []
+
+        class TickCounter(Counter):
+            def snapshot(self):
+                snapshot_ticks.append(len(ticks))
+                return super().snapshot()
+
+        for i in range(collectors):
+            c = TickCounter("test_counter_{0}".format(i), "Test Counter.")
+            c.set(None, i)
+            self.registry.register(c)
+
+        # The other tasks run while the collectors are marshalled
+        done = asyncio.Event(loop=self.loop)
+
+        @asyncio.coroutine
+        def tick():
+            while not done.is_set():
+                ticks.append(1)
+                yield from asyncio.sleep(0, loop=self.loop)
+
+        task = self.loop.create_task(tick())
+        reader, writer = self._connect()
+        result = self.loop.run_until_complete(self._get_coroutine(
+            reader, writer, TEST_METRICS_PATH, headers, "HTTP/1.1"))
+        done.set()
+        self.loop.run_until_complete(task)
+        writer.close()
+
+        self.assertEqual(200, result[0])
+        self.assertGreaterEqual(len(ticks), collectors)
+
+        # And between the snapshots of the collectors
+        self.assertEqual(collectors, len(set(snapshot_ticks)))
+
+        return result
+
+    def test_cooperative(self):
+        status, headers, body = self._check_cooperative({})
+        self.assertEqual(20, body.count(b"# TYPE"))
+
+    def test_cooperative_gzip(self):
+        # The compressor doesn't output every collector but the loop runs
+        # between them anyway
+        status, headers, body = self._check_cooperative(
+            {'Accept-Encoding': "gzip"})
+        self.assertEqual("gzip", headers['content-encoding'])
+        self.assertEqual(20, zlib.decompress(body, 16 + zlib.MAX_WBITS).count(
+            b"# TYPE"))
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
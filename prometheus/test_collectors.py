@@ -1,6 +1,16 @@
+import array
+import pickle
+import threading
 import unittest
 
-from prometheus.collectors import Collector, Counter, Gauge, Summary
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from prometheus import collectors
+from prometheus.collectors import (Collector, Counter, Gauge, Summary,
+                                   Histogram, ShardedCounter, ShardedGauge)
 
 
 class TestCollectorDict(unittest.TestCase):
@@ -95,9 +105,15 @@ class TestCollectorDict(unittest.TestCase):
         self.assertEqual(1, len(self.c.values))
         self.assertEqual((data)[len(data)-1][1], self.c.values[data[0][0]])
 
-     #def test_set_value_mutex(self):
-     #   # TODO: Check mutex
-     #   pass
+    def test_set_value_mutex(self):
+        other = Collector("other_" + self.data['name'], self.data['help_text'])
+
+        # Each collector owns its lock, holding one doesn't block the other
+        with self.c.mutex:
+            other.set_value({'country': "sp"}, 1)
+
+        self.assertIsNot(self.c.mutex, other.mutex)
+        self.assertEqual(1, other.get_value({'country': "sp"}))
 
     def test_wrong_labels(self):
 
@@ -123,6 +139,50 @@ class TestCollectorDict(unittest.TestCase):
 
         self.assertEqual('Labels not correct', str(context.exception))
 
+    def test_labelnames(self):
+        c = Collector("x", "y", labelnames=('country', 'device'))
+
+        self.assertEqual(('country', 'device'), c.labelnames)
+        c.set_value({'device': "desktop", 'country': "sp"}, 520)
+        self.assertEqual(520, c.get_value({'country': "sp",
+                                           'device': "desktop"}))
+
+        # Labels need to match the declared ones
+        for labels in ({'country': "sp"}, {'country': "sp", 'os': "linux"},
+                       {'country': "sp", 'device': "mobile", 'os': "linux"},
+                       None):
+            with self.assertRaises(ValueError) as context:
+                c.set_value(labels, 1)
+            self.assertEqual('Labels not correct', str(context.exception))
+
+    def test_wrong_labelnames(self):
+        for labelnames in (('job', 'ok'), ('__not_ok', 'ok'), ('ok', 'ok')):
+            with self.assertRaises(ValueError) as context:
+                Collector("x", "y", labelnames=labelnames)
+            self.assertEqual('Labels not correct', str(context.exception))
+
+    def test_labels_positional(self):
+        c = Collector("x", "y", labelnames=('country', 'device'))
+
+        child = c.labels("sp", "desktop")
+        self.assertIs(child, c.labels("sp", "desktop"))
+        self.assertIs(child, c.labels({'device': "desktop", 'country': "sp"}))
+
+        child.set(520)
+        self.assertEqual(520, c.get_value({'country': "sp",
+                                           'device': "desktop"}))
+
+        with self.assertRaises(ValueError) as context:
+            c.labels("sp")
+        self.assertEqual('Wrong number of label values',
+                         str(context.exception))
+
+        # Without declared label names
+        with self.assertRaises(TypeError) as context:
+            self.c.labels("sp", "desktop")
+        self.assertEqual('Label values need declared label names',
+                         str(context.exception))
+
     def test_get_all(self):
         data = (
             ({'country': "sp", "device": "desktop"}, 520),
@@ -147,6 +207,174 @@ class TestCollectorDict(unittest.TestCase):
         sorted_result = sorted(self.c.get_all(), key=sort_fn)
         self.assertEqual(sorted_data, sorted_result)
 
+    def test_get_items(self):
+        self.c.set_value({'country': "sp", "device": "desktop"}, 520)
+        self.c.set_value(None, 1)
+
+        result = sorted(self.c.get_items())
+        self.assertEqual([((), 1),
+                          ((('country', "sp"), ('device', "desktop")), 520)],
+                         result)
+
+    def test_generation(self):
+        collectors = (
+            (Counter("c", "C."), lambda c: c.inc({'a': "b"})),
+            (Counter("c", "C."), lambda c: c.labels({'a': "b"}).inc()),
+            (Gauge("g", "G."), lambda c: c.set({'a': "b"}, 1)),
+            (Gauge("g", "G."), lambda c: c.labels({'a': "b"}).set(1)),
+            (Summary("s", "S."), lambda c: c.add({'a': "b"}, 1)),
+            (Summary("s", "S."), lambda c: c.add_many({'a': "b"}, [1, 2])),
+            (Summary("s", "S."), lambda c: c.labels({'a': "b"}).add(1)),
+            (Summary("s", "S."),
+             lambda c: c.labels({'a': "b"}).add_many([1, 2])),
+            (Histogram("h", "H."), lambda c: c.add({'a': "b"}, 1)),
+            (Histogram("h", "H."), lambda c: c.add_many({'a': "b"}, [1, 2])),
+            (Histogram("h", "H."), lambda c: c.labels({'a': "b"}).add(1)),
+            (Histogram("h", "H."),
+             lambda c: c.labels({'a': "b"}).add_many([1, 2])),
+            (ShardedCounter("c", "C."), lambda c: c.inc({'a': "b"})),
+            (ShardedGauge("g", "G."), lambda c: c.set({'a': "b"}, 1)),
+            (ShardedGauge("g", "G."), lambda c: c.labels({'a': "b"}).inc()),
+            (Counter("c", "C."), lambda c: setattr(c, 'const_labels',
+                                                  {'app': "my_app"})),
+        )
+
+        # Every update takes a new generation
+        generations = set()
+        for c, update in collectors:
+            generations.add(c.generation)
+            for i in range(2):
+                update(c)
+                self.assertNotIn(c.generation, generations)
+                generations.add(c.generation)
+
+        # Reads don't change it
+        generation = self.c.generation
+        self.c.get_all()
+        self.assertEqual(generation, self.c.generation)
+
+    def test_versions(self):
+        collectors = (
+            (Counter("c", "C."), lambda c, labels: c.inc(labels)),
+            (Gauge("g", "G."), lambda c, labels: c.labels(labels).inc()),
+            (Summary("s", "S."), lambda c, labels: c.add(labels, 1)),
+            (ShardedCounter("c", "C."), lambda c, labels: c.inc(labels)),
+        )
+
+        for c, update in collectors:
+            update(c, {'a': "1"})
+            update(c, {'a': "2"})
+            versions = c.get_versions()
+            self.assertEqual(2, len(versions))
+
+            # Only the updated series takes a new version
+            update(c, {'a': "2"})
+            new_versions = c.get_versions()
+            key1 = c.values.__keytransform__({'a': "1"})
+            key2 = c.values.__keytransform__({'a': "2"})
+            self.assertEqual(versions[key1], new_versions[key1])
+            self.assertLess(versions[key2], new_versions[key2])
+
+            # The values of the series of the keys
+            self.assertEqual([(key2, c.get({'a': "2"}))], c.get_items([key2]))
+            self.assertEqual(sorted(c.get_items()),
+                             sorted(c.get_items(list(new_versions))))
+
+
+class TestCollectorSnapshot(unittest.TestCase):
+
+    def test_snapshot(self):
+        collectors = (
+            (Counter("c", "C."), lambda c, labels: c.inc(labels)),
+            (Gauge("g", "G."), lambda c, labels: c.labels(labels).inc()),
+            (Summary("s", "S."), lambda c, labels: c.add(labels, 1)),
+            (Histogram("h", "H."), lambda c, labels: c.add(labels, 1)),
+            (ShardedCounter("c", "C."), lambda c, labels: c.inc(labels)),
+        )
+
+        for c, update in collectors:
+            update(c, {'a': "1"})
+            update(c, {'a': "2"})
+            snapshot = c.snapshot()
+
+            self.assertEqual(c.name, snapshot.name)
+            self.assertEqual(c.REPR_STR, snapshot.REPR_STR)
+            self.assertEqual(c.get_versions(), snapshot.get_versions())
+            self.assertEqual(sorted(c.get_items()),
+                             sorted(snapshot.get_items()))
+            self.assertEqual(c.get({'a': "2"}), snapshot.get({'a': "2"}))
+
+            # The snapshot doesn't change with the collector
+            values = snapshot.get_items()
+            update(c, {'a': "2"})
+            update(c, {'a': "3"})
+            self.assertEqual(values, snapshot.get_items())
+            self.assertNotEqual(sorted(c.get_items()), sorted(values))
+
+            new_snapshot = c.snapshot()
+            self.assertEqual(sorted(c.get_items()),
+                             sorted(new_snapshot.get_items()))
+
+            # Nothing changed, the same values
+            self.assertIs(new_snapshot.values, c.snapshot().values)
+
+    def test_changed_series(self):
+        c = Summary("s", "S.")
+        c.add({'a': "1"}, 1)
+        c.add({'a': "2"}, 1)
+        snapshot = c.snapshot()
+
+        # Only the estimators of the changed series are queried again
+        c.add({'a': "2"}, 3)
+        new_snapshot = c.snapshot()
+        key1 = c.values.__keytransform__({'a': "1"})
+        key2 = c.values.__keytransform__({'a': "2"})
+        self.assertIs(snapshot.values[key1], new_snapshot.values[key1])
+        self.assertEqual(2, new_snapshot.values[key2]['count'])
+
+    def test_pickle(self):
+        c = Histogram("h", "H.", {'app': "my_app"}, buckets=[1, 2])
+        c.add({'a': "1"}, 1.5)
+        snapshot = c.snapshot()
+
+        # Without the collector, the caches are kept in the process
+        result = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(snapshot.get_items(), result.get_items())
+        self.assertEqual(snapshot.get_versions(), result.get_versions())
+        self.assertEqual(({'app': "my_app"}, "h", "histogram"),
+                         (result.const_labels, result.name, result.REPR_STR))
+        self.assertIsNot(c, result.collector)
+        self.assertIs(result.collector,
+                      pickle.loads(pickle.dumps(snapshot)).collector)
+
+    def test_evict_unpickled(self):
+        collectors.evict_unpickled_collectors(0)
+        c = Counter("c", "C.", {'app': "my_app"})
+        snapshots = [c.snapshot()]
+        c.const_labels = {'app': "other_app"}
+        snapshots.append(c.snapshot())
+        snapshots.append(Gauge("g", "G.").snapshot())
+
+        results = [pickle.loads(pickle.dumps(i)) for i in snapshots]
+        self.assertEqual(3, len(set(i.collector for i in results)))
+
+        # The least recently used are dropped
+        pickle.loads(pickle.dumps(snapshots[0]))
+        collectors.evict_unpickled_collectors(2)
+        self.assertIs(results[0].collector,
+                      pickle.loads(pickle.dumps(snapshots[0])).collector)
+        self.assertIsNot(results[1].collector,
+                         pickle.loads(pickle.dumps(snapshots[1])).collector)
+
+    def test_caches(self):
+        c = Counter("c", "C.", {'app': "my_app"})
+        snapshot = c.snapshot()
+
+        # The caches of the formats are the ones of the collector
+        snapshot.text_lines = ("index", {}, [])
+        self.assertEqual(("index", {}, []), c.text_lines)
+        self.assertIs(c.protobuf_labels, snapshot.protobuf_labels)
+
 
 class TestCounter(unittest.TestCase):
 
@@ -238,6 +466,23 @@ class TestCounter(unittest.TestCase):
 
         self.assertEqual(sum(range(iterations)), self.c.get(labels))
 
+    def test_inc_concurrent(self):
+        labels = {'country': "sp", "device": "desktop"}
+        threads = 8
+        iterations = 1000
+
+        def inc():
+            for i in range(iterations):
+                self.c.inc(labels)
+
+        workers = [threading.Thread(target=inc) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(threads * iterations, self.c.get(labels))
+
     def test_negative_add(self):
         labels = {'country': "sp", "device": "desktop"}
 
@@ -245,6 +490,71 @@ class TestCounter(unittest.TestCase):
             self.c.add(labels, -1)
         self.assertEqual('Counters can\'t decrease', str(context.exception))
 
+    def test_add_many(self):
+        labels = {'country': "sp", "device": "desktop"}
+        values = [1, 2, 3.5]
+
+        self.c.add_many(labels, values)
+        self.c.add_many(labels, array.array('i', [1, 2]))
+        self.c.labels(labels).add_many(values)
+        self.assertEqual(16, self.c.get(labels))
+
+        with self.assertRaises(ValueError) as context:
+            self.c.add_many(labels, [1, -1])
+        self.assertEqual('Counters can\'t decrease', str(context.exception))
+        self.assertEqual(16, self.c.get(labels))
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_add_many_numpy(self):
+        labels = {'country': "sp", "device": "desktop"}
+
+        self.c.add_many(labels, numpy.arange(10))
+        self.c.add_many(labels, numpy.array([0.5, 0.5]))
+        self.assertEqual(46, self.c.get(labels))
+
+    def test_labels(self):
+        labels = {'country': "sp", "device": "desktop"}
+        iterations = 100
+
+        child = self.c.labels(labels)
+        self.assertIs(child, self.c.labels(labels))
+
+        for i in range(iterations):
+            child.inc()
+            child.add(i)
+
+        self.assertEqual(iterations + sum(range(iterations)),
+                         self.c.get(labels))
+        self.assertEqual(self.c.get(labels), child.get())
+
+        # Shared with the collector methods
+        self.c.inc(labels)
+        self.assertEqual(self.c.get(labels), child.get())
+        self.assertEqual(1, len(self.c.values))
+
+        with self.assertRaises(ValueError) as context:
+            child.add(-1)
+        self.assertEqual('Counters can\'t decrease', str(context.exception))
+
+    def test_labels_positional(self):
+        c = Counter("http_requests_total", "Total requests.",
+                    labelnames=('method', 'code'))
+        iterations = 100
+
+        for i in range(iterations):
+            c.labels("GET", "200").inc()
+        c.labels("POST", "500").add(3)
+
+        self.assertEqual(iterations, c.get({'method': "GET", 'code': "200"}))
+        self.assertEqual(3, c.get({'method': "POST", 'code': "500"}))
+        self.assertEqual(2, len(c.values))
+
+    def test_labels_wrong(self):
+        with self.assertRaises(ValueError) as context:
+            self.c.labels({'job': "my_job"})
+
+        self.assertEqual('Labels not correct', str(context.exception))
+
 
 class TestGauge(unittest.TestCase):
 
@@ -356,6 +666,13 @@ class TestGauge(unittest.TestCase):
         self.assertEqual(sum(map(lambda x: -x, range(iterations))),
                          self.g.get(labels))
 
+    def test_add_many(self):
+        labels = {'max': "10T", 'dev': "sdc"}
+
+        self.g.add_many(labels, [1, -2, 3.5])
+        self.g.labels(labels).add_many(array.array('d', [-1, 2]))
+        self.assertEqual(3.5, self.g.get(labels))
+
     def test_sub(self):
         iterations = 100
         labels = {'max': "10T", 'dev': "sdc"}
@@ -375,6 +692,25 @@ class TestGauge(unittest.TestCase):
 
         self.assertEqual(sum(range(iterations)), self.g.get(labels))
 
+    def test_labels(self):
+        labels = {'max': "10T", 'dev': "sdc"}
+        iterations = 100
+
+        child = self.g.labels(labels)
+        self.assertIs(child, self.g.labels(labels))
+
+        child.set(iterations)
+        for i in range(iterations):
+            child.inc()
+            child.dec()
+            child.add(i)
+            child.sub(i)
+            child.dec()
+
+        self.assertEqual(0, self.g.get(labels))
+        self.assertEqual(0, child.get())
+        self.assertEqual(1, len(self.g.values))
+
 
 class TestSummary(unittest.TestCase):
 
@@ -447,6 +783,103 @@ class TestSummary(unittest.TestCase):
         }
         self.assertEqual(correct_data, self.s.get(labels))
 
+    def test_query_without_lock(self):
+        locked = []
+
+        class LockSummary(Summary):
+            def _summarize(self, e):
+                locked.append(self.mutex.locked())
+                return super()._summarize(e)
+
+        s = LockSummary(**self.data)
+        for i in range(10):
+            s.add({'handler': str(i)}, i)
+
+        # The estimators are queried without blocking the updates
+        s.get({'handler': "1"})
+        s.get_all()
+        s.snapshot()
+        self.assertTrue(locked)
+        self.assertFalse(any(locked))
+
+    def test_labels(self):
+        labels = {'handler': '/static'}
+        values = [3, 5.2, 13, 4]
+
+        child = self.s.labels(labels)
+        self.assertIs(child, self.s.labels(labels))
+
+        for i in values:
+            child.observe(i)
+
+        correct_data = {
+            'sum': 25.2,
+            'count': 4,
+            0.50: 4.0,
+            0.90: 5.2,
+            0.99: 5.2,
+        }
+        self.assertEqual(correct_data, child.get())
+        self.assertEqual(correct_data, self.s.get(labels))
+
+        # The estimators can't be replaced by a value
+        self.assertFalse(hasattr(child, 'set'))
+
+        with self.assertRaises(TypeError) as context:
+            child.add("3")
+        self.assertEqual("Summary only works with digits (int, float)",
+                         str(context.exception))
+
+    def test_add_concurrent(self):
+        labels = {'handler': '/static'}
+        threads = 8
+        iterations = 500
+
+        def observe():
+            for i in range(iterations):
+                self.s.add(labels, i)
+
+        workers = [threading.Thread(target=observe) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(threads * iterations, self.s.get(labels)['count'])
+
+    def test_add_many(self):
+        labels = {'handler': '/static'}
+        values = [3, 5.2, 13, 4]
+
+        self.s.add_many(labels, values[:2])
+        self.s.labels(labels).observe_many(array.array('d', values[2:]))
+
+        correct_data = {
+            'sum': 25.2,
+            'count': 4,
+            0.50: 4.0,
+            0.90: 5.2,
+            0.99: 5.2,
+        }
+        self.assertEqual(correct_data, self.s.get(labels))
+
+        with self.assertRaises(TypeError) as context:
+            self.s.add_many(labels, [1, "2"])
+        self.assertEqual("Summary only works with digits (int, float)",
+                         str(context.exception))
+        self.assertEqual(4, self.s.get(labels)['count'])
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_add_numpy(self):
+        labels = {'handler': '/static'}
+
+        self.s.add(labels, numpy.float64(3))
+        self.s.add(labels, numpy.int64(5))
+        self.s.add_many(labels, numpy.array([13, 4]))
+
+        self.assertEqual(4, self.s.get(labels)['count'])
+        self.assertEqual(25, self.s.get(labels)['sum'])
+
     def test_add_wrong_types(self):
         labels = None
         values = ["3", (1, 2), {'1': 2}, True]
@@ -456,3 +889,260 @@ class TestSummary(unittest.TestCase):
                 self.s.add(labels, i)
         self.assertEqual("Summary only works with digits (int, float)",
                          str(context.exception))
+
+
+class TestHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'name': "http_request_duration_seconds",
+            'help_text': "Request duration per application",
+            'const_labels': {"app": "my_app"},
+            'buckets': [0.5, 1, 5],
+        }
+
+        self.h = Histogram(**self.data)
+
+    def test_buckets(self):
+        inf = float("inf")
+        self.assertEqual((0.5, 1.0, 5.0, inf), self.h.upper_bounds)
+        self.assertEqual(Histogram.DEFAULT_BUCKETS,
+                         Histogram("h", "H.").upper_bounds)
+        self.assertEqual((1.0, inf),
+                         Histogram("h", "H.", buckets=[1, inf]).upper_bounds)
+
+        for buckets in ([1, 0.5], [1, 1]):
+            with self.assertRaises(ValueError) as context:
+                Histogram("h", "H.", buckets=buckets)
+            self.assertEqual("Buckets not in sorted order",
+                             str(context.exception))
+
+    def test_add_get(self):
+        labels = {'handler': '/static'}
+        values = [0.1, 0.5, 0.7, 3, 13]
+
+        for i in values:
+            self.h.add(labels, i)
+
+        correct_data = {
+            0.5: 2,
+            1.0: 3,
+            5.0: 4,
+            float("inf"): 5,
+            'sum': 17.3,
+            'count': 5,
+        }
+        self.assertEqual(correct_data, self.h.get(labels))
+
+    def test_add_get_without_labels(self):
+        self.h.add(None, 2)
+
+        self.assertEqual(1, len(self.h.values))
+        correct_data = {
+            0.5: 0,
+            1.0: 0,
+            5.0: 1,
+            float("inf"): 1,
+            'sum': 2.0,
+            'count': 1,
+        }
+        self.assertEqual(correct_data, self.h.get(None))
+
+    def test_labels(self):
+        labels = {'handler': '/static'}
+
+        child = self.h.labels(labels)
+        self.assertIs(child, self.h.labels(labels))
+
+        child.observe(0.2)
+        child.observe_many([0.7, 6])
+
+        correct_data = {
+            0.5: 1,
+            1.0: 2,
+            5.0: 2,
+            float("inf"): 3,
+            'sum': 6.9,
+            'count': 3,
+        }
+        self.assertEqual(correct_data, child.get())
+        self.assertEqual(correct_data, self.h.get(labels))
+
+        # The counts can't be replaced by a value
+        self.assertFalse(hasattr(child, 'set'))
+
+        with self.assertRaises(TypeError) as context:
+            child.add("3")
+        self.assertEqual("Histogram only works with digits (int, float)",
+                         str(context.exception))
+
+    def test_add_many(self):
+        labels = {'handler': '/static'}
+
+        self.h.add_many(labels, [0.1, 0.5])
+        self.h.add_many(labels, array.array('d', [0.7, 3, 13]))
+        self.assertEqual(5, self.h.get(labels)['count'])
+        self.assertEqual(2, self.h.get(labels)[0.5])
+
+        with self.assertRaises(TypeError) as context:
+            self.h.add_many(labels, [1, "2"])
+        self.assertEqual("Histogram only works with digits (int, float)",
+                         str(context.exception))
+        self.assertEqual(5, self.h.get(labels)['count'])
+
+    def test_add_concurrent(self):
+        labels = {'handler': '/static'}
+        threads = 8
+        iterations = 500
+
+        def observe():
+            for i in range(iterations):
+                self.h.add(labels, i % 10)
+
+        workers = [threading.Thread(target=observe) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(threads * iterations, self.h.get(labels)['count'])
+        self.assertEqual(threads * iterations * 6 // 10,
+                         self.h.get(labels)[5.0])
+
+    def test_bucket_label(self):
+        with self.assertRaises(ValueError) as context:
+            self.h.add({'le': "1"}, 1)
+        self.assertEqual("Labels not correct", str(context.exception))
+
+        with self.assertRaises(ValueError) as context:
+            Histogram("h", "H.", labelnames=("le", ))
+        self.assertEqual("Labels not correct", str(context.exception))
+
+    def test_add_wrong_types(self):
+        values = ["3", (1, 2), {'1': 2}, True]
+
+        for i in values:
+            with self.assertRaises(TypeError) as context:
+                self.h.add(None, i)
+        self.assertEqual("Histogram only works with digits (int, float)",
+                         str(context.exception))
+
+
+class TestShardedCounter(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'name': "logged_users_total",
+            'help_text': "Logged users in the application",
+            'const_labels': {"app": "my_app"},
+        }
+
+        self.c = ShardedCounter(**self.data)
+
+    def _run_threads(self, target, threads=8):
+        workers = [threading.Thread(target=target) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+    def test_is_counter(self):
+        self.assertTrue(isinstance(self.c, Counter))
+
+    def test_inc_concurrent(self):
+        labels = {'country': "sp", "device": "desktop"}
+        threads = 8
+        iterations = 1000
+
+        def inc():
+            child = self.c.labels(labels)
+            for i in range(iterations):
+                self.c.inc(labels)
+                child.add(2)
+
+        self._run_threads(inc, threads)
+
+        self.assertEqual(threads * iterations * 3, self.c.get(labels))
+        self.assertEqual(1, len(self.c.values))
+
+    def test_get_all(self):
+        data = (
+            ({'country': "sp", "device": "desktop"}, 520),
+            ({'country': "us", "device": "mobile"}, 654),
+            ({'country': "uk", "device": "desktop"}, 1001),
+        )
+
+        def add():
+            for labels, value in data:
+                self.c.add(labels, value)
+
+        self._run_threads(add, 2)
+        self.c.inc(data[0][0])
+
+        sort_fn = lambda x: x[0]['country']
+        valid_data = [(data[0][0], 1041), (data[1][0], 1308),
+                      (data[2][0], 2002)]
+        self.assertEqual(sorted(valid_data, key=sort_fn),
+                         sorted(self.c.get_all(), key=sort_fn))
+
+    def test_set(self):
+        labels = {'country': "sp", "device": "desktop"}
+
+        self.c.add(labels, 10)
+        self._run_threads(lambda: self.c.add(labels, 10))
+        self.c.set(labels, 5)
+        self.assertEqual(5, self.c.get(labels))
+
+        self.c.inc(labels)
+        self._run_threads(lambda: self.c.inc(labels), 2)
+        self.assertEqual(8, self.c.get(labels))
+
+    def test_negative_add(self):
+        labels = {'country': "sp", "device": "desktop"}
+
+        with self.assertRaises(ValueError) as context:
+            self.c.add(labels, -1)
+        self.assertEqual('Counters can\'t decrease', str(context.exception))
+
+        with self.assertRaises(ValueError) as context:
+            self.c.labels(labels).add(-1)
+        self.assertEqual('Counters can\'t decrease', str(context.exception))
+
+
+class TestShardedGauge(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'name': "hdd_disk_used",
+            'help_text': "Disk space used",
+            'const_labels': {"server": "1.db.production.my-app"},
+        }
+
+        self.g = ShardedGauge(**self.data)
+
+    def test_is_gauge(self):
+        self.assertTrue(isinstance(self.g, Gauge))
+
+    def test_inc_dec_concurrent(self):
+        labels = {'max': "10T", 'dev': "sdc"}
+        threads = 8
+        iterations = 1000
+        self.g.set(labels, 100)
+
+        def update():
+            child = self.g.labels(labels)
+            for i in range(iterations):
+                self.g.inc(labels)
+                self.g.add(labels, 2)
+                child.dec()
+                child.sub(1)
+
+        workers = [threading.Thread(target=update) for i in range(threads)]
+        for t in workers:
+            t.start()
+        self.g.inc(labels)
+        for t in workers:
+            t.join()
+
+        self.assertEqual(101 + threads * iterations, self.g.get(labels))
+
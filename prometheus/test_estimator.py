@@ -0,0 +1,106 @@
+import random
+import unittest
+
+import quantile
+
+from prometheus.estimator import BufferedEstimator
+
+
+class TestBufferedEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.invariants = [(0.50, 0.05), (0.90, 0.01), (0.99, 0.001)]
+        random.seed(42)
+
+    def _estimators(self, data):
+        """ Returns a quantile.Estimator and a BufferedEstimator per
+            invariant, with the data observed
+        """
+
+        # quantile.Estimator compresses its samples again in every query (even
+        # without new observations), so only the first query of each
+        # estimator with pending observations is comparable
+        result = []
+        for i in self.invariants:
+            expected = quantile.Estimator(*self.invariants)
+            buffered = BufferedEstimator(*self.invariants)
+            for v in data:
+                expected.observe(v)
+                buffered.observe(v)
+            result.append((i[0], expected, buffered))
+
+        return result
+
+    def test_empty(self):
+        e = BufferedEstimator(*self.invariants)
+
+        self.assertEqual(0, e.query(0.5))
+        self.assertEqual(0, e._observations)
+        self.assertEqual(0, e._sum)
+
+    def test_same_as_estimator(self):
+        for size in (1, 3, 511, 513, 1500, 5000):
+            data = [random.uniform(0, 100) for i in range(size)]
+
+            for q, expected, result in self._estimators(data):
+                self.assertEqual(expected.query(q), result.query(q))
+                self.assertEqual(expected._observations, result._observations)
+                self.assertAlmostEqual(expected._sum, result._sum)
+
+    def test_queries_between_observations(self):
+        expected = quantile.Estimator(*self.invariants)
+        result = BufferedEstimator(*self.invariants)
+
+        for i in range(3000):
+            v = random.expovariate(1)
+            expected.observe(v)
+            result.observe(v)
+            if i % 700 == 0:
+                self.assertEqual(expected.query(0.9), result.query(0.9))
+
+    def test_repeated_queries(self):
+        e = BufferedEstimator(*self.invariants)
+        for i in range(2000):
+            e.observe(random.uniform(0, 100))
+
+        results = [e.query(q) for q, _ in self.invariants]
+        samples = len(e._samples)
+
+        self.assertEqual(results, [e.query(q) for q, _ in self.invariants])
+        self.assertEqual(samples, len(e._samples))
+
+    def test_observe_many(self):
+        data = [random.uniform(0, 100) for i in range(2000)]
+
+        for q, expected, _ in self._estimators(data):
+            # Chunks that don't fill the buffer and chunks that overflow it
+            result = BufferedEstimator(*self.invariants)
+            result.observe(data[0])
+            result.observe_many(data[1:100])
+            result.observe_many(data[100:1500])
+            result.observe_many([])
+            result.observe_many(data[1500:])
+
+            self.assertEqual(expected.query(q), result.query(q))
+            self.assertEqual(2000, result._observations)
+            self.assertAlmostEqual(expected._sum, result._sum)
+
+    def test_copy(self):
+        e = BufferedEstimator(*self.invariants)
+        for i in range(1000):
+            e.observe(random.uniform(0, 100))
+        buffered = list(e._buffer)
+        samples = [list(i) for i in e._samples]
+
+        # The queries of the copy don't change the estimator
+        result = e.copy()
+        self.assertEqual([e.copy().query(q) for q, _ in self.invariants],
+                         [result.query(q) for q, _ in self.invariants])
+        self.assertEqual(buffered, e._buffer)
+        self.assertEqual(samples, e._samples)
+
+        # And they are the same as the ones of the estimator
+        self.assertEqual([e.query(q) for q, _ in self.invariants],
+                         [result.query(q) for q, _ in self.invariants])
+        self.assertEqual((e._observations, e._sum),
+                         (result._observations, result._sum))
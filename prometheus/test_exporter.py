@@ -1,12 +1,17 @@
+from http.client import HTTPConnection
 from http.server import HTTPServer
+import socket
 import unittest
 import threading
+import time
 import urllib
+import zlib
 
 import requests
 
 from prometheus.collectors import Collector, Counter, Gauge, Summary
-from prometheus.exporter import PrometheusMetricHandler
+from prometheus.exporter import (PrometheusMetricHandler, ResponseCache,
+                                 start_http_server)
 from prometheus.formats import TextFormat
 from prometheus.registry import Registry
 
@@ -27,10 +32,12 @@ class TestTextExporter(unittest.TestCase):
     def setUp(self):
         # Create the registry
         self.registry = Registry()
+        self.cache = None
 
         # Handler hack
         def handler(*args, **kwargs):
-            TestPrometheusMetricHandler(self.registry, *args, **kwargs)
+            TestPrometheusMetricHandler(self.registry, *args,
+                                        cache=self.cache, **kwargs)
 
         self.server = HTTPServer(('', TEST_PORT), handler)
 
@@ -214,6 +221,299 @@ summary_test{quantile="0.99",s_sample="3",type="summary"} 3494.0
         self.assertEqual(200, r.status_code)
         self.assertEqual(valid_data, r.text)
 
+    def test_chunked(self):
+        for name in ("b_counter", "a_counter"):
+            c = Counter(name, "Test Counter.")
+            c.set(None, 1)
+            self.registry.register(c)
+
+        headers = {'accept': 'text/plain; version=0.0.4'}
+        url = urllib.parse.urljoin(TEST_URL, TEST_METRICS_PATH[1:])
+        r = requests.get(url, headers=headers)
+
+        valid_data = """# HELP a_counter Test Counter.
+# TYPE a_counter counter
+a_counter 1
+# HELP b_counter Test Counter.
+# TYPE b_counter counter
+b_counter 1
+"""
+        self.assertEqual("chunked", r.headers['transfer-encoding'])
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(valid_data, r.text)
+
+    def test_http_1_0(self):
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        # HTTP/1.0 clients get the response without chunks
+        with socket.create_connection((TEST_HOST, TEST_PORT)) as conn:
+            conn.sendall("GET {0} HTTP/1.0\r\n\r\n".format(
+                TEST_METRICS_PATH).encode("ascii"))
+            response = b""
+            data = conn.recv(4096)
+            while data:
+                response += data
+                data = conn.recv(4096)
+
+        head, body = response.split(b"\r\n\r\n", 1)
+        self.assertNotIn(b"Transfer-Encoding", head)
+        self.assertEqual(b"""# HELP test_counter Test Counter.
+# TYPE test_counter counter
+test_counter 1
+""", body)
+
+    def _get_raw(self, accept_encoding):
+        """Returns the response with the body without decoding"""
+        # Without keep-alive, the server handles one connection at a time
+        headers = {'accept': 'text/plain; version=0.0.4',
+                   'accept-encoding': accept_encoding,
+                   'connection': 'close'}
+        url = urllib.parse.urljoin(TEST_URL, TEST_METRICS_PATH[1:])
+        r = requests.get(url, headers=headers, stream=True)
+
+        return r, r.raw.read(decode_content=False)
+
+    def test_gzip(self):
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        valid_data = b"""# HELP test_counter Test Counter.
+# TYPE test_counter counter
+test_counter 1
+"""
+        r, body = self._get_raw("gzip, deflate")
+
+        self.assertEqual("gzip", r.headers['content-encoding'])
+        self.assertEqual("chunked", r.headers['transfer-encoding'])
+        self.assertEqual(valid_data,
+                         zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+        r, body = self._get_raw("gzip;q=0, deflate")
+        self.assertEqual("deflate", r.headers['content-encoding'])
+        self.assertEqual(valid_data, zlib.decompress(body))
+
+        r, body = self._get_raw("identity")
+        self.assertNotIn('content-encoding', r.headers)
+        self.assertEqual(valid_data, body)
+
+    def test_cache(self):
+        self.cache = ResponseCache(max_age=0.5)
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        r, body = self._get_raw("gzip")
+        self.assertEqual(str(len(body)), r.headers['content-length'])
+        self.assertNotIn('transfer-encoding', r.headers)
+
+        # The requests in the max age get the same response
+        c.set(None, 2)
+        r, cached_body = self._get_raw("gzip")
+        self.assertEqual(body, cached_body)
+        self.assertIn(b"test_counter 1",
+                      zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+        # Cached by encoding
+        r, plain_body = self._get_raw("identity")
+        self.assertIn(b"test_counter 2", plain_body)
+
+        time.sleep(0.5)
+        r, body = self._get_raw("gzip")
+        self.assertIn(b"test_counter 2",
+                      zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+    def test_cache_generation(self):
+        self.cache = ResponseCache(max_age=0)
+        c = Counter("test_counter", "Test Counter.")
+        c.set(None, 1)
+        self.registry.register(c)
+
+        r, body = self._get_raw("identity")
+        created = [v[0] for v in self.cache.responses.values()]
+
+        # The registry didn't change, the response is not created again
+        r, cached_body = self._get_raw("identity")
+        self.assertEqual(body, cached_body)
+        self.assertEqual(created,
+                         [v[0] for v in self.cache.responses.values()])
+
+        c.inc(None)
+        r, body = self._get_raw("identity")
+        self.assertIn(b"test_counter 2", body)
+
+        self.registry.register(Counter("other_counter", "Test Counter."))
+        r, body = self._get_raw("identity")
+        self.assertIn(b"other_counter", body)
+
     def tearDown(self):
         self.server.shutdown()
         self.server.socket.close()
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_keys(self):
+        cache = ResponseCache(max_age=10)
+        started = threading.Event()
+        release = threading.Event()
+        created = []
+        results = []
+
+        def slow_create():
+            created.append(1)
+            started.set()
+            release.wait(5)
+            return b"slow"
+
+        def get():
+            results.append(cache.get('slow', 1, slow_create))
+
+        threads = [threading.Thread(target=get) for i in range(2)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+
+        # The other keys don't wait for the slow response
+        self.assertEqual(b"fast", cache.get('fast', 1, lambda: b"fast"))
+        self.assertEqual(b"fast", cache.get('fast', 1, lambda: b"other"))
+        self.assertEqual([], results)
+
+        # The requests of the slow response share it
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual([b"slow", b"slow"], results)
+        self.assertEqual(1, len(created))
+
+
+class TestHTTPServer(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.counter = Counter("test_counter", "Test Counter.")
+        self.counter.set(None, 1)
+        self.registry.register(self.counter)
+
+        self.url = urllib.parse.urljoin(TEST_URL, TEST_METRICS_PATH[1:])
+        self.threads = set(threading.enumerate())
+        self.server = start_http_server(
+            self.registry, TEST_PORT, workers=4,
+            handler_class=TestPrometheusMetricHandler)
+
+    def test_daemon(self):
+        # The workers, the server and the waiter of the idle connections
+        threads = set(threading.enumerate()) - self.threads
+        self.assertEqual(6, len(threads))
+        self.assertTrue(all(t.daemon for t in threads))
+
+    def test_keep_alive(self):
+        conn = HTTPConnection(TEST_HOST, TEST_PORT)
+        for i in range(3):
+            self.counter.inc(None)
+            conn.request("GET", TEST_METRICS_PATH)
+            r = conn.getresponse()
+
+            self.assertEqual(200, r.status)
+            self.assertIn("test_counter {0}".format(i + 2).encode("ascii"),
+                          r.read())
+            self.assertFalse(r.will_close)
+
+            if i == 0:
+                sock = conn.sock
+            self.assertIs(sock, conn.sock)
+        conn.close()
+
+    def test_idle_connections(self):
+        # The idle kept-alive connections don't hold the workers
+        sessions = [requests.Session() for i in range(self.server.workers + 1)]
+        for i in range(3):
+            for session in sessions:
+                r = session.get(self.url, timeout=5)
+                self.assertEqual(200, r.status_code)
+        for session in sessions:
+            session.close()
+
+    def test_idle_timeout(self):
+        class ShortTimeoutHandler(TestPrometheusMetricHandler):
+            timeout = 0.2
+
+        server = start_http_server(self.registry, TEST_PORT + 1, workers=1,
+                                   handler_class=ShortTimeoutHandler)
+        conn = HTTPConnection(TEST_HOST, TEST_PORT + 1)
+        conn.request("GET", TEST_METRICS_PATH)
+        conn.getresponse().read()
+
+        # The idle connection is closed by the server after the timeout
+        conn.sock.settimeout(5)
+        self.assertEqual(b"", conn.sock.recv(1))
+        conn.close()
+
+        server.shutdown()
+        server.server_close()
+
+    def test_not_found(self):
+        r = requests.get(urllib.parse.urljoin(TEST_URL, "other"))
+        self.assertEqual(404, r.status_code)
+
+    def test_no_timeout(self):
+        class NoTimeoutHandler(TestPrometheusMetricHandler):
+            timeout = None
+
+        server = start_http_server(self.registry, TEST_PORT + 1, workers=1,
+                                   handler_class=NoTimeoutHandler)
+
+        # The idle connections wait without deadline
+        with requests.Session() as session:
+            for i in range(3):
+                r = session.get("http://{0}:{1}{2}".format(
+                    TEST_HOST, TEST_PORT + 1, TEST_METRICS_PATH), timeout=5)
+                self.assertEqual(200, r.status_code)
+
+        server.shutdown()
+        server.server_close()
+
+    def test_slow_scraper(self):
+        # A client that doesn't finish its request doesn't block the others
+        with socket.create_connection((TEST_HOST, TEST_PORT)) as conn:
+            conn.sendall(b"GET /metrics HTTP/1.1\r\n")
+            r = requests.get(self.url, timeout=5)
+            self.assertEqual(200, r.status_code)
+
+            # And it's served when it finishes
+            conn.sendall(b"Connection: close\r\n\r\n")
+            response = b""
+            data = conn.recv(4096)
+            while data:
+                response += data
+                data = conn.recv(4096)
+            self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+
+    def test_concurrent_scrapers(self):
+        scrapers = 16
+        scrapes = 20
+        results = []
+
+        def scrape():
+            with requests.Session() as session:
+                for i in range(scrapes):
+                    r = session.get(self.url, timeout=10)
+                    results.append((r.status_code,
+                                    "# TYPE test_counter counter" in r.text))
+
+        # The scrapers and the updates at the same time
+        threads = [threading.Thread(target=scrape) for i in range(scrapers)]
+        for t in threads:
+            t.start()
+        for i in range(1000):
+            self.counter.inc(None)
+        for t in threads:
+            t.join()
+
+        self.assertEqual([(200, True)] * scrapers * scrapes, results)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,9 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
 import re
+import threading
 import time
 import unittest
 
-from prometheus.collectors import Collector, Counter, Gauge, Summary
-from prometheus.formats import TextFormat, ProtobufFormat, ProtobufTextFormat
+from prometheus.collectors import (Collector, Counter, Gauge, Summary,
+                                   Histogram, ShardedCounter)
+from prometheus.formats import (TextFormat, ProtobufFormat, ProtobufTextFormat,
+                                marshall_parallel)
 from prometheus.pb2 import metrics_pb2
 from prometheus.registry import Registry
 from prometheus import utils
@@ -204,6 +208,21 @@ logged_users_total{country="ch",device="mobile"} 654 \d*(?:.\d*)?$"""
 
         self.assertTrue(re.match(result_regex, result))
 
+    def test_collector_timestamp(self):
+        c = Counter("logged_users_total", "Logged users in the application")
+
+        for i in range(100):
+            c.set_value({'country': str(i)}, i)
+
+        f_with_ts = TextFormat(True)
+        lines = [i for i in f_with_ts.marshall_lines(c)
+                 if not i.startswith("#")]
+        timestamps = {i.rsplit(" ", 1)[1] for i in lines}
+
+        # All the lines of a collector have the same timestamp
+        self.assertEqual(100, len(lines))
+        self.assertEqual(1, len(timestamps))
+
     def test_single_counter_format_text(self):
 
         name = "prometheus_dns_sd_lookups_total"
@@ -230,6 +249,146 @@ prometheus_dns_sd_lookups_total 10"""
 
         self.assertEqual(valid_result, result)
 
+    def test_sharded_counter_format_text(self):
+        c = ShardedCounter("logged_users_total",
+                           "Logged users in the application", {'app': "my_app"})
+
+        def inc():
+            for i in range(100):
+                c.inc({'country': "sp"})
+
+        workers = [threading.Thread(target=inc) for i in range(4)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        c.add({'country': "us"}, 3)
+
+        valid_result = """# HELP logged_users_total Logged users in the application
+# TYPE logged_users_total counter
+logged_users_total{app="my_app",country="sp"} 400
+logged_users_total{app="my_app",country="us"} 3"""
+
+        f = TextFormat()
+        self.assertEqual(valid_result, f.marshall_collector(c))
+
+    def test_cached_prefixes(self):
+        c = Counter("logged_users_total", "Logged users in the application",
+                    {'app': "my_app"})
+        c.set({'country': "sp"}, 1)
+
+        f = TextFormat()
+        f.marshall_collector(c)
+        self.assertEqual(
+            {(('country', "sp"), ): 'logged_users_total{app="my_app",country="sp"}'},
+            c.text_prefixes)
+
+        # Only the values change between marshalls
+        c.set({'country': "sp"}, 2)
+        valid_result = """# HELP logged_users_total Logged users in the application
+# TYPE logged_users_total counter
+logged_users_total{app="my_app",country="sp"} 2"""
+        self.assertEqual(valid_result, TextFormat().marshall_collector(c))
+
+        # The const labels change the rendered labels
+        c.const_labels = {'app': "other_app"}
+        self.assertEqual({}, c.text_prefixes)
+
+        valid_result = """# HELP logged_users_total Logged users in the application
+# TYPE logged_users_total counter
+logged_users_total{app="other_app",country="sp"} 2"""
+        self.assertEqual(valid_result, f.marshall_collector(c))
+
+    def test_changed_series(self):
+        c = Summary("request_seconds", "Request duration.", {'app': "my_app"})
+        for i in range(3):
+            c.add({'handler': str(i)}, i)
+
+        f = TextFormat()
+        result = f.marshall_collector(c)
+        lines = c.text_lines[2]
+
+        # Nothing changed, the same lines
+        self.assertEqual(result, f.marshall_collector(c))
+        for old, new in zip(lines, c.text_lines[2]):
+            self.assertIs(old, new)
+
+        # Only the lines of the changed series are rendered again
+        c.add({'handler': "1"}, 10)
+        result = f.marshall_collector(c)
+        key = c.values.__keytransform__({'handler': "1"})
+        for (k, value_key, prefix), old, new in zip(
+                c.text_index[0], lines, c.text_lines[2]):
+            if k == key:
+                self.assertNotEqual(old, new)
+            else:
+                self.assertIs(old, new)
+        self.assertEqual(TextFormat().marshall_collector(c), result)
+
+        # A new series and a gauge with timestamps, the same as a fresh render
+        c.add({'handler': "3"}, 5)
+        self.assertEqual(TextFormat().marshall_collector(c),
+                         f.marshall_collector(c))
+
+        g = Gauge("gauge_test", "A gauge.")
+        g.set({'g_sample': "1"}, 1)
+        f = TextFormat(True)
+        result = f.marshall_collector(g)
+        self.assertEqual((None, {}, []), g.text_lines)
+        g.set({'g_sample': "1"}, 2)
+        self.assertNotEqual(result, f.marshall_collector(g))
+
+    def test_ordered_index(self):
+        c = Counter("logged_users_total", "Logged users in the application")
+        c.set({'country': "us"}, 1)
+        c.set({'country': "es", 'device': "mobile"}, 2)
+
+        valid_result = """# HELP logged_users_total Logged users in the application
+# TYPE logged_users_total counter
+logged_users_total{country="es",device="mobile"} 2
+logged_users_total{country="us"} 1"""
+
+        f = TextFormat()
+        self.assertEqual(valid_result, f.marshall_collector(c))
+
+        # The index is reused while the series don't change
+        index = c.text_index[0]
+        c.set({'country': "us"}, 3)
+        f.marshall_collector(c)
+        self.assertIs(index, c.text_index[0])
+
+        c.set({'country': "ch"}, 4)
+        valid_result = """# HELP logged_users_total Logged users in the application
+# TYPE logged_users_total counter
+logged_users_total{country="ch"} 4
+logged_users_total{country="es",device="mobile"} 2
+logged_users_total{country="us"} 3"""
+        self.assertEqual(valid_result, f.marshall_collector(c))
+
+    def test_not_ordered(self):
+        registry = Registry()
+        for name in ("b_counter", "a_counter"):
+            c = Counter(name, "Test counter.")
+            for country in ("us", "es", "ch"):
+                c.set({'country': country}, 1)
+            registry.register(c)
+
+        valid_result = """# HELP b_counter Test counter.
+# TYPE b_counter counter
+b_counter{country="us"} 1
+b_counter{country="es"} 1
+b_counter{country="ch"} 1
+# HELP a_counter Test counter.
+# TYPE a_counter counter
+a_counter{country="us"} 1
+a_counter{country="es"} 1
+a_counter{country="ch"} 1
+"""
+
+        # Registration and insertion order
+        f = TextFormat(ordered=False)
+        self.assertEqual(valid_result, f.marshall(registry))
+
     def test_gauge_format(self):
 
         self.data = {
@@ -588,6 +747,46 @@ prometheus_target_interval_length_seconds{interval="5s",quantile="0.99"} 5.2 \d*
 
         self.assertTrue(re.match(result_regex, result))
 
+    def test_histogram_format_text(self):
+        data = {
+            'name': "http_request_duration_seconds",
+            'help_text': "Request duration.",
+            'const_labels': {'app': "my_app"},
+            'buckets': [0.5, 1, 5, 10],
+        }
+
+        labels = {'handler': '/static'}
+        values = [0.1, 0.5, 0.7, 3, 13]
+
+        valid_result = """# HELP http_request_duration_seconds Request duration.
+# TYPE http_request_duration_seconds histogram
+http_request_duration_seconds_bucket{app="my_app",handler="/static",le="0.5"} 2
+http_request_duration_seconds_bucket{app="my_app",handler="/static",le="1.0"} 3
+http_request_duration_seconds_bucket{app="my_app",handler="/static",le="5.0"} 4
+http_request_duration_seconds_bucket{app="my_app",handler="/static",le="10.0"} 4
+http_request_duration_seconds_bucket{app="my_app",handler="/static",le="+Inf"} 5
+http_request_duration_seconds_sum{app="my_app",handler="/static"} 17.3
+http_request_duration_seconds_count{app="my_app",handler="/static"} 5
+http_request_duration_seconds_bucket{app="my_app",handler="/users",le="0.5"} 1
+http_request_duration_seconds_bucket{app="my_app",handler="/users",le="1.0"} 1
+http_request_duration_seconds_bucket{app="my_app",handler="/users",le="5.0"} 1
+http_request_duration_seconds_bucket{app="my_app",handler="/users",le="10.0"} 1
+http_request_duration_seconds_bucket{app="my_app",handler="/users",le="+Inf"} 1
+http_request_duration_seconds_sum{app="my_app",handler="/users"} 0.2
+http_request_duration_seconds_count{app="my_app",handler="/users"} 1"""
+
+        h = Histogram(**data)
+
+        for i in values:
+            h.add(labels, i)
+        h.add({'handler': '/users'}, 0.2)
+
+        # In the order of the buckets, not of the text
+        f = TextFormat()
+        result = f.marshall_collector(h)
+
+        self.assertEqual(valid_result, result)
+
     def test_registry_marshall(self):
 
         format_times = 10
@@ -669,6 +868,25 @@ summary_test{quantile="0.99",s_sample="3",type="summary"} \d*(?:.\d*)?
         for i in range(format_times):
             self.assertTrue(re.match(valid_regex, f.marshall(registry)))
 
+    def test_registry_marshall_iter(self):
+        registry = Registry()
+        for name in ("gauge_test", "counter_test", "counter"):
+            c = Counter(name, "A counter.", {'type': "counter"})
+            c.set({'c_sample': '1'}, 100)
+            registry.register(c)
+
+        f = TextFormat()
+        result = list(f.marshall_iter(registry))
+
+        # One block per collector
+        self.assertEqual(3, len(result))
+        self.assertEqual(b"""# HELP counter A counter.
+# TYPE counter counter
+counter{c_sample="1",type="counter"} 100
+""", result[0])
+        self.assertEqual(f.marshall(registry).encode("utf8"),
+                         b"".join(result))
+
 
 class TestProtobufFormat(unittest.TestCase):
 
@@ -825,6 +1043,21 @@ class TestProtobufFormat(unittest.TestCase):
         c2 = self._create_protobuf_object(data, values, metrics_pb2.COUNTER, {}, True)
         self.assertFalse(self._protobuf_metric_equal(c, c2))
 
+    def test_collector_timestamp(self):
+        c = Counter("logged_users_total", "Logged users in the application")
+
+        for i in range(100):
+            c.set_value({'country': str(i)}, i)
+
+        f = ProtobufFormat(True)
+        result = f.marshall_collector(c)
+        timestamps = {i.timestamp_ms for i in result.metric}
+
+        # All the metrics of a collector have the same timestamp
+        self.assertEqual(100, len(result.metric))
+        self.assertEqual(1, len(timestamps))
+        self.assertNotEqual(0, timestamps.pop())
+
     def test_test_protobuf_metric_equal_not_metric(self):
         data = {
             'name': "logged_users_total",
@@ -1243,6 +1476,130 @@ class TestProtobufFormat(unittest.TestCase):
         result = f.marshall_collector(s)
         self.assertTrue(self._protobuf_metric_equal(valid_result, result))
 
+    def test_histogram_format(self):
+        data = {
+            'name': "http_request_duration_seconds",
+            'help_text': "Request duration.",
+            'const_labels': {'app': "my_app"},
+            'buckets': [0.5, 1, 5],
+        }
+
+        labels = {'handler': '/static'}
+        values = [0.1, 0.5, 0.7, 3, 13]
+
+        h = Histogram(**data)
+
+        for i in values:
+            h.add(labels, i)
+
+        # The +Inf bucket is the sample count
+        buckets = [metrics_pb2.Bucket(cumulative_count=c, upper_bound=b)
+                   for b, c in ((0.5, 2), (1.0, 3), (5.0, 4))]
+        metric = metrics_pb2.Metric(
+            label=[metrics_pb2.LabelPair(name="app", value="my_app"),
+                   metrics_pb2.LabelPair(name="handler", value="/static")],
+            histogram=metrics_pb2.Histogram(sample_count=5, sample_sum=17.3,
+                                            bucket=buckets))
+        valid_result = metrics_pb2.MetricFamily(
+            name=data['name'],
+            help=data['help_text'],
+            type=metrics_pb2.HISTOGRAM,
+            metric=[metric])
+
+        f = ProtobufFormat()
+
+        result = f.marshall_collector(h)
+        self.assertEqual(valid_result, result)
+
+    def test_serialize_collector(self):
+        const_labels = {'app': "my_app"}
+        counter = Counter("counter_test", "A counter.", const_labels)
+        gauge = Gauge("gauge_test", "A gauge.")
+        summary = Summary("summary_test", "A summary.", const_labels)
+        histogram = Histogram("histogram_test", "A histogram.", const_labels,
+                              buckets=[0.5, 1, 5])
+
+        counter.set({'c_sample': '1', 'name': "Iñigo"}, 400)
+        counter.set({'app': "other", 'c_sample': 2}, 0)
+        gauge.set({'g_sample': '1'}, -3.5)
+        for i in range(100):
+            summary.add({'s_sample': '1'}, i)
+            histogram.add({'h_sample': '1'}, i / 20)
+        summary.add({'s_sample': '2'}, 1)
+
+        f = ProtobufFormat()
+
+        # The direct encoding is the same as the metrics_pb2 objects (two
+        # times, the second one with the cached labels)
+        for c in (counter, gauge, summary, histogram) * 2:
+            self.assertEqual(f.marshall_collector(c).SerializeToString(),
+                             f.serialize_collector(c))
+
+    def test_cached_labels(self):
+        c = Gauge("gauge_test", "A gauge.", {'app': "my_app"})
+        c.set({'g_sample': '1'}, 800)
+        c.set(None, 400)
+
+        f = ProtobufFormat()
+        result = f.marshall_collector(c)
+
+        # Sorted with the const labels, and encoded once per series
+        self.assertEqual(
+            [[("app", "my_app"), ("g_sample", "1")], [("app", "my_app")]],
+            [[(l.name, l.value) for l in m.label] for m in result.metric])
+        self.assertEqual(2, len(c.protobuf_labels))
+
+        labels = dict(c.protobuf_labels)
+        self.assertEqual(result, f.marshall_collector(c))
+        for k, v in c.protobuf_labels.items():
+            self.assertIs(labels[k], v)
+
+        # The const labels are in the cached labels
+        c.const_labels = None
+        result = f.marshall_collector(c)
+        self.assertEqual(
+            [[("g_sample", "1")], []],
+            [[(l.name, l.value) for l in m.label] for m in result.metric])
+
+    def test_changed_series(self):
+        c = Counter("counter_test", "A counter.", {'app': "my_app"})
+        for i in range(3):
+            c.set({'c_sample': str(i)}, i)
+
+        f = ProtobufFormat()
+        result = f.serialize_collector(c)
+        metrics = dict(c.protobuf_metrics)
+        self.assertEqual(3, len(metrics))
+
+        # Only the changed series is encoded again
+        c.inc({'c_sample': "1"})
+        key = c.values.__keytransform__({'c_sample': "1"})
+        result = f.serialize_collector(c)
+        for k, (version, metric) in c.protobuf_metrics.items():
+            if k == key:
+                self.assertNotEqual(metrics[k], (version, metric))
+            else:
+                self.assertIs(metrics[k][1], metric)
+        self.assertEqual(f.marshall_collector(c).SerializeToString(), result)
+
+        # Nothing is cached with timestamps
+        c = Counter("counter_test", "A counter.")
+        c.inc({'c_sample': "1"})
+        ProtobufFormat(True).serialize_collector(c)
+        self.assertEqual({}, c.protobuf_metrics)
+
+    def test_serialize_collector_const_labels(self):
+        c = Counter("counter_test", "A counter.", {'app': "my_app"})
+        c.set({'c_sample': '1'}, 400)
+
+        f = ProtobufFormat()
+        f.serialize_collector(c)
+
+        # The cached labels include the const labels
+        c.const_labels = {'app': "other_app"}
+        self.assertEqual(f.marshall_collector(c).SerializeToString(),
+                         f.serialize_collector(c))
+
     def test_registry_marshall_counter(self):
 
         format_times = 10
@@ -1312,6 +1669,28 @@ class TestProtobufFormat(unittest.TestCase):
         for i in range(format_times):
             self.assertEqual(valid_result, f.marshall(registry))
 
+    def test_registry_marshall_iter(self):
+        registry = Registry()
+        for name in ("gauge_test", "counter_test", "counter"):
+            c = Counter(name, "A counter.", {'type': "counter"})
+            c.set({'c_sample': '1'}, 100)
+            registry.register(c)
+
+        f = ProtobufFormat()
+        result = list(f.marshall_iter(registry))
+
+        # One delimited message per collector
+        self.assertEqual(3, len(result))
+        family = metrics_pb2.MetricFamily()
+        family.ParseFromString(result[0][1:])
+        self.assertEqual("counter", family.name)
+        self.assertEqual(len(result[0]) - 1, result[0][0])
+        self.assertEqual(f.marshall(registry), b"".join(result))
+
+        f = ProtobufTextFormat()
+        self.assertEqual(f.marshall(registry).encode("utf8"),
+                         b"".join(f.marshall_iter(registry)))
+
 
 class TestProtobufTextFormat(unittest.TestCase):
 
@@ -1589,4 +1968,55 @@ metric {
         f = ProtobufTextFormat(True)
         # Check multiple times to ensure multiple marshalling requests
         for i in range(format_times):
-            self.assertTrue(re.match(valid_regex, f.marshall(registry)))
\ No newline at end of file
+            self.assertTrue(re.match(valid_regex, f.marshall(registry)))
+
+
+class TestParallelMarshall(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        for i in range(5):
+            counter = Counter("counter_{0}".format(i), "A counter.",
+                              {'app': "my_app"})
+            for j in range(i * 10):
+                counter.set({'c_sample': str(j)}, j)
+            self.registry.register(counter)
+
+        summary = Summary("summary_test", "A summary.")
+        histogram = Histogram("histogram_test", "A histogram.",
+                              buckets=[1, 5])
+        for i in range(20):
+            summary.add({'s_sample': str(i % 3)}, i)
+            histogram.add({'h_sample': str(i % 2)}, i / 2)
+        self.registry.register(summary)
+        self.registry.register(histogram)
+
+        self.executor = ProcessPoolExecutor(2)
+
+    def test_marshall(self):
+        for f in (TextFormat(), TextFormat(ordered=False), ProtobufFormat()):
+            # The same as the serial marshall with any number of partitions
+            for partitions in (1, 2, 3, 10):
+                self.assertEqual(
+                    b"".join(f.marshall_iter(self.registry)),
+                    marshall_parallel(f, self.registry, self.executor,
+                                      partitions))
+
+        # The caches of the processes are used again after the updates
+        c = self.registry.get("counter_2")
+        c.inc({'c_sample': "3"})
+        c.const_labels = {'app': "other_app"}
+        self.assertEqual(
+            b"".join(TextFormat().marshall_iter(self.registry)),
+            marshall_parallel(TextFormat(), self.registry, self.executor, 2))
+
+    def test_wrong_format(self):
+        with self.assertRaises(TypeError) as context:
+            marshall_parallel(ProtobufTextFormat(), self.registry,
+                              self.executor)
+
+        self.assertEqual("Not a valid format for a parallel marshall",
+                         str(context.exception))
+
+    def tearDown(self):
+        self.executor.shutdown()
@@ -65,28 +65,53 @@ class TestMetricDict(unittest.TestCase):
 
         self.assertEqual(1, len(metrics))
 
-    def test_access_by_str(self):
+    def test_access_by_key(self):
         label = {'b': 2, 'c': 3, 'a': 1}
-        access_key = '{"a": 1, "b": 2, "c": 3}'
-        bad_access_key = '{"b": 2, "c": 3, "a": 1}'
+        access_key = (('a', "1"), ('b', "2"), ('c', "3"))
+        bad_access_key = (('b', "2"), ('c', "3"), ('a', "1"))
         value = 100
 
         metrics = MetricDict()
         metrics[label] = 100
 
-        # Wrong string
+        # Strings are not keys
         with self.assertRaises(TypeError) as context:
-            metrics['dasdasd']
+            metrics['{"a": 1, "b": 2, "c": 3}']
         self.assertEqual('Only accepts dicts as keys', str(context.exception))
 
-        # Access ok with string
+        # Access ok with the key
         self.assertEqual(value, metrics[access_key])
+        self.assertEqual([access_key], list(metrics))
 
         # Access ok but wrong key by order
         with self.assertRaises(KeyError) as context:
             metrics[bad_access_key]
-        self.assertEqual("'{0}'".format(bad_access_key),
-                         str(context.exception))
+        self.assertEqual(str(bad_access_key), str(context.exception))
+
+    def test_value_types(self):
+        metrics = MetricDict()
+
+        # Equal in python but not as label values
+        for i, value in enumerate((1, 1.0, True, "1", "1.0", "True")):
+            metrics[{'a': value}] = i
+
+        self.assertEqual(3, len(metrics))
+        self.assertEqual(3, metrics[{'a': 1}])
+        self.assertEqual(4, metrics[{'a': 1.0}])
+        self.assertEqual(5, metrics[{'a': True}])
+        self.assertEqual([(('a', "1"),), (('a', "1.0"),), (('a', "True"),)],
+                         sorted(metrics))
+
+    def test_interned_keys(self):
+        metrics = MetricDict()
+
+        metrics[{'a': 1, 'b': 2}] = 1
+        metrics[{'b': 2, 'a': 1}] = 2
+
+        keys = [metrics.__keytransform__({'a': 1, 'b': 2}),
+                metrics.__keytransform__({'b': 2, 'a': 1})]
+        self.assertIs(keys[0], keys[1])
+        self.assertIs(keys[0], next(iter(metrics)))
 
     def test_empty_key(self):
         metrics = MetricDict()
@@ -137,3 +162,12 @@ class TestMetricDict(unittest.TestCase):
         self.assertEqual(5000, metrics[{'d': 4, 'e': 5, 'f': 6}])
         self.assertEqual(8000, metrics[{'d': 41, 'f': 61, 'e': 51}])
 
+    def test_add(self):
+        metrics = MetricDict()
+        key = {'a': 1}
+
+        for i in range(100):
+            metrics.add(key, i)
+
+        self.assertEqual(sum(range(100)), metrics[key])
+        self.assertEqual(1, len(metrics))
@@ -0,0 +1,228 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from prometheus.collectors import Counter, Gauge, Summary
+from prometheus.formats import TextFormat
+from prometheus import multiprocess
+from prometheus.multiprocess import (MmapedDict, MultiProcessCounter,
+                                     MultiProcessGauge, MultiProcessSummary,
+                                     MultiProcessRegistry)
+
+
+class TestMmapedDict(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "counter_1.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write_read(self):
+        d = MmapedDict(self.filename)
+        d.write_value("a", 1)
+        d.write_value("bb", 2.5)
+        d.write_value("a", 3)
+
+        self.assertEqual(3, d.read_value("a"))
+        self.assertEqual(2.5, d.read_value("bb"))
+        self.assertEqual(0, d.read_value("c"))
+        self.assertEqual([("a", 3), ("bb", 2.5)], d.items())
+
+        # Other readers see the values
+        r = MmapedDict(self.filename, read_only=True)
+        self.assertEqual([("a", 3), ("bb", 2.5)], r.items())
+        r.close()
+        d.close()
+
+        # Reopen
+        d = MmapedDict(self.filename)
+        self.assertEqual(3, d.read_value("a"))
+        d.write_value("c", 4)
+        self.assertEqual([("a", 3), ("bb", 2.5), ("c", 4)], d.items())
+        d.close()
+
+    def test_grow(self):
+        d = MmapedDict(self.filename)
+        initial = d.capacity
+        keys = ["key_{0}".format(i) * 100 for i in range(10000)]
+
+        for k, v in enumerate(keys):
+            d.write_value(v, k)
+
+        self.assertTrue(d.capacity > initial)
+        d.close()
+
+        d = MmapedDict(self.filename, read_only=True)
+        self.assertEqual(list(zip(keys, range(len(keys)))), d.items())
+        d.close()
+
+
+def write_metrics(value):
+    """ Writes the metrics from another process"""
+
+    counter = MultiProcessCounter("requests_total", "Total requests.",
+                                  {'app': "my_app"})
+    counter.add({'path': "/"}, value)
+    counter.labels({'path': "/p"}).inc()
+
+    for mode in multiprocess.GAUGE_MODES:
+        gauge = MultiProcessGauge("workers_" + mode, "Workers.",
+                                  multiprocess_mode=mode)
+        gauge.set(None, value)
+
+    summary = MultiProcessSummary("latency", "Latency.")
+    summary.add({'path': "/"}, value)
+    summary.labels({'path': "/"}).observe(value)
+
+
+def update_metrics(counter, gauge, summary):
+    """ Updates the metrics created in the parent process"""
+
+    counter.inc(None)
+    gauge.inc(None)
+    summary.labels(None).observe(2)
+
+
+class TestMultiProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.environ[multiprocess.DIRECTORY_ENV] = self.path
+
+    def tearDown(self):
+        os.environ.pop(multiprocess.DIRECTORY_ENV, None)
+        shutil.rmtree(self.path)
+
+    def _write_from_processes(self, values):
+        pids = []
+        for v in values:
+            p = multiprocessing.Process(target=write_metrics, args=(v,))
+            p.start()
+            p.join()
+            pids.append(str(p.pid))
+        return pids
+
+    def test_not_directory(self):
+        del os.environ[multiprocess.DIRECTORY_ENV]
+
+        with self.assertRaises(ValueError) as context:
+            MultiProcessCounter("c", "C.").inc(None)
+
+        self.assertEqual(
+            "Multiprocess directory not set in PROMETHEUS_MULTIPROC_DIR",
+            str(context.exception))
+
+    def test_wrong_gauge_mode(self):
+        with self.assertRaises(ValueError) as context:
+            MultiProcessGauge("g", "G.", multiprocess_mode="avg")
+
+        self.assertEqual("Not a valid multiprocess mode",
+                         str(context.exception))
+
+    def test_local_values(self):
+        c = MultiProcessCounter("c", "C.")
+        c.inc({'a': "b"})
+        c.labels({'a': "b"}).add(2)
+        self.assertEqual(3, c.get({'a': "b"}))
+
+        s = MultiProcessSummary("s", "S.")
+        s.add(None, 3)
+        s.labels(None).add(4.5)
+        self.assertEqual({'sum': 7.5, 'count': 2}, s.get(None))
+
+        s.add_many(None, [1, 2])
+        s.labels(None).observe_many([0.5])
+        self.assertEqual({'sum': 11, 'count': 5}, s.get(None))
+
+    def test_merge(self):
+        pids = self._write_from_processes((2, 5))
+        registry = MultiProcessRegistry()
+
+        merged = {c.name: c for c in registry.get_all()}
+
+        counter = merged['requests_total']
+        self.assertTrue(isinstance(counter, Counter))
+        self.assertEqual("Total requests.", counter.help_text)
+        self.assertEqual(7, counter.get({'app': "my_app", 'path': "/"}))
+        self.assertEqual(2, counter.get({'app': "my_app", 'path': "/p"}))
+
+        self.assertTrue(isinstance(merged['workers_sum'], Gauge))
+        self.assertEqual(7, merged['workers_sum'].get(None))
+        self.assertEqual(5, merged['workers_max'].get(None))
+        self.assertEqual(2, merged['workers_min'].get(None))
+        self.assertEqual(2, merged['workers_all'].get({'pid': pids[0]}))
+        self.assertEqual(5, merged['workers_all'].get({'pid': pids[1]}))
+
+        summary = merged['latency']
+        self.assertTrue(isinstance(summary, Summary))
+        self.assertEqual({'sum': 14.0, 'count': 4},
+                         summary.get({'path': "/"}))
+
+    def test_fork(self):
+        counter = MultiProcessCounter("requests_total", "Total requests.")
+        gauge = MultiProcessGauge("in_progress", "In progress.",
+                                  multiprocess_mode=multiprocess.GAUGE_SUM)
+        summary = MultiProcessSummary("latency", "Latency.")
+        counter.inc(None)
+        counter.labels(None).inc()
+        gauge.add(None, 2)
+        summary.add(None, 1)
+
+        # The forked process doesn't write the values of the parent again
+        p = multiprocessing.get_context("fork").Process(
+            target=update_metrics, args=(counter, gauge, summary))
+        p.start()
+        p.join()
+
+        merged = {c.name: c for c in MultiProcessRegistry().get_all()}
+        self.assertEqual(3, merged['requests_total'].get(None))
+        self.assertEqual(3, merged['in_progress'].get(None))
+        self.assertEqual({'sum': 3.0, 'count': 2},
+                         merged['latency'].get(None))
+
+        # And the parent keeps its own values
+        self.assertEqual(2, counter.get(None))
+
+    def test_mark_process_dead(self):
+        pids = self._write_from_processes((2, 5))
+        multiprocess.mark_process_dead(pids[0])
+
+        merged = {c.name: c for c in MultiProcessRegistry().get_all()}
+
+        # Counters are kept
+        self.assertEqual(7, merged['requests_total'].get(
+            {'app': "my_app", 'path': "/"}))
+        self.assertEqual(1, len(merged['workers_all'].values))
+        self.assertEqual(5, merged['workers_all'].get({'pid': pids[1]}))
+
+    def test_text_format(self):
+        self._write_from_processes((2, 5))
+        registry = MultiProcessRegistry()
+
+        valid_result = """# HELP latency Latency.
+# TYPE latency summary
+latency_count{path="/"} 4
+latency_sum{path="/"} 14.0
+# HELP requests_total Total requests.
+# TYPE requests_total counter
+requests_total{app="my_app",path="/"} 7.0
+requests_total{app="my_app",path="/p"} 2.0
+"""
+
+        result = TextFormat().marshall(registry)
+        self.assertTrue(result.startswith(valid_result))
+
+    def test_generation(self):
+        # The values of the other processes can always change
+        self.assertIsNone(MultiProcessRegistry(self.path).generation())
+
+    def test_register(self):
+        with self.assertRaises(TypeError) as context:
+            MultiProcessRegistry().register(MultiProcessCounter("c", "C."))
+
+        self.assertEqual("Collectors are read from the multiprocess files",
+                         str(context.exception))
@@ -91,3 +91,65 @@ class TestNegotiator(unittest.TestCase):
 
         for i in headers:
             self.assertEqual(TextFormat, Negotiator.negotiate(i))
+
+    def test_encoding(self):
+        headers = (
+            ({'accept-encoding': "gzip, deflate, sdch"}, "gzip"),
+            ({'Accept-Encoding': "deflate, gzip"}, "gzip"),
+            ({'ACCEPT-ENCODING': "GZIP;q=0.5"}, "gzip"),
+            ({'accept-encoding': "gzip;q=0, deflate"}, "deflate"),
+            ({'accept-encoding': "*"}, "gzip"),
+            ({'accept-encoding': "gzip;q=0, *"}, "deflate"),
+            ({'accept-encoding': "identity"}, None),
+            ({'accept-encoding': "br, sdch"}, None),
+            ({'accept-encoding': ""}, None),
+            ({'accept': "text/plain; version=0.0.4"}, None),
+        )
+
+        for i, encoding in headers:
+            self.assertEqual(encoding, Negotiator.negotiate_encoding(i))
+
+    def test_quality(self):
+        protobuf = ("application/vnd.google.protobuf;"
+                    "proto=io.prometheus.client.MetricFamily;"
+                    "encoding=delimited")
+        headers = (
+            # The header of the Prometheus server
+            ({'Accept': protobuf + ";q=0.7,text/plain;version=0.0.4;q=0.3,"
+                                   "*/*;q=0.1"}, ProtobufFormat),
+            ({'accept': "text/plain;q=0.8, " + protobuf}, ProtobufFormat),
+            ({'accept': protobuf + ";q=0.5, text/plain"}, TextFormat),
+            ({'accept': "application/json, " + protobuf}, ProtobufFormat),
+            ({'accept': protobuf + ";q=0, application/json"}, TextFormat),
+            ({'accept': protobuf + ", text/plain"}, ProtobufFormat),
+            ({'accept': "TEXT/PLAIN;Q=0.2, " + protobuf + ";q=0.1"},
+             TextFormat),
+        )
+
+        for i, formatter in headers:
+            self.assertEqual(formatter, Negotiator.negotiate(i))
+
+    def test_negotiate_response(self):
+        headers = {
+            'Accept': "text/plain; version=0.0.4",
+            'Accept-Encoding': "gzip",
+        }
+
+        self.assertEqual((TextFormat, "gzip"),
+                         Negotiator.negotiate_response(headers))
+        self.assertEqual((TextFormat, None),
+                         Negotiator.negotiate_response({}))
+
+    def test_cache(self):
+        class OtherNegotiator(Negotiator):
+            FALLBACK = ProtobufFormat
+
+        header = {'accept': "application/json;q=0.9"}
+        hits = Negotiator._negotiate_accept.cache_info().hits
+        for i in range(3):
+            self.assertEqual(TextFormat, Negotiator.negotiate(header))
+        self.assertEqual(hits + 2,
+                         Negotiator._negotiate_accept.cache_info().hits)
+
+        # The negotiators don't share the results
+        self.assertEqual(ProtobufFormat, OtherNegotiator.negotiate(header))
@@ -25,12 +25,25 @@ class PusherTestHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         pass
 
+    def read_body(self):
+        if self.headers['Transfer-Encoding'] != "chunked":
+            length = int(self.headers['Content-Length'])
+            return self.rfile.read(length)
+
+        data = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            data += self.rfile.read(size)
+            # Chunk end
+            self.rfile.readline()
+            if not size:
+                return data
+
     def do_POST(self):
         self.send_response(200)
         self.end_headers()
 
-        length = int(self.headers['Content-Length'])
-        data = self.rfile.read(length)
+        data = self.read_body()
 
         # Set the request data to access from the test
         self.test_instance.request = {
@@ -45,8 +58,7 @@ class PusherTestHandler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
 
-        length = int(self.headers['Content-Length'])
-        data = self.rfile.read(length)
+        data = self.read_body()
 
         # Set the request data to access from the test
         self.test_instance.request = {
@@ -62,8 +74,7 @@ class PusherTestHandler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
 
-        length = int(self.headers['Content-Length'])
-        data = self.rfile.read(length)
+        data = self.read_body()
 
         # Set the request data to access from the test
         self.test_instance.request = {
@@ -166,6 +177,29 @@ class TestPusher(unittest.TestCase):
         self.assertEqual("PUT", self.request['method'])
         self.assertEqual(valid_result, self.request['body'])
 
+    def test_push_chunked(self):
+        job_name = "my-job"
+        p = Pusher(job_name, TEST_URL, chunked=True)
+        registry = Registry()
+        counter = Counter("counter_test", "A counter.", {'type': "counter"})
+        registry.register(counter)
+
+        counter_data = (
+            ({'c_sample': '1', 'c_subsample': 'b'}, 400),
+        )
+
+        [counter.set(c[0], c[1]) for c in counter_data]
+        valid_result = b'[\n\x0ccounter_test\x12\nA counter.\x18\x00"=\n\r\n\x08c_sample\x12\x011\n\x10\n\x0bc_subsample\x12\x01b\n\x0f\n\x04type\x12\x07counter\x1a\t\t\x00\x00\x00\x00\x00\x00y@'
+
+        # Push to the pushgateway
+        p.replace(registry)
+
+        # Check the object that setted the server thread
+        self.assertEqual("PUT", self.request['method'])
+        self.assertEqual("chunked",
+                         self.request['headers']['Transfer-Encoding'])
+        self.assertEqual(valid_result, self.request['body'])
+
     def test_push_delete(self):
         job_name = "my-job"
         p = Pusher(job_name, TEST_URL)
@@ -1,6 +1,7 @@
 import unittest
 
 from prometheus.collectors import Collector, Counter, Gauge, Summary
+from prometheus.formats import TextFormat, ProtobufFormat
 from prometheus.registry import Registry
 
 
@@ -90,3 +91,86 @@ class TestRegistry(unittest.TestCase):
 
         self.assertTrue(isinstance(result, list))
         self.assertEqual(q, len(result))
+
+    def test_get_all_ordered(self):
+        r = Registry()
+        for name in ("b", "c", "a"):
+            r.register(Collector(name, name.upper()))
+
+        self.assertEqual(["b", "c", "a"], [c.name for c in r.get_all()])
+        self.assertEqual(["a", "b", "c"],
+                         [c.name for c in r.get_all(ordered=True)])
+
+        r.deregister("b")
+        r.register(Collector("ab", "AB"))
+        self.assertEqual(["a", "ab", "c"],
+                         [c.name for c in r.get_all(ordered=True)])
+
+    def test_generation(self):
+        r = Registry()
+        self.assertEqual(r.generation(), r.generation())
+
+        c = Counter("a", "A.")
+        r.register(c)
+        generation = r.generation()
+        self.assertNotEqual(Registry().generation(), generation)
+        self.assertEqual(generation, r.generation())
+
+        c.inc(None)
+        self.assertNotEqual(generation, r.generation())
+        generation = r.generation()
+
+        r.register(Counter("b", "B."))
+        self.assertNotEqual(generation, r.generation())
+        generation = r.generation()
+
+        r.deregister("b")
+        self.assertNotEqual(generation, r.generation())
+
+    def test_snapshot(self):
+        r = Registry()
+        counter = Counter("counter_test", "A counter.", {'app': "my_app"})
+        summary = Summary("summary_test", "A summary.")
+        r.register(counter)
+        r.register(summary)
+        for i in range(10):
+            counter.set({'c_sample': str(i)}, i)
+            summary.add({'s_sample': str(i % 3)}, i)
+
+        snapshot = r.snapshot()
+        self.assertEqual(["counter_test", "summary_test"],
+                         [i.name for i in snapshot.get_all(ordered=True)])
+        self.assertEqual(r.generation(), snapshot.generation())
+
+        # The formats marshall it like the registry
+        for f in (TextFormat(), ProtobufFormat()):
+            self.assertEqual(f.marshall(r), f.marshall(snapshot))
+
+        # The updates after the snapshot aren't in it
+        result = TextFormat().marshall(snapshot)
+        counter.inc({'c_sample': "1"})
+        summary.add({'s_sample': "4"}, 1)
+        self.assertEqual(result, TextFormat().marshall(snapshot))
+        self.assertNotEqual(result, TextFormat().marshall(r.snapshot()))
+        self.assertEqual(TextFormat().marshall(r),
+                         TextFormat().marshall(r.snapshot()))
+
+    def test_lazy_snapshot(self):
+        r = Registry()
+        counters = [Counter("counter_{0}".format(i), "A counter.")
+                    for i in range(3)]
+        for c in counters:
+            c.inc(None)
+            r.register(c)
+
+        # The snapshot of each collector is taken when it's marshalled
+        chunks = TextFormat().marshall_iter(r.lazy_snapshot())
+        first = next(chunks)
+        counters[0].inc(None)
+        counters[1].inc(None)
+        result = first + b"".join(chunks)
+
+        self.assertIn(b"counter_0 1", result)
+        self.assertIn(b"counter_1 2", result)
+        for f in (TextFormat(), ProtobufFormat()):
+            self.assertEqual(f.marshall(r), f.marshall(r.lazy_snapshot()))
@@ -1,5 +1,13 @@
+import array
 from collections import OrderedDict
+import time
 import unittest
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from prometheus import utils
 
@@ -38,4 +46,93 @@ class TestUnifyLabels(unittest.TestCase):
 
         valid_result = OrderedDict([('a', 'b'), ('c', 'd'), ('e', 'f'), ('g', 'h')])
 
-        self.assertEqual(valid_result, result)
\ No newline at end of file
+        self.assertEqual(valid_result, result)
+
+
+class TestNumbers(unittest.TestCase):
+
+    def test_is_number(self):
+        for i in (1, 1.5, -3, 0):
+            self.assertTrue(utils.is_number(i))
+
+        for i in ("3", (1, 2), {'1': 2}, True, None):
+            self.assertFalse(utils.is_number(i))
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_is_number_numpy(self):
+        for i in (numpy.float64(1.5), numpy.int64(3), numpy.float32(2)):
+            self.assertTrue(utils.is_number(i))
+
+        self.assertFalse(utils.is_number(numpy.bool_(True)))
+
+    def test_to_numbers(self):
+        values = [1, 2.5, 3]
+
+        self.assertEqual(values, utils.to_numbers(values))
+        self.assertEqual(values, utils.to_numbers(tuple(values)))
+        self.assertEqual(values, utils.to_numbers(i for i in values))
+        self.assertEqual(values, utils.to_numbers(array.array('d', values)))
+
+    def test_to_numbers_wrong(self):
+        for values in ([1, "2"], [True], array.array('u', "ab")):
+            with self.assertRaises(TypeError) as context:
+                utils.to_numbers(values)
+            self.assertEqual("Only numbers are valid", str(context.exception))
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_to_numbers_numpy(self):
+        values = [1, 2.5, 3]
+
+        result = utils.to_numbers(numpy.array(values))
+        self.assertEqual(values, result)
+        self.assertEqual([float], list(set(type(i) for i in result)))
+
+        self.assertEqual([1, 2, 3, 4],
+                         utils.to_numbers(numpy.array([[1, 2], [3, 4]])))
+
+        with self.assertRaises(TypeError) as context:
+            utils.to_numbers(numpy.array(["a", "b"]))
+        self.assertEqual("Only numbers are valid", str(context.exception))
+
+
+
+class TestTimestamp(unittest.TestCase):
+
+    def test_get_timestamp(self):
+        before = int(time.time() * 1000)
+        result = utils.get_timestamp()
+
+        self.assertTrue(isinstance(result, int))
+        self.assertLess(abs(result - before), 1000)
+
+    def test_get_timestamp_not_decreasing(self):
+        timestamps = [utils.get_timestamp() for i in range(1000)]
+
+        self.assertEqual(sorted(timestamps), timestamps)
+
+    def test_get_timestamp_clock_changes(self):
+        wall_clock = time.time()
+        monotonic_clock = time.monotonic()
+        clocks = {'time': wall_clock, 'monotonic': monotonic_clock}
+
+        def advance(wall, monotonic):
+            clocks['time'] += wall
+            clocks['monotonic'] += monotonic
+
+        with mock.patch.object(utils.time, 'time', lambda: clocks['time']), \
+                mock.patch.object(utils.time, 'monotonic',
+                                  lambda: clocks['monotonic']):
+            interval = utils.TIMESTAMP_ANCHOR_INTERVAL
+            start = utils.get_timestamp()
+
+            # A suspend (or a step forward) is followed after the interval
+            advance(3600, interval)
+            self.assertGreaterEqual(utils.get_timestamp(),
+                                    start + 3600 * 1000)
+
+            # A step back doesn't make the timestamps decrease
+            last = utils.get_timestamp()
+            advance(-3600, interval)
+            self.assertEqual(last, utils.get_timestamp())
+            advance(3600 + interval, interval)
+            self.assertLess(last, utils.get_timestamp())
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import unittest
+
+from google.protobuf.internal import encoder
+
+from prometheus import wire
+from prometheus.pb2 import metrics_pb2
+
+
+class TestWire(unittest.TestCase):
+
+    def test_varint(self):
+        for i in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 63 - 1):
+            self.assertEqual(encoder._VarintBytes(i), wire.varint(i))
+
+        # Negative int64 (the key of timestamp_ms is the first byte)
+        for i in (-1, -300, -2 ** 63):
+            metric = metrics_pb2.Metric(timestamp_ms=i)
+            self.assertEqual(metric.SerializeToString()[1:], wire.varint(i))
+
+    def test_encode_labels(self):
+        labels = OrderedDict((('country', "sp"), ('device', 3),
+                              ('name', "Iñigo")))
+        metric = metrics_pb2.Metric(label=[
+            metrics_pb2.LabelPair(name=k, value=str(v))
+            for k, v in labels.items()])
+
+        self.assertEqual(metric.SerializeToString(),
+                         wire.encode_labels(labels))
+        self.assertEqual(b"", wire.encode_labels(None))
+        self.assertEqual(b"", wire.encode_labels({}))
+
+    def test_encode_counter(self):
+        labels = OrderedDict((('a', "b"),))
+        pb2_labels = [metrics_pb2.LabelPair(name="a", value="b")]
+
+        for value in (0, 1, 3.5, -2, float("inf")):
+            metric = metrics_pb2.Metric(
+                label=pb2_labels, counter=metrics_pb2.Counter(value=value))
+            result = wire.encode_metric(wire.encode_labels(labels),
+                                        wire.METRIC_COUNTER,
+                                        wire.encode_value(value))
+
+            self.assertEqual(metric.SerializeToString(), result)
+
+    def test_encode_gauge_timestamp(self):
+        metric = metrics_pb2.Metric(gauge=metrics_pb2.Gauge(value=12.5),
+                                    timestamp_ms=1424009024000)
+        result = wire.encode_metric(b"", wire.METRIC_GAUGE,
+                                    wire.encode_value(12.5), 1424009024000)
+
+        self.assertEqual(metric.SerializeToString(), result)
+
+    def test_encode_summary(self):
+        quantiles = [(0.5, 4.5), (0.9, 10), (0.99, 15.25)]
+        summary = metrics_pb2.Summary(
+            sample_count=300, sample_sum=1200.5,
+            quantile=[metrics_pb2.Quantile(quantile=q, value=v)
+                      for q, v in quantiles])
+
+        self.assertEqual(summary.SerializeToString(),
+                         wire.encode_summary(300, 1200.5, quantiles))
+        self.assertEqual(metrics_pb2.Summary(
+            sample_count=0, sample_sum=0).SerializeToString(),
+            wire.encode_summary(0, 0, []))
+
+    def test_encode_histogram_timestamp(self):
+        buckets = [(0.1, 3), (1, 200), (10, 1000)]
+        histogram = metrics_pb2.Histogram(
+            sample_count=1000, sample_sum=50.5,
+            bucket=[metrics_pb2.Bucket(upper_bound=b, cumulative_count=c)
+                    for b, c in buckets])
+
+        # The histogram field is after the timestamp
+        metric = metrics_pb2.Metric(histogram=histogram,
+                                    timestamp_ms=1424009024000)
+        result = wire.encode_metric(
+            b"", wire.METRIC_HISTOGRAM,
+            wire.encode_histogram(1000, 50.5, buckets), 1424009024000)
+
+        self.assertEqual(metric.SerializeToString(), result)
+
+    def test_encode_metric_family(self):
+        metrics = [
+            metrics_pb2.Metric(
+                label=[metrics_pb2.LabelPair(name="a", value=str(i))],
+                counter=metrics_pb2.Counter(value=i))
+            for i in range(3)]
+        family = metrics_pb2.MetricFamily(name="counter_test",
+                                          help="A counter.",
+                                          type=metrics_pb2.COUNTER,
+                                          metric=metrics)
+
+        result = wire.encode_metric_family(
+            "counter_test", "A counter.", metrics_pb2.COUNTER,
+            [i.SerializeToString() for i in metrics])
+
+        self.assertEqual(family.SerializeToString(), result)
+
+        family = metrics_pb2.MetricFamily(name="gauge_test",
+                                          type=metrics_pb2.GAUGE)
+        self.assertEqual(family.SerializeToString(),
+                         wire.encode_metric_family("gauge_test", None,
+                                                   metrics_pb2.GAUGE, []))
@@ -1,5 +1,14 @@
+import array
 import collections
-from datetime import datetime, timezone
+import numbers
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, only used to read its arrays faster
+    numpy = None
 
 
 def unify_labels(labels, const_labels, ordered=False):
@@ -19,9 +28,64 @@ def unify_labels(labels, const_labels, ordered=False):
     return result
 
 
+# The wall clock is read every few seconds and advanced with the monotonic
+# clock between the reads, so the timestamps are cheap and follow the
+# adjustments of the system clock (NTP steps, suspends) without going
+# backwards
+TIMESTAMP_ANCHOR_INTERVAL = 5
+
+# Wall and monotonic clocks of the last read and the last timestamp
+_timestamp_anchor = (time.time(), time.monotonic())
+_last_timestamp = 0
+_timestamp_mutex = threading.Lock()
+
+
 def get_timestamp():
     """ Timestamp is the number of milliseconds since the epoch
         (1970-01-01 00:00 UTC) excluding leap seconds.
     """
-    return int(datetime.utcnow().replace(
-        tzinfo=timezone.utc).timestamp() * 1000)
+    global _timestamp_anchor, _last_timestamp
+
+    with _timestamp_mutex:
+        wall_clock, monotonic_clock = _timestamp_anchor
+        now = time.monotonic()
+        if now - monotonic_clock >= TIMESTAMP_ANCHOR_INTERVAL:
+            wall_clock, monotonic_clock = _timestamp_anchor = (time.time(),
+                                                               now)
+
+        # If the wall clock went back the timestamp waits for it
+        timestamp = max(int((wall_clock + now - monotonic_clock) * 1000),
+                        _last_timestamp)
+        _last_timestamp = timestamp
+
+        return timestamp
+
+
+def is_number(value):
+    """ Returns True if the value is a number (int, float or any other real
+        number like numpy.float64), booleans are not numbers
+    """
+    return type(value) in (float, int) or (
+        isinstance(value, numbers.Real) and not isinstance(value, bool))
+
+
+def to_numbers(values):
+    """ Returns a list with the values (a list, array.array, NumPy array or
+        any other iterable), exception (TypeError) if any isn't a number
+    """
+
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        if values.dtype.kind not in "iuf":
+            raise TypeError("Only numbers are valid")
+        return values.ravel().tolist()
+
+    if isinstance(values, array.array) and values.typecode != "u":
+        return values.tolist()
+
+    values = list(values)
+    for v in values:
+        if not is_number(v):
+            raise TypeError("Only numbers are valid")
+
+    return values
+
@@ -0,0 +1,165 @@
+import struct
+
+# Writer of the protocol buffers wire format for the messages of
+# io.prometheus.client (metrics.proto). The messages are encoded directly to
+# bytes without building the metrics_pb2 objects, the result is the same as
+# SerializeToString: the fields are written in field number order and the
+# optional fields are always present (like the formats set them)
+# https://developers.google.com/protocol-buffers/docs/encoding
+
+# Wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+
+_pack_double = struct.Struct("<d").pack
+
+
+def varint(value):
+    """ Returns the bytes of an integer as a varint, negative integers
+        (int64) are encoded in 10 bytes as two's complement
+    """
+
+    if value < 0:
+        value += 1 << 64
+
+    result = bytearray()
+    while value > 0x7f:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append(value)
+
+    return bytes(result)
+
+
+def tag(field_number, wire_type):
+    """Returns the bytes of the key of a field"""
+    return varint((field_number << 3) | wire_type)
+
+
+# Keys of the fields
+_LABEL_PAIR_NAME = tag(1, LENGTH_DELIMITED)
+_LABEL_PAIR_VALUE = tag(2, LENGTH_DELIMITED)
+_VALUE = tag(1, FIXED64)
+_QUANTILE_QUANTILE = tag(1, FIXED64)
+_QUANTILE_VALUE = tag(2, FIXED64)
+_SAMPLE_COUNT = tag(1, VARINT)
+_SAMPLE_SUM = tag(2, FIXED64)
+_QUANTILE = tag(3, LENGTH_DELIMITED)
+_BUCKET_CUMULATIVE_COUNT = tag(1, VARINT)
+_BUCKET_UPPER_BOUND = tag(2, FIXED64)
+_BUCKET = tag(3, LENGTH_DELIMITED)
+_METRIC_LABEL = tag(1, LENGTH_DELIMITED)
+_METRIC_TIMESTAMP_MS = tag(6, VARINT)
+_FAMILY_NAME = tag(1, LENGTH_DELIMITED)
+_FAMILY_HELP = tag(2, LENGTH_DELIMITED)
+_FAMILY_TYPE = tag(3, VARINT)
+_FAMILY_METRIC = tag(4, LENGTH_DELIMITED)
+
+# Fields of the value in a Metric
+METRIC_GAUGE = 2
+METRIC_COUNTER = 3
+METRIC_SUMMARY = 4
+METRIC_UNTYPED = 5
+METRIC_HISTOGRAM = 7
+
+_METRIC_TIMESTAMP_FIELD = 6
+_METRIC_FIELDS = {i: tag(i, LENGTH_DELIMITED) for i in (
+    METRIC_GAUGE, METRIC_COUNTER, METRIC_SUMMARY, METRIC_UNTYPED,
+    METRIC_HISTOGRAM)}
+
+
+def _length_delimited(key, data):
+    return key + varint(len(data)) + data
+
+
+def encode_labels(labels):
+    """ Returns the label fields of a Metric (a LabelPair for each label)
+        from the labels in order, a dict or None
+    """
+
+    if not labels:
+        return b""
+
+    result = []
+    for k, v in labels.items():
+        pair = _length_delimited(_LABEL_PAIR_NAME, k.encode("utf8")) + \
+            _length_delimited(_LABEL_PAIR_VALUE, str(v).encode("utf8"))
+        result.append(_length_delimited(_METRIC_LABEL, pair))
+
+    return b"".join(result)
+
+
+def encode_value(value):
+    """Returns a Counter, Gauge or Untyped message"""
+    return _VALUE + _pack_double(value)
+
+
+def encode_summary(sample_count, sample_sum, quantiles):
+    """ Returns a Summary message, quantiles are tuples of quantile and
+        value
+    """
+
+    result = [_SAMPLE_COUNT, varint(sample_count),
+              _SAMPLE_SUM, _pack_double(sample_sum)]
+
+    for quantile, value in quantiles:
+        result.append(_length_delimited(
+            _QUANTILE,
+            _QUANTILE_QUANTILE + _pack_double(quantile) +
+            _QUANTILE_VALUE + _pack_double(value)))
+
+    return b"".join(result)
+
+
+def encode_histogram(sample_count, sample_sum, buckets):
+    """ Returns a Histogram message, buckets are tuples of upper bound and
+        cumulative count
+    """
+
+    result = [_SAMPLE_COUNT, varint(sample_count),
+              _SAMPLE_SUM, _pack_double(sample_sum)]
+
+    for upper_bound, cumulative_count in buckets:
+        result.append(_length_delimited(
+            _BUCKET,
+            _BUCKET_CUMULATIVE_COUNT + varint(cumulative_count) +
+            _BUCKET_UPPER_BOUND + _pack_double(upper_bound)))
+
+    return b"".join(result)
+
+
+def encode_metric(labels, field, message, timestamp=None):
+    """ Returns a Metric message from the encoded labels (encode_labels), the
+        field of the value (METRIC_*) and its encoded message
+    """
+
+    value = _length_delimited(_METRIC_FIELDS[field], message)
+    if timestamp is None:
+        return labels + value
+
+    timestamp = _METRIC_TIMESTAMP_MS + varint(timestamp)
+    if field < _METRIC_TIMESTAMP_FIELD:
+        return labels + value + timestamp
+    return labels + timestamp + value
+
+
+def encode_metric_family(name, help_text, metric_type, metrics):
+    """ Returns a MetricFamily message, metrics is a list of encoded Metric
+        messages
+    """
+
+    result = [_length_delimited(_FAMILY_NAME, name.encode("utf8"))]
+    if help_text is not None:
+        result.append(_length_delimited(_FAMILY_HELP,
+                                        help_text.encode("utf8")))
+    result.append(_FAMILY_TYPE)
+    result.append(varint(metric_type))
+
+    for i in metrics:
+        result.append(_FAMILY_METRIC)
+        result.append(varint(len(i)))
+        result.append(i)
+
+    return b"".join(result)
+